@@ -0,0 +1,122 @@
+"""批量张量数据增强
+
+在 DataLoader 整理出 uint8 批次并搬到训练设备后，用向量化张量运算一次性完成
+随机裁剪、水平翻转、旋转和颜色抖动，替代 worker 中逐张执行的 PIL 变换。
+增强参数与 main() 中的 train_transform 保持一致，以便准确率可比。
+"""
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def _grayscale(images):
+    """与 torchvision rgb_to_grayscale 相同的加权，返回 (N, 1, H, W)"""
+    r, g, b = images.unbind(dim=1)
+    return (0.2989 * r + 0.587 * g + 0.114 * b).unsqueeze(1)
+
+
+class BatchAugment(nn.Module):
+    """
+    对 uint8 批次 (N, 3, H, W) 做批量增强并归一化
+
+    几何变换（裁剪 + 翻转 + 旋转）合并成一次 grid_sample，采用最近邻采样，
+    与 RandomCrop / RandomRotation 的默认行为一致：裁剪为整像素平移，
+    旋转后超出裁剪窗口的区域填 0。颜色抖动的三个因子逐样本独立采样，
+    执行顺序每个批次随机一次（torchvision 为每张图随机一次）。
+
+    Args:
+        crop_size: 输出尺寸
+        flip_p: 水平翻转概率
+        degrees: 旋转角度范围 [-degrees, degrees]
+        brightness / contrast / saturation: 颜色抖动强度
+        augment: False 时只做类型转换和归一化（验证集）
+    """
+
+    def __init__(self, crop_size=224, flip_p=0.5, degrees=15,
+                 brightness=0.2, contrast=0.2, saturation=0.2,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, augment=True):
+        super().__init__()
+        self.crop_size = crop_size
+        self.flip_p = flip_p
+        self.degrees = degrees
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.augment = augment
+        self.register_buffer('mean', torch.tensor(mean).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer('std', torch.tensor(std).view(1, 3, 1, 1), persistent=False)
+
+    def _geometric(self, images):
+        n, _, h, w = images.shape
+        size = self.crop_size
+        device = images.device
+
+        # 每个样本的裁剪偏移、翻转和旋转角
+        oy = torch.randint(0, h - size + 1, (n, 1, 1), device=device).float()
+        ox = torch.randint(0, w - size + 1, (n, 1, 1), device=device).float()
+        flip = (torch.rand(n, 1, 1, device=device) < self.flip_p)
+        angle = (torch.rand(n, 1, 1, device=device) * 2 - 1) * math.radians(self.degrees)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+
+        # 输出像素相对裁剪窗口中心的坐标
+        center = (size - 1) / 2
+        coords = torch.arange(size, device=device, dtype=torch.float32) - center
+        v = coords.view(1, size, 1)
+        u = coords.view(1, 1, size)
+
+        # 逆旋转得到裁剪窗口内的采样坐标，再应用翻转
+        xs = cos * u - sin * v + center
+        ys = sin * u + cos * v + center
+        xs = torch.where(flip, (size - 1) - xs, xs)
+
+        # 最近邻采样下落在窗口外的点填 0
+        inside = (
+            (xs >= -0.5) & (xs < size - 0.5) &
+            (ys >= -0.5) & (ys < size - 0.5)
+        ).unsqueeze(1)
+
+        # 映射到原图坐标并归一化到 [-1, 1]（align_corners=False）
+        gx = (2 * (xs + ox) + 1) / w - 1
+        gy = (2 * (ys + oy) + 1) / h - 1
+        grid = torch.stack([gx, gy], dim=-1)
+
+        out = F.grid_sample(images, grid, mode='nearest',
+                            padding_mode='zeros', align_corners=False)
+        return out * inside
+
+    def _color_jitter(self, images):
+        n = images.size(0)
+        device = images.device
+
+        def factors(strength):
+            return (1 + (torch.rand(n, 1, 1, 1, device=device) * 2 - 1) * strength)
+
+        ops = []
+        if self.brightness:
+            f = factors(self.brightness)
+            ops.append(lambda x, f=f: (x * f).clamp(0, 1))
+        if self.contrast:
+            f = factors(self.contrast)
+            ops.append(lambda x, f=f: (
+                f * x + (1 - f) * _grayscale(x).mean(dim=(-3, -2, -1), keepdim=True)
+            ).clamp(0, 1))
+        if self.saturation:
+            f = factors(self.saturation)
+            ops.append(lambda x, f=f: (f * x + (1 - f) * _grayscale(x)).clamp(0, 1))
+
+        for i in torch.randperm(len(ops)).tolist():
+            images = ops[i](images)
+        return images
+
+    @torch.no_grad()
+    def forward(self, images):
+        images = images.float().div_(255)
+        if self.augment:
+            images = self._geometric(images)
+            images = self._color_jitter(images)
+        return (images - self.mean) / self.std
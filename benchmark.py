@@ -0,0 +1,465 @@
+"""性能基准与压测
+
+三个子命令：
+
+- micro: 微基准，覆盖 FashionDataset 读取、训练 / 验证预处理、FashionCNN 前向（batch 1~64）和穿搭评分
+- load: 本地压测，用多个合成用户并发调用 /api/auth/login、/api/wardrobe、/api/wardrobe/upload、
+  /api/recommendations（需先启动 manage.py runserver，并创建 bench_user_0..N-1 用户）
+- compare: 与保存的基线报告对比，p95 变慢超过阈值时以退出码 1 结束（可用于 CI）
+
+报告为 JSON，每一项都有 p50 / p95 / p99 延迟（毫秒）和吞吐量:
+    python benchmark.py micro --data-dir fashion_dataset --output bench_micro.json
+    python benchmark.py load --base-url http://127.0.0.1:8000 --users 8 --duration 30 --output bench_load.json
+    python benchmark.py compare bench_micro.json --baseline benchmark_baseline_micro.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZES = (1, 4, 16, 64)
+WARDROBE_SIZES = (50, 500, 5000)
+
+# 压测中各操作的默认比例
+DEFAULT_MIX = {'wardrobe': 5, 'recommendations': 3, 'upload': 2}
+# 正式压测前每个接口的预热请求数（全部失败时直接报错）
+WARMUP_REQUESTS = 3
+
+
+def summarize(samples, elapsed=None, items_per_sample=1):
+    """
+    延迟样本（秒）→ 报告条目
+
+    Args:
+        elapsed: 墙钟总时长；省略时按样本之和计算吞吐量（串行执行）
+        items_per_sample: 每个样本处理的条数（如前向的 batch size），用于吞吐量
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) == 0:
+        return {'count': 0}
+    elapsed = elapsed if elapsed is not None else samples.sum()
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        'count': int(len(samples)),
+        'mean_ms': float(samples.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(samples.max() * 1000),
+        'throughput_per_s': float(len(samples) * items_per_sample / elapsed) if elapsed > 0 else None,
+    }
+
+
+def time_calls(fn, repeat=50, warmup=5, sync=None):
+    """重复调用 fn，返回每次耗时（秒）；sync 在计时结束前调用（如 torch.cuda.synchronize）"""
+    for _ in range(warmup):
+        fn()
+    if sync:
+        sync()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        if sync:
+            sync()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment_info():
+    """报告中记录的运行环境，对比基线时先确认环境一致"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['cuda'] = torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+        info['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+
+def synthetic_jpeg(rng, size=(600, 800)):
+    """随机色块组成的 JPEG 字节（比纯噪声更接近真实照片的压缩率）"""
+    small = rng.integers(0, 256, (8, 6, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize(size, Image.BILINEAR)
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+def make_synthetic_dataset(root, classes, per_class=16, seed=0):
+    """在 root/train/<类别>/ 下生成合成图片，没有真实数据集时用于 FashionDataset 基准"""
+    rng = np.random.default_rng(seed)
+    for name in classes:
+        class_dir = Path(root) / 'train' / name
+        class_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(per_class):
+            (class_dir / f'{i}.jpg').write_bytes(synthetic_jpeg(rng))
+    return root
+
+
+# ---- 微基准 ----
+
+def bench_dataset(data_dir, samples=200):
+    """FashionDataset.__getitem__：读取 + 解码（不含预处理）"""
+    from train_fashion_classifier import FashionDataset
+
+    dataset = FashionDataset(Path(data_dir) / 'train', transform=None)
+    if len(dataset) == 0:
+        return {}
+    rng = random.Random(0)
+    indices = [rng.randrange(len(dataset)) for _ in range(samples)]
+    it = iter(indices)
+    return {'dataset_getitem': summarize(time_calls(lambda: dataset[next(it)], repeat=samples - 5))}
+
+
+def bench_transforms(repeat=100):
+    """训练（随机增强）和验证预处理，输入为 800×600 的 PIL 图片"""
+    from train_fashion_classifier import default_transforms
+
+    train_transform, val_transform = default_transforms()
+    image = Image.open(io.BytesIO(synthetic_jpeg(np.random.default_rng(0)))).convert('RGB')
+    return {
+        'train_transform': summarize(time_calls(lambda: train_transform(image), repeat)),
+        'val_transform': summarize(time_calls(lambda: val_transform(image), repeat)),
+    }
+
+
+def bench_forward(batch_sizes=BATCH_SIZES, device=None, repeat=20):
+    """FashionCNN 推理前向（eval + no_grad），吞吐量单位为图片/秒"""
+    import torch
+    from enhanced_classifier import FashionCNN, GARMENT_CLASSES
+
+    device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+    model = FashionCNN(num_classes=len(GARMENT_CLASSES)).to(device).eval()
+    sync = torch.cuda.synchronize if device.type == 'cuda' else None
+    results = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            inputs = torch.randn(batch_size, 3, 224, 224, device=device)
+            samples = time_calls(lambda: model(inputs), repeat, warmup=3, sync=sync)
+            results[f'forward_bs{batch_size}'] = summarize(samples, items_per_sample=batch_size)
+    return results
+
+
+def bench_outfit_scoring(sizes=WARDROBE_SIZES, repeat=20):
+    """recommend_outfits 在合成衣橱上的耗时（默认 50 ms 预算）"""
+    from outfit_scoring import Wardrobe, recommend_outfits, synthetic_wardrobe
+
+    profile = {'body_shape': 'A', 'age': 28, 'skin_season': 'autumn'}
+    results = {}
+    for n in sizes:
+        wardrobe = Wardrobe(synthetic_wardrobe(n))
+        samples = time_calls(lambda: recommend_outfits(wardrobe, profile, season='autumn'), repeat)
+        results[f'outfit_scoring_{n}'] = summarize(samples)
+    return results
+
+
+def run_micro(args):
+    results = {}
+    data_dir = args.data_dir
+    tmp = None
+    if data_dir is None:
+        from enhanced_classifier import GARMENT_CLASSES
+
+        tmp = tempfile.TemporaryDirectory()
+        data_dir = make_synthetic_dataset(tmp.name, GARMENT_CLASSES, per_class=8)
+        logger.info("No --data-dir given, using a synthetic dataset")
+
+    steps = [
+        ('dataset', lambda: bench_dataset(data_dir)),
+        ('transforms', bench_transforms),
+        ('forward', lambda: bench_forward([int(b) for b in args.batch_sizes.split(',')], args.device)),
+        ('outfit_scoring', lambda: bench_outfit_scoring([int(s) for s in args.wardrobe_sizes.split(',')])),
+    ]
+    for name, step in steps:
+        if args.only and name not in args.only.split(','):
+            continue
+        logger.info(f"Running {name} benchmarks...")
+        results.update(step())
+    if tmp is not None:
+        tmp.cleanup()
+    return results
+
+
+# ---- 压测 ----
+
+class LoadGenerator:
+    """
+    多用户并发压测
+
+    每个虚拟用户一个线程和一个 requests.Session：先登录，然后在 duration 秒内按 mix 的比例
+    随机执行 查看衣橱 / 生成推荐 / 上传合成图片，记录每个请求的延迟和是否成功。
+    与前端的 fetchJSON 一样，非 GET 请求带上 csrftoken cookie 对应的 X-CSRFToken 头。
+
+    开始前用第一个用户对每个接口发送 WARMUP_REQUESTS 个预热请求（不计入结果），
+    某个接口全部失败时抛出 RuntimeError，避免把错误响应的耗时当成 p95。
+    """
+
+    def __init__(self, base_url, usernames, password, duration=30, mix=None, timeout=30, seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.usernames = usernames
+        self.password = password
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.timeout = timeout
+        self.seed = seed
+        self._samples = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _record(self, name, start, ok):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._samples[name].append(elapsed)
+            if not ok:
+                self._errors[name] += 1
+
+    def _send(self, session, name, method, path, **kwargs):
+        """发送一个请求，返回 (是否成功, 失败原因)"""
+        if method not in ('GET', 'HEAD', 'OPTIONS'):
+            token = session.cookies.get('csrftoken')
+            if token:
+                kwargs['headers'] = {**kwargs.get('headers', {}), 'X-CSRFToken': token}
+        try:
+            resp = session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            if resp.status_code >= 400:
+                return False, f'HTTP {resp.status_code}'
+            if not resp.json().get('success', False):
+                return False, 'success=false'
+            return True, None
+        except Exception as e:
+            logger.debug(f"{name} failed: {e}")
+            return False, str(e)
+
+    def _request(self, session, name, method, path, record=True, **kwargs):
+        """发送请求并记录延迟（record=False 时不计入结果），返回 (是否成功, 失败原因)"""
+        start = time.perf_counter()
+        ok, reason = self._send(session, name, method, path, **kwargs)
+        if record:
+            self._record(name, start, ok)
+        return ok, reason
+
+    def _session(self, index, record=True):
+        """登录后的 Session，登录失败时返回 None"""
+        import requests
+
+        session = requests.Session()
+        # 先访问首页拿到 csrftoken cookie（登录接口本身也可能校验 CSRF）
+        try:
+            session.get(self.base_url + '/', timeout=self.timeout)
+        except Exception as e:
+            logger.debug(f"Could not fetch CSRF cookie: {e}")
+        username = self.usernames[index]
+        ok, _ = self._request(session, 'login', 'POST', '/api/auth/login', record=record,
+                              json={'username': username, 'password': self.password})
+        if not ok:
+            logger.warning(f"Login failed for {username}; is the user created?")
+            return None
+        return session
+
+    def _action(self, session, action, rng, tag, record=True):
+        """执行一次操作；record=False 时不计入结果，返回 (是否成功, 失败原因)"""
+        if action == 'wardrobe':
+            request = ('GET', '/api/wardrobe', {})
+        elif action == 'recommendations':
+            request = ('POST', '/api/recommendations', {})
+        else:
+            # 文件名带关键词，关键词后端也能分类
+            files = {'image': (f'bench_tshirt_{tag}.jpg', synthetic_jpeg(rng), 'image/jpeg')}
+            request = ('POST', '/api/wardrobe/upload', {'files': files})
+        method, path, kwargs = request
+        return self._request(session, action, method, path, record=record, **kwargs)
+
+    def warm_up(self, requests_per_action=WARMUP_REQUESTS):
+        """用第一个用户预热各接口；某个接口全部失败时抛出 RuntimeError"""
+        session = self._session(0, record=False)
+        if session is None:
+            raise RuntimeError(f"Login failed for {self.usernames[0]}; is the user created?")
+        rng = np.random.default_rng(self.seed)
+        for action in self.mix:
+            reasons = []
+            for i in range(requests_per_action):
+                ok, reason = self._action(session, action, rng, f'warmup_{i}', record=False)
+                if ok:
+                    break
+                reasons.append(reason)
+            else:
+                raise RuntimeError(
+                    f"All {requests_per_action} warm-up requests for '{action}' failed "
+                    f"({', '.join(sorted(set(reasons)))}); not running the load test"
+                )
+
+    def _user(self, index, deadline):
+        rng = np.random.default_rng(self.seed + index)
+        session = self._session(index)
+        if session is None:
+            return
+        actions = list(self.mix)
+        weights = np.array([self.mix[a] for a in actions], dtype=np.float64)
+        weights /= weights.sum()
+        uploads = 0
+        while time.perf_counter() < deadline:
+            action = actions[rng.choice(len(actions), p=weights)]
+            if action == 'upload':
+                uploads += 1
+            self._action(session, action, rng, f'{index}_{uploads}')
+
+    def run(self):
+        self.warm_up()
+        deadline = time.perf_counter() + self.duration
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._user, args=(i, deadline), name=f'bench-user-{i}')
+            for i in range(len(self.usernames))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        results = {}
+        for name, samples in sorted(self._samples.items()):
+            entry = summarize(samples, elapsed=elapsed)
+            entry['errors'] = self._errors[name]
+            entry['error_rate'] = self._errors[name] / len(samples)
+            results[name] = entry
+        return results
+
+
+def run_load(args):
+    usernames = [f'{args.user_prefix}{i}' for i in range(args.users)]
+    mix = DEFAULT_MIX
+    if args.mix:
+        mix = {k: float(v) for k, v in (part.split('=') for part in args.mix.split(','))}
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise ValueError(f"Unknown action(s) in --mix: {', '.join(sorted(unknown))}")
+    generator = LoadGenerator(args.base_url, usernames, args.password, args.duration, mix)
+    return generator.run()
+
+
+# ---- 基线对比 ----
+
+def compare_reports(report, baseline, metric='p95_ms', tolerance=0.2):
+    """
+    对比两份报告中同名条目的某项指标
+
+    Returns:
+        [(名称, 基线值, 当前值, 变化比例, 是否退化)]，只包含两边都有的条目
+    """
+    rows = []
+    for name, current in sorted(report['results'].items()):
+        base = baseline['results'].get(name)
+        if not base or metric not in base or metric not in current or not base[metric]:
+            continue
+        change = current[metric] / base[metric] - 1
+        rows.append((name, base[metric], current[metric], change, change > tolerance))
+    return rows
+
+
+def run_compare(args):
+    with open(args.report, encoding='utf-8') as f:
+        report = json.load(f)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    rows = compare_reports(report, baseline, args.metric, args.tolerance)
+    regressions = [row for row in rows if row[4]]
+    for name, base, current, change, regressed in rows:
+        flag = '❌' if regressed else '  '
+        logger.info(f"{flag} {name:28s} {base:10.2f} → {current:10.2f} {args.metric} ({change:+.1%})")
+    if regressions:
+        logger.error(f"{len(regressions)} benchmark(s) regressed more than {args.tolerance:.0%}")
+        return 1
+    logger.info(f"✅ No regressions beyond {args.tolerance:.0%} ({len(rows)} compared)")
+    return 0
+
+
+def log_results(results):
+    for name, entry in results.items():
+        if not entry.get('count'):
+            continue
+        line = (f"  {name:28s} p50 {entry['p50_ms']:9.2f} ms  p95 {entry['p95_ms']:9.2f} ms  "
+                f"p99 {entry['p99_ms']:9.2f} ms  {entry['throughput_per_s']:10.1f}/s")
+        if 'errors' in entry:
+            line += f"  errors {entry['errors']}"
+        logger.info(line)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Benchmarks and load tests')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    micro = sub.add_parser('micro', help='Dataset / transform / forward / outfit scoring microbenchmarks')
+    micro.add_argument('--data-dir', default=None, help='Dataset root (uses a synthetic one if omitted)')
+    micro.add_argument('--device', default=None)
+    micro.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    micro.add_argument('--wardrobe-sizes', default=','.join(map(str, WARDROBE_SIZES)))
+    micro.add_argument('--only', default=None, help='Comma-separated subset: dataset,transforms,forward,outfit_scoring')
+    micro.add_argument('--output', default='bench_micro.json')
+
+    load = sub.add_parser('load', help='Drive the JSON API of a running local server')
+    load.add_argument('--base-url', default='http://127.0.0.1:8000')
+    load.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+    load.add_argument('--user-prefix', default='bench_user_')
+    load.add_argument('--password', default='bench-password')
+    load.add_argument('--duration', type=float, default=30, help='Seconds')
+    load.add_argument('--mix', default=None, help='Action weights, e.g. wardrobe=5,recommendations=3,upload=2')
+    load.add_argument('--output', default='bench_load.json')
+
+    compare = sub.add_parser('compare', help='Compare a report against a baseline')
+    compare.add_argument('report')
+    compare.add_argument('--baseline', required=True)
+    compare.add_argument('--metric', default='p95_ms')
+    compare.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown ratio')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    if args.command == 'compare':
+        sys.exit(run_compare(args))
+
+    results = run_micro(args) if args.command == 'micro' else run_load(args)
+    log_results(results)
+    report = {'kind': args.command, 'environment': environment_info(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"✅ Report saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
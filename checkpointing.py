@@ -0,0 +1,181 @@
+"""训练检查点：完整状态快照、异步写盘与断点续训
+
+快照在训练线程中先复制到 CPU，随后交给后台线程序列化，写入临时文件后原子重命名，
+训练不会因磁盘 I/O 停顿；周期检查点只保留最近若干个。
+"""
+import glob
+import logging
+import os
+import queue
+import random
+import re
+import threading
+
+import numpy as np
+import torch
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def to_cpu(obj):
+    """递归地把张量复制到 CPU（CPU 张量也会复制，避免训练继续修改快照）"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def get_rng_state():
+    """收集 Python / NumPy / torch（含 CUDA）的随机数状态"""
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    """恢复 get_rng_state() 保存的随机数状态"""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def snapshot_training_state(model, optimizer, scheduler, epoch, best_acc, history,
+                            scaler=None, sampler=None, **extra):
+    """
+    生成可用于断点续训的完整训练状态（已复制到 CPU）
+
+    Args:
+        model: 未经 DDP 包装的模型
+        optimizer / scheduler / scaler: 对应的训练组件，scaler 可为 None
+        sampler: 训练集采样器，有 state_dict 时一并保存（如难例采样器的逐样本损失）
+        epoch: 已完成的 epoch（从 0 开始）
+        best_acc: 目前最佳验证准确率
+        history: 训练历史
+        extra: 额外写入的字段（如 val_acc、class_names）
+    """
+    state = {
+        'epoch': epoch,
+        'model_state_dict': model.state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'scheduler_state_dict': scheduler.state_dict(),
+        'scaler_state_dict': scaler.state_dict() if scaler is not None else None,
+        'sampler_state_dict': sampler.state_dict() if hasattr(sampler, 'state_dict') else None,
+        'best_acc': best_acc,
+        'history': history,
+        'rng_state': get_rng_state(),
+    }
+    state.update(extra)
+    return to_cpu(state)
+
+
+def restore_training_state(path, model, optimizer, scheduler, scaler=None, sampler=None):
+    """
+    从检查点恢复模型、优化器、调度器、梯度缩放器、采样器和随机数状态
+
+    Returns:
+        (下一个 epoch, best_acc, history)
+    """
+    checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+    if checkpoint.get('scheduler_state_dict') is not None:
+        scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+    if scaler is not None and checkpoint.get('scaler_state_dict') is not None:
+        scaler.load_state_dict(checkpoint['scaler_state_dict'])
+    if hasattr(sampler, 'load_state_dict'):
+        if checkpoint.get('sampler_state_dict') is not None:
+            sampler.load_state_dict(checkpoint['sampler_state_dict'])
+        else:
+            logger.warning(f"{path} has no sampler state; hard-example weights start from scratch")
+    if checkpoint.get('rng_state') is not None:
+        set_rng_state(checkpoint['rng_state'])
+
+    logger.info(f"Resumed from {path} (epoch {checkpoint['epoch'] + 1})")
+    return checkpoint['epoch'] + 1, checkpoint.get('best_acc', 0.0), checkpoint.get('history')
+
+
+def atomic_save(state, path):
+    """先写临时文件再重命名，中途中断不会留下损坏的检查点"""
+    tmp_path = f"{path}.tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class AsyncCheckpointWriter:
+    """
+    后台线程写检查点
+
+    save() 接收已复制到 CPU 的状态并立即返回；队列容量有限，
+    磁盘持续跟不上时 save() 会阻塞，防止快照在内存中堆积。
+    后台写入失败时，下一次 save() / wait() / close() 抛出 RuntimeError。
+    rotate_pattern 匹配的周期检查点只保留最近 keep 个（按文件名中的数字排序）。
+    """
+
+    def __init__(self, keep=3, max_pending=2):
+        self.keep = keep
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                state, path, rotate_pattern = item
+                with metrics.timer('fashion_checkpoint_write_seconds'):
+                    atomic_save(state, path)
+                logger.info(f"Checkpoint written: {path}")
+                if rotate_pattern:
+                    self._rotate(rotate_pattern)
+            except Exception as e:
+                logger.error(f"Failed to write checkpoint: {e}")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _rotate(self, pattern):
+        def number(path):
+            found = re.findall(r'\d+', os.path.basename(path))
+            return int(found[-1]) if found else -1
+
+        paths = sorted(glob.glob(pattern), key=number)
+        for path in paths[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove old checkpoint {path}: {e}")
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError('Checkpoint writer failed') from self._error
+
+    def save(self, state, path, rotate_pattern=None):
+        """排队写入 state；rotate_pattern 为 glob 模式，写完后只保留最近 keep 个"""
+        self._raise_if_failed()
+        self._queue.put((state, str(path), rotate_pattern))
+
+    def wait(self):
+        """等待所有排队的检查点写完"""
+        self._queue.join()
+        self._raise_if_failed()
+
+    def close(self):
+        """写完剩余检查点并结束后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_if_failed()
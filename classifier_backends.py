@@ -0,0 +1,397 @@
+"""可插拔的服装分类后端
+
+OPTIMIZATION_SUMMARY.md 中的多级降级策略（增强模型 → ResNet50 → 关键词）在这里以注册表实现：
+每个后端在首次使用时才导入依赖并加载模型（也可在启动时由后台线程预热），
+模块本身只依赖标准库，worker 进程导入后立即可以响应健康检查。
+
+启用哪些后端、按什么顺序由配置决定:
+    FASHION_CLASSIFIER_CHAIN=enhanced,resnet50,keywords
+
+用法:
+    from classifier_backends import get_chain
+    chain = get_chain()
+    chain.warm_up()                       # 启动时后台加载
+    result = chain.classify(image, filename='格子衬衫.jpg')
+    chain.status()                        # 每个后端的状态、加载耗时和内存占用
+"""
+import logging
+import os
+import threading
+import time
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAIN = 'enhanced,resnet50,keywords'
+# 加载失败的后端在这么多秒后重试（检查点还没拷贝完、预热时显存不足等暂时性错误）
+RETRY_SECONDS = 60.0
+
+_BACKENDS = {}
+
+
+def register_backend(name):
+    """注册后端加载函数：loader() 返回一个带 classify(image, filename) 方法的对象"""
+    def decorator(loader):
+        _BACKENDS[name] = loader
+        return loader
+    return decorator
+
+
+def available_backends():
+    """所有已注册的后端名"""
+    return sorted(_BACKENDS)
+
+
+def _rss_mb():
+    """当前进程常驻内存（MB）；无法读取时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _param_mb(model):
+    """模型参数和 buffer 占用（MB）"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / 1024 / 1024
+
+
+def _top_k(probs, class_names, k=5):
+    """把概率向量整理成与 BatchedClassifier 相同的结果格式"""
+    top_probs, top_idx = probs.topk(min(k, len(class_names)))
+    top = [(class_names[i], p) for i, p in zip(top_idx.tolist(), top_probs.tolist())]
+    return {'category': top[0][0], 'confidence': top[0][1], 'top5': top}
+
+
+class _EnhancedBackend:
+    """训练好的 FashionCNN，经 inference_server 的动态微批次服务推理"""
+
+    def __init__(self):
+        from inference_server import get_classifier
+        self.classifier = get_classifier()
+        self.model_mb = _param_mb(self.classifier.model)
+
+    def classify(self, image, filename=None):
+        return self.classifier.classify(image)
+
+
+class _TorchScriptBackend:
+    """export_classifier.py 导出的 TorchScript 模型（默认 int8），不需要 enhanced_classifier"""
+
+    def __init__(self):
+        import json
+        import torch
+        from inference_server import DEFAULT_TRANSFORM
+
+        path = os.environ.get('FASHION_CLASSIFIER_TORCHSCRIPT', 'exported/fashion_classifier_int8.pt')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"TorchScript model not found: {path}")
+        extra_files = {'class_names.json': ''}
+        self.torch = torch
+        self.model = torch.jit.load(path, map_location='cpu', _extra_files=extra_files).eval()
+        self.transform = DEFAULT_TRANSFORM
+        self.class_names = json.loads(extra_files['class_names.json'])
+        self.model_mb = os.path.getsize(path) / 1024 / 1024
+
+    def classify(self, image, filename=None):
+        inputs = self.transform(image.convert('RGB')).unsqueeze(0)
+        with self.torch.no_grad():
+            probs = self.torch.softmax(self.model(inputs)[0].float(), dim=0)
+        return _top_k(probs, self.class_names)
+
+
+# ImageNet 类别 → 服装类别（只保留与服装相关的类别）
+IMAGENET_TO_GARMENT = {
+    'jersey': 'tshirt',
+    'sweatshirt': 'hoodie',
+    'cardigan': 'cardigan',
+    'suit': 'blazer',
+    'trench coat': 'coat',
+    'fur coat': 'coat',
+    'lab coat': 'coat',
+    'poncho': 'coat',
+    'jean': 'jeans',
+    'swimming trunks': 'shorts',
+    'miniskirt': 'skirt',
+    'overskirt': 'skirt',
+    'hoopskirt': 'skirt',
+    'gown': 'dress',
+    'abaya': 'dress',
+    'kimono': 'dress',
+    'pajama': 'jumpsuit',
+    'running shoe': 'shoes',
+    'Loafer': 'shoes',
+    'sandal': 'shoes',
+    'cowboy boot': 'shoes',
+    'clog': 'shoes',
+    'sunglass': 'accessory',
+    'sunglasses': 'accessory',
+    'bow tie': 'accessory',
+    'Windsor tie': 'accessory',
+    'purse': 'accessory',
+    'backpack': 'accessory',
+    'cowboy hat': 'accessory',
+}
+
+
+class _ResNet50Backend:
+    """ImageNet 预训练 ResNet50，只在与服装相关的 ImageNet 类别上取最大概率"""
+
+    def __init__(self):
+        import torch
+        from torchvision import models
+
+        weights = models.ResNet50_Weights.IMAGENET1K_V2
+        self.torch = torch
+        self.model = models.resnet50(weights=weights).eval()
+        self.transform = weights.transforms()
+        categories = weights.meta['categories']
+        self.indices = [categories.index(name) for name in IMAGENET_TO_GARMENT]
+        self.class_names = list(IMAGENET_TO_GARMENT.values())
+        self.model_mb = _param_mb(self.model)
+
+    def classify(self, image, filename=None):
+        inputs = self.transform(image.convert('RGB')).unsqueeze(0)
+        with self.torch.no_grad():
+            probs = self.torch.softmax(self.model(inputs)[0], dim=0)[self.indices]
+        # 多个 ImageNet 类别可能映射到同一服装类别，按服装类别合并概率
+        merged = {}
+        for name, p in zip(self.class_names, probs.tolist()):
+            merged[name] = merged.get(name, 0.0) + p
+        top = sorted(merged.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        return {'category': top[0][0], 'confidence': top[0][1], 'top5': top}
+
+
+# 文件名关键词（中英文），按顺序匹配，更具体的类别在前
+GARMENT_KEYWORDS = [
+    ('down_jacket', ['羽绒', 'down jacket', 'puffer']),
+    ('cardigan', ['开衫', 'cardigan']),
+    ('blazer', ['西装', 'blazer', 'suit']),
+    ('jacket', ['夹克', 'jacket']),
+    ('coat', ['大衣', '风衣', 'coat', 'trench']),
+    ('hoodie', ['卫衣', 'hoodie', 'sweatshirt']),
+    ('sweater', ['毛衣', '针织', 'sweater', 'knit']),
+    ('blouse', ['女衬', 'blouse']),
+    ('shirt', ['衬衫', '格子', 'shirt']),
+    ('tshirt', ['t恤', 'tshirt', 't-shirt', 'tee']),
+    ('jeans', ['牛仔裤', 'jeans', 'denim']),
+    ('shorts', ['短裤', 'shorts']),
+    ('pants', ['长裤', '裤', 'pants', 'trousers']),
+    ('skirt', ['半身裙', 'skirt']),
+    ('jumpsuit', ['连体', 'jumpsuit']),
+    ('dress', ['连衣裙', '裙', 'dress']),
+    ('shoes', ['鞋', 'shoe', 'sneaker', 'boot']),
+    ('accessory', ['帽', '包', '围巾', 'hat', 'bag', 'scarf']),
+]
+
+
+class _KeywordBackend:
+    """按文件名关键词识别，没有匹配时返回 None 交给下一个后端"""
+
+    model_mb = 0.0
+
+    def classify(self, image, filename=None):
+        if not filename:
+            return None
+        name = os.path.basename(filename).lower()
+        for category, keywords in GARMENT_KEYWORDS:
+            if any(k in name for k in keywords):
+                return {'category': category, 'confidence': 1.0, 'top5': [(category, 1.0)]}
+        return None
+
+
+register_backend('enhanced')(_EnhancedBackend)
+register_backend('torchscript')(_TorchScriptBackend)
+register_backend('resnet50')(_ResNet50Backend)
+register_backend('keywords')(_KeywordBackend)
+
+
+class _LazyBackend:
+    """
+    后端的懒加载包装：首次使用时加载，记录耗时、内存和失败原因
+
+    加载失败后 retry_seconds 内直接跳过该后端，之后的 get() 重新尝试加载；
+    retry_seconds 为 None 时失败状态一直保留，直到调用 reset()。
+    """
+
+    def __init__(self, name, retry_seconds=RETRY_SECONDS):
+        self.name = name
+        self.retry_seconds = retry_seconds
+        self.instance = None
+        self.error = None
+        self.failed_at = None
+        self.load_time = None
+        self.rss_delta_mb = None
+        self._lock = threading.Lock()
+
+    def _should_skip(self):
+        """已加载，或失败后仍在冷却期内"""
+        if self.instance is not None:
+            return True
+        if self.error is None:
+            return False
+        return self.retry_seconds is None or time.monotonic() - self.failed_at < self.retry_seconds
+
+    def reset(self):
+        """清除失败状态，下一次 get() 重新加载"""
+        with self._lock:
+            self.error = None
+            self.failed_at = None
+
+    def get(self):
+        if self._should_skip():
+            return self.instance
+        with self._lock:
+            if not self._should_skip():
+                rss_before = _rss_mb()
+                start = time.perf_counter()
+                try:
+                    self.instance = _BACKENDS[self.name]()
+                    self.error = None
+                    self.failed_at = None
+                except Exception as e:
+                    logger.error(f"Classifier backend '{self.name}' unavailable: {e}")
+                    self.error = e
+                    self.failed_at = time.monotonic()
+                self.load_time = time.perf_counter() - start
+                rss_after = _rss_mb()
+                if rss_before is not None and rss_after is not None:
+                    self.rss_delta_mb = rss_after - rss_before
+                if self.instance is not None:
+                    logger.info(
+                        f"Loaded classifier backend '{self.name}' in {self.load_time:.2f}s"
+                    )
+        return self.instance
+
+    def status(self):
+        if self.instance is not None:
+            state = 'ready'
+        elif self.error is not None:
+            state = 'failed'
+        elif self._lock.locked():
+            state = 'loading'
+        else:
+            state = 'not_loaded'
+        retry_in = None
+        if state == 'failed' and self.retry_seconds is not None:
+            retry_in = max(0.0, self.retry_seconds - (time.monotonic() - self.failed_at))
+        return {
+            'state': state,
+            'retry_in_s': retry_in,
+            'load_time_s': self.load_time,
+            'rss_delta_mb': self.rss_delta_mb,
+            'model_mb': getattr(self.instance, 'model_mb', None),
+            'error': str(self.error) if self.error is not None else None,
+        }
+
+
+class ClassifierChain:
+    """
+    按顺序尝试各后端的分类链
+
+    后端加载失败、抛出异常或返回 None 时换下一个；
+    min_confidence > 0 时置信度不足的结果也会继续尝试下一个，最后返回置信度最高的结果。
+
+    Args:
+        names: 后端名列表或逗号分隔字符串
+        min_confidence: 接受结果的最低置信度
+        retry_seconds: 加载失败的后端多少秒后重试，None 表示不自动重试
+    """
+
+    def __init__(self, names=DEFAULT_CHAIN, min_confidence=0.0, retry_seconds=RETRY_SECONDS):
+        if isinstance(names, str):
+            names = [n.strip() for n in names.split(',') if n.strip()]
+        unknown = [n for n in names if n not in _BACKENDS]
+        if unknown:
+            raise ValueError(
+                f"Unknown classifier backend(s): {', '.join(unknown)}. "
+                f"Available: {', '.join(available_backends())}"
+            )
+        self.backends = [_LazyBackend(n, retry_seconds=retry_seconds) for n in names]
+        self.min_confidence = min_confidence
+        self._warm_up_thread = None
+
+    def warm_up(self, background=True):
+        """按链的顺序加载所有后端；background=True 时在守护线程中进行"""
+        def run():
+            for backend in self.backends:
+                backend.get()
+
+        if not background:
+            run()
+            return None
+        if self._warm_up_thread is None or not self._warm_up_thread.is_alive():
+            self._warm_up_thread = threading.Thread(
+                target=run, name='classifier-warm-up', daemon=True
+            )
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def reset(self):
+        """清除所有后端的失败状态（如检查点更新后），下一次使用或 warm_up() 时重新加载"""
+        for backend in self.backends:
+            backend.reset()
+
+    def ready(self):
+        """第一个可用的后端已加载（可以开始接收请求）"""
+        return any(b.instance is not None for b in self.backends)
+
+    def classify(self, image, filename=None):
+        """
+        依次尝试各后端
+
+        Returns:
+            结果字典（额外包含 'backend' 字段），所有后端都失败时返回 None
+        """
+        best = None
+        for backend in self.backends:
+            instance = backend.get()
+            if instance is None:
+                continue
+            try:
+                with metrics.timer('fashion_classifier_seconds', backend=backend.name):
+                    result = instance.classify(image, filename=filename)
+            except Exception as e:
+                logger.warning(f"Classifier backend '{backend.name}' failed: {e}")
+                metrics.inc('fashion_classifier_failures_total', backend=backend.name)
+                continue
+            if result is None:
+                continue
+            result = dict(result, backend=backend.name)
+            if result['confidence'] >= self.min_confidence:
+                best = result
+                break
+            if best is None or result['confidence'] > best['confidence']:
+                best = result
+        metrics.inc('fashion_classifier_requests_total', backend=best['backend'] if best else 'none')
+        return best
+
+    def status(self):
+        """每个后端的加载状态、耗时和内存占用"""
+        return {b.name: b.status() for b in self.backends}
+
+
+_default_chain = None
+_default_lock = threading.Lock()
+
+
+def get_chain():
+    """
+    进程内共享的分类链
+
+    FASHION_CLASSIFIER_CHAIN 指定后端顺序，FASHION_CLASSIFIER_MIN_CONFIDENCE 指定最低置信度，
+    FASHION_CLASSIFIER_RETRY_SECONDS 指定加载失败后的重试间隔。
+    """
+    global _default_chain
+    if _default_chain is None:
+        with _default_lock:
+            if _default_chain is None:
+                _default_chain = ClassifierChain(
+                    os.environ.get('FASHION_CLASSIFIER_CHAIN', DEFAULT_CHAIN),
+                    min_confidence=float(os.environ.get('FASHION_CLASSIFIER_MIN_CONFIDENCE', 0)),
+                    retry_seconds=float(os.environ.get('FASHION_CLASSIFIER_RETRY_SECONDS', RETRY_SECONDS))
+                )
+    return _default_chain
@@ -0,0 +1,202 @@
+"""服装数据集的预解码内存映射缓存
+
+首次使用时把每张图片解码并缩放到增强前尺寸（训练集 256x256，验证集 224x224），
+写入一个 uint8 内存映射数组 + 索引文件；之后的 epoch 直接零拷贝读取切片，
+只需执行随机裁剪、翻转、旋转和颜色抖动。源目录文件或修改时间变化时自动重建。
+分布式训练时只有 rank 0 重建缓存，其他 rank 等待完成后直接读取；rank 0 重建失败时
+其他 rank 立即报错，不会卡在等待中。
+"""
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DATA_FILE = 'images.npy'
+INDEX_FILE = 'index.json'
+
+
+def compute_fingerprint(samples, size):
+    """
+    根据样本路径、文件大小和修改时间计算缓存指纹
+
+    Args:
+        samples: [(图片路径, 标签), ...]
+        size: 缓存图片尺寸 (H, W)
+    """
+    h = hashlib.sha1()
+    h.update(f"v{CACHE_VERSION}:{size[0]}x{size[1]}".encode())
+    for path, label in samples:
+        try:
+            st = os.stat(path)
+            stamp = f"{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            stamp = 'missing'
+        h.update(f"{path}|{label}|{stamp}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _decode(path, size):
+    """解码并缩放单张图片，返回 (H, W, 3) uint8 数组"""
+    # 与 transforms.Resize 对 PIL 图片的默认插值保持一致
+    image = Image.open(path).convert('RGB')
+    image = image.resize((size[1], size[0]), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def build_cache(samples, cache_dir, size, num_workers=8):
+    """
+    解码全部样本并写入内存映射缓存
+
+    Args:
+        samples: [(图片路径, 标签), ...]
+        cache_dir: 缓存目录
+        size: 缓存图片尺寸 (H, W)
+        num_workers: 解码线程数
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    data_path = cache_dir / DATA_FILE
+    # 临时文件名带进程号，即使多个进程同时重建也不会互相覆盖
+    tmp_path = cache_dir / f'{DATA_FILE}.{os.getpid()}.tmp'
+
+    shape = (max(len(samples), 1), size[0], size[1], 3)
+    array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+
+    logger.info(f"Building tensor cache for {len(samples)} images in {cache_dir}...")
+
+    def fill(idx):
+        path = samples[idx][0]
+        try:
+            array[idx] = _decode(path, size)
+        except Exception as e:
+            # 与 FashionDataset 的行为一致：损坏图片用黑图代替
+            logger.error(f"Error loading image {path}: {e}")
+            array[idx] = 0
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for i, _ in enumerate(pool.map(fill, range(len(samples)))):
+            if (i + 1) % 1000 == 0:
+                logger.info(f"Cached {i + 1}/{len(samples)} images...")
+
+    array.flush()
+    del array
+    os.replace(tmp_path, data_path)
+
+    index = {
+        'version': CACHE_VERSION,
+        'fingerprint': compute_fingerprint(samples, size),
+        'size': list(size),
+        'samples': [[path, label] for path, label in samples],
+    }
+    tmp_index = cache_dir / f'{INDEX_FILE}.{os.getpid()}.tmp'
+    with open(tmp_index, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_index, cache_dir / INDEX_FILE)
+
+    logger.info(f"✅ Tensor cache written to {data_path}")
+
+
+def is_cache_valid(samples, cache_dir, size):
+    """检查缓存是否存在且与当前源目录一致"""
+    cache_dir = Path(cache_dir)
+    index_path = cache_dir / INDEX_FILE
+    if not index_path.exists() or not (cache_dir / DATA_FILE).exists():
+        return False
+
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return (
+        index.get('version') == CACHE_VERSION
+        and index.get('size') == list(size)
+        and index.get('fingerprint') == compute_fingerprint(samples, size)
+    )
+
+
+class TensorCache:
+    """
+    只读的预解码图片缓存
+
+    内存映射在首次访问时才打开，保证 DataLoader 多进程（fork/spawn）下
+    每个 worker 各自映射文件，而不是把整个数组序列化过去。
+    """
+
+    def __init__(self, cache_dir):
+        self.data_path = Path(cache_dir) / DATA_FILE
+        self._array = None
+
+    def _open(self):
+        # 'c' 模式为写时复制：页面只读共享，返回的数组可写但不会改动缓存文件
+        self._array = np.load(self.data_path, mmap_mode='c')
+        return self._array
+
+    def __getitem__(self, idx):
+        array = self._array if self._array is not None else self._open()
+        return array[idx]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+
+def _distributed():
+    """已初始化的 torch.distributed 模块，单进程时返回 None"""
+    try:
+        import torch.distributed as dist
+    except ImportError:
+        return None
+    return dist if dist.is_available() and dist.is_initialized() else None
+
+
+def load_or_build_cache(samples, cache_dir, size, num_workers=8):
+    """
+    加载缓存，若不存在或已失效则重建
+
+    Args:
+        samples: [(图片路径, 标签), ...]
+        cache_dir: 缓存目录
+        size: 缓存图片尺寸 (H, W)
+        num_workers: 重建时的解码线程数
+
+    Returns:
+        TensorCache
+    """
+    size = tuple(size)
+    dist = _distributed()
+    if dist is not None and dist.get_rank() != 0:
+        # 等待 rank 0 检查或重建完成，并接收其结果（各 rank 调用 broadcast 的次数一致）
+        status = [None]
+        dist.broadcast_object_list(status, src=0)
+        if status[0] is not None:
+            raise RuntimeError(f"Rank 0 failed to build tensor cache in {cache_dir}: {status[0]}")
+        if not is_cache_valid(samples, cache_dir, size):
+            raise RuntimeError(
+                f"Tensor cache in {cache_dir} does not match this rank's samples after rank 0 built it"
+            )
+        return TensorCache(cache_dir)
+
+    try:
+        if is_cache_valid(samples, cache_dir, size):
+            logger.info(f"Using tensor cache: {cache_dir}")
+        else:
+            build_cache(samples, cache_dir, size, num_workers=num_workers)
+    except Exception as e:
+        if dist is not None:
+            # 通知其他 rank 失败原因后再抛出
+            dist.broadcast_object_list([f"{type(e).__name__}: {e}"], src=0)
+        raise
+    if dist is not None:
+        dist.broadcast_object_list([None], src=0)
+    return TensorCache(cache_dir)
@@ -6,12 +6,138 @@
 
 import os
 import sys
+import csv
+import io
+import shutil
+import struct
+import threading
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 数据集配置
 DATASET_SMALL = "paramaggarwal/fashion-product-images-small"
 DATASET_FULL = "paramaggarwal/fashion-product-images-dataset"
+EXTRACT_WORKERS = 8
+
+# ZIP 本地文件头：签名、版本、标志、压缩方式、时间、日期、CRC、压缩/原始大小、文件名长度、扩展字段长度
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+class ZipImageArchive:
+    """
+    不解压，直接按偏移读取 Kaggle ZIP 中的 styles.csv 和图片
+    
+    初始化时只读取 ZIP 中央目录，记录 images/ 下每张图片的本地头偏移；
+    读取时 seek 到数据区直接取字节（图片通常以 STORED 方式存储，无需解压）。
+    每个线程持有独立的文件句柄，可在线程池中并发读取；用完后调用 close()（或 with 语句）
+    关闭所有线程打开的句柄，之后再读取会重新打开。
+    """
+    
+    def __init__(self, zip_path):
+        self.zip_path = str(zip_path)
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+        self._data_offsets = {}
+        
+        with zipfile.ZipFile(self.zip_path) as zf:
+            infos = zf.infolist()
+        
+        # 以最浅的 styles.csv 所在目录作为数据集根目录
+        styles = [i for i in infos if i.filename.split('/')[-1] == 'styles.csv']
+        if not styles:
+            raise FileNotFoundError(f"styles.csv not found in {zip_path}")
+        self.styles_info = min(styles, key=lambda i: i.filename.count('/'))
+        root = self.styles_info.filename[:-len('styles.csv')]
+        
+        prefix = root + 'images/'
+        self.images = {
+            i.filename[len(prefix):]: i for i in infos
+            if i.filename.startswith(prefix) and not i.is_dir()
+        }
+    
+    def _file(self):
+        f = getattr(self._local, 'file', None)
+        if f is None or f.closed:
+            f = self._local.file = open(self.zip_path, 'rb')
+            with self._handles_lock:
+                self._handles.append(f)
+        return f
+    
+    def close(self):
+        """关闭所有线程打开的文件句柄"""
+        with self._handles_lock:
+            handles, self._handles = self._handles, []
+        for f in handles:
+            f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+    
+    def _read_member(self, info):
+        f = self._file()
+        offset = self._data_offsets.get(info.filename)
+        if offset is None:
+            # 本地文件头长度 = 固定 30 字节 + 文件名 + 扩展字段（可能与中央目录不同）
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            if header[0] != b'PK\x03\x04':
+                raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+            name_length, extra_length = header[9], header[10]
+            offset = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+            self._data_offsets[info.filename] = offset
+        
+        f.seek(offset)
+        data = f.read(info.compress_size)
+        if info.compress_type == zipfile.ZIP_STORED:
+            return data
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        # 其他压缩方式交给 zipfile 处理
+        with zipfile.ZipFile(self.zip_path) as zf:
+            return zf.read(info)
+    
+    def read_styles(self):
+        """返回 styles.csv 的原始字节"""
+        return self._read_member(self.styles_info)
+    
+    def read(self, name):
+        """按文件名（如 '1163.jpg'）读取图片字节"""
+        return self._read_member(self.images[name])
+    
+    def __contains__(self, name):
+        return name in self.images
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_local'] = None
+        state['_handles'] = []
+        state['_handles_lock'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._handles_lock = threading.Lock()
+
+
+def needed_image_names(styles_bytes):
+    """根据 styles.csv 计算 prepare_dataset.py 实际会用到的图片文件名"""
+    from prepare_dataset import KAGGLE_TO_OUR_MAPPING
+    
+    reader = csv.DictReader(io.StringIO(styles_bytes.decode('utf-8', errors='replace')))
+    names = set()
+    for row in reader:
+        product_id = (row.get('id') or '').strip()
+        if product_id.isdigit() and row.get('articleType') in KAGGLE_TO_OUR_MAPPING:
+            names.add(f"{product_id}.jpg")
+    return names
 
 def check_kaggle_credentials():
     """检查 Kaggle 凭证是否配置"""
@@ -59,11 +185,13 @@ def manual_download_instructions():
     print("4. 重命名为: fashion-product-images-small.zip")
     print()
     print("5. 运行: python download_dataset.py --extract")
+    print("   只解压训练会用到的图片: python download_dataset.py --extract-selected")
+    print("   或完全不解压: python prepare_dataset.py --mode prepare --kaggle-dir fashion-product-images-small.zip")
     print()
     print("="*60)
 
-def extract_dataset():
-    """解压数据集 (自动检测文件名)"""
+def _find_zip():
+    """自动检测数据集 ZIP 文件名"""
     # 可能的文件名
     possible_files = [
         "fashion-product-images-small.zip",
@@ -87,6 +215,24 @@ def extract_dataset():
     if not zip_path:
         print("❌ 未找到数据集 ZIP 文件")
         print(f"请确保文件名为以下之一: {', '.join(possible_files)}")
+    return zip_path
+
+def _member_target(extract_dir, name):
+    """压缩包内路径 → 解压路径（与 ZipFile.extract 一样去掉盘符、绝对路径和 ..）"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return os.path.join(extract_dir, *parts)
+
+def extract_dataset(selective=False, workers=EXTRACT_WORKERS):
+    """
+    解压数据集 (自动检测文件名)
+    
+    selective=True 时先从压缩包内读取 styles.csv，只解压类别映射会用到的图片，
+    并整理为 kaggle_fashion/styles.csv + kaggle_fashion/images/ 的结构。
+    解压由多个线程并行完成，每个线程使用独立的 ZipFile 句柄；目标目录在开始前统一创建，
+    避免多个线程同时创建同一目录（ZipFile.extract 内部的 makedirs 不是线程安全的）。
+    """
+    zip_path = _find_zip()
+    if not zip_path:
         return False
     
     print(f"📦 正在解压 {zip_path}...")
@@ -95,18 +241,61 @@ def extract_dataset():
         extract_dir = "kaggle_fashion"
         os.makedirs(extract_dir, exist_ok=True)
         
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            file_list = zip_ref.namelist()
-            total_files = len(file_list)
-            print(f"总共 {total_files} 个文件")
+        if selective:
+            with ZipImageArchive(zip_path) as archive:
+                styles_bytes = archive.read_styles()
+            with open(os.path.join(extract_dir, 'styles.csv'), 'wb') as f:
+                f.write(styles_bytes)
+            
+            needed = needed_image_names(styles_bytes)
+            members = [archive.images[name] for name in sorted(needed) if name in archive]
+            images_dir = os.path.join(extract_dir, 'images')
+            os.makedirs(images_dir, exist_ok=True)
+            print(f"styles.csv 中需要 {len(needed)} 张图片，压缩包内找到 {len(members)} 张")
             
-            for i, file in enumerate(file_list):
-                zip_ref.extract(file, extract_dir)
-                if (i + 1) % 2000 == 0:
-                    print(f"进度: {i+1}/{total_files} ({100*(i+1)/total_files:.1f}%)")
+            def target(info):
+                return os.path.join(images_dir, info.filename.split('/')[-1])
+        else:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                infos = zip_ref.infolist()
+            members = [i for i in infos if not i.is_dir()]
+            for directory in sorted({os.path.dirname(_member_target(extract_dir, i.filename)) for i in members}
+                                    | {_member_target(extract_dir, i.filename) for i in infos if i.is_dir()}):
+                os.makedirs(directory, exist_ok=True)
             
-            print(f"✅ 解压完成！文件保存在: {extract_dir}")
-            return True
+            def target(info):
+                return _member_target(extract_dir, info.filename)
+            print(f"总共 {len(members)} 个文件")
+        
+        total_files = len(members)
+        local = threading.local()
+        lock = threading.Lock()
+        done = [0]
+        handles = []
+        
+        def extract_one(info):
+            zf = getattr(local, 'zf', None)
+            if zf is None:
+                zf = local.zf = zipfile.ZipFile(zip_path, 'r')
+                with lock:
+                    handles.append(zf)
+            with zf.open(info) as src, open(target(info), 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            with lock:
+                done[0] += 1
+                if done[0] % 2000 == 0:
+                    print(f"进度: {done[0]}/{total_files} ({100*done[0]/total_files:.1f}%)")
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # list() 以便把工作线程中的异常抛出
+                list(pool.map(extract_one, members))
+        finally:
+            for zf in handles:
+                zf.close()
+        
+        print(f"✅ 解压完成！文件保存在: {extract_dir}")
+        return True
             
     except Exception as e:
         print(f"❌ 解压失败: {e}")
@@ -116,8 +305,8 @@ def main():
     print("🎯 Fashion 数据集下载工具")
     print()
     
-    if len(sys.argv) > 1 and sys.argv[1] == "--extract":
-        extract_dataset()
+    if len(sys.argv) > 1 and sys.argv[1] in ("--extract", "--extract-selected"):
+        extract_dataset(selective=sys.argv[1] == "--extract-selected")
         return
     
     if os.path.exists("kaggle_fashion") and os.path.exists(os.path.join("kaggle_fashion", "styles.csv")):
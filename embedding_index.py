@@ -0,0 +1,476 @@
+"""衣橱单品的视觉向量索引
+
+FashionCNN 全局平均池化后的特征（分类头之前）作为每件单品的向量，上传时随分类一起计算。
+向量经 L2 归一化后用内积（余弦相似度）检索：
+
+- BruteForceIndex: NumPy 矩阵乘法精确检索，适合单个用户的衣橱（几百件）
+- IVFIndex: k-means 倒排索引，只扫描最近的 nprobe 个簇，适合上万件的商品目录
+- EmbeddingIndex: 按规模自动选择，支持持久化和"找相似单品"
+
+单品 id 与数据库中的单品 id 一致（上传完成后由 upload_jobs 调用 add_item_embedding 写入）。
+模型更新后向量不再可比，用 reembed 子命令按清单批量重算（清单为 单品 id → 图片路径）:
+    python embedding_index.py reembed --manifest items.json --images-root media --index-dir embeddings
+    python embedding_index.py similar --index-dir embeddings --item-id 42
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def parse_item_id(value):
+    """
+    把命令行 / 清单中的单品 id 转换为与数据库一致的类型
+
+    整数形式的字符串转为 int（数据库主键），其他保持字符串。
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lstrip('-').isdigit():
+            return int(text)
+        return text
+    return value
+
+
+def _top_k(scores, k):
+    """scores 中最大的 k 个下标（降序）"""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class BruteForceIndex:
+    """精确检索：所有向量放在一个 (N, D) 矩阵里"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def build(self, vectors):
+        self.vectors = _normalize(vectors) if len(vectors) else np.empty((0, self.dim), np.float32)
+
+    def search(self, query, k):
+        """返回 (行号, 相似度)"""
+        scores = self.vectors @ _normalize(query)[0]
+        idx = _top_k(scores, k)
+        return idx, scores[idx]
+
+
+class IVFIndex:
+    """
+    倒排文件索引：k-means 把向量分成 nlist 个簇，查询时只扫描最近的 nprobe 个簇
+
+    Args:
+        nlist: 簇的个数（约为 sqrt(N) 时较均衡）
+        nprobe: 每次查询扫描的簇数，越大越准越慢
+    """
+
+    def __init__(self, dim, nlist=64, nprobe=8, iterations=10, seed=42):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.vectors = None
+        self.lists = []
+
+    def build(self, vectors):
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, len(vectors))
+
+        # 球面 k-means：分配用内积，更新后重新归一化
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+        for _ in range(self.iterations):
+            assign = (vectors @ centroids.T).argmax(1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            # 空簇重新随机取一个点
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        assign = (vectors @ centroids.T).argmax(1)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self.vectors = vectors
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+
+    def search(self, query, k):
+        query = _normalize(query)[0]
+        probe = _top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self.lists[i] for i in probe])
+        scores = self.vectors[candidates] @ query
+        idx = _top_k(scores, k)
+        return candidates[idx], scores[idx]
+
+
+class EmbeddingIndex:
+    """
+    单品向量索引
+
+    少于 ivf_threshold 条时精确检索，超过后自动建立 IVF 近似索引。
+    增删后索引在下一次查询时重建（衣橱更新远少于查询）。
+
+    Args:
+        dim: 向量维度
+        model_version: 生成向量的模型版本，与当前模型不一致时应重新 reembed
+        ivf_threshold: 切换到 IVF 的条数
+    """
+
+    def __init__(self, dim, model_version=None, ivf_threshold=50000, nlist=None, nprobe=8):
+        self.dim = dim
+        self.model_version = model_version
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._ids = []
+        self._rows = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._index = None
+        # 上传线程写入与 web 请求检索可能同时发生
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    def add(self, ids, vectors):
+        """添加或覆盖单品向量"""
+        vectors = _normalize(vectors)
+        with self._lock:
+            self._add(ids, vectors)
+
+    def _add(self, ids, vectors):
+        if not self._ids and vectors.shape[1] != self.dim:
+            # 空索引以第一批向量的维度为准
+            self.dim = vectors.shape[1]
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        new_rows = []
+        for item_id, vector in zip(ids, vectors):
+            if item_id in self._rows:
+                self._vectors[self._rows[item_id]] = vector
+            else:
+                self._rows[item_id] = len(self._ids) + len(new_rows)
+                new_rows.append((item_id, vector))
+        if new_rows:
+            self._ids.extend(item_id for item_id, _ in new_rows)
+            self._vectors = np.concatenate([self._vectors, np.stack([v for _, v in new_rows])])
+        self._index = None
+
+    def remove(self, ids):
+        """删除单品"""
+        with self._lock:
+            drop = {self._rows[i] for i in ids if i in self._rows}
+            if not drop:
+                return
+            keep = [r for r in range(len(self._ids)) if r not in drop]
+            self._ids = [self._ids[r] for r in keep]
+            self._vectors = self._vectors[keep]
+            self._rows = {item_id: r for r, item_id in enumerate(self._ids)}
+            self._index = None
+
+    def _get_index(self):
+        if self._index is None:
+            if len(self._ids) >= self.ivf_threshold:
+                nlist = self.nlist or max(1, int(np.sqrt(len(self._ids))))
+                self._index = IVFIndex(self.dim, nlist=nlist, nprobe=self.nprobe)
+            else:
+                self._index = BruteForceIndex(self.dim)
+            self._index.build(self._vectors)
+        return self._index
+
+    def search(self, query, k=10, allowed=None, exclude=None):
+        """
+        按向量检索最相似的单品
+
+        Args:
+            query: (D,) 查询向量
+            allowed: 只在这些 id 中检索（如同一用户的衣橱），此时直接精确计算
+            exclude: 结果中排除的 id
+
+        Returns:
+            [(item_id, 相似度), ...]
+        """
+        with self._lock:
+            if not self._ids:
+                return []
+            extra = 1 if exclude is not None else 0
+            if allowed is not None:
+                rows = np.array([self._rows[i] for i in allowed if i in self._rows], dtype=np.int64)
+                if rows.size == 0:
+                    return []
+                scores = self._vectors[rows] @ _normalize(query)[0]
+                idx = _top_k(scores, k + extra)
+                rows, scores = rows[idx], scores[idx]
+            else:
+                rows, scores = self._get_index().search(query, k + extra)
+            results = [(self._ids[r], float(s)) for r, s in zip(rows, scores)]
+        if exclude is not None:
+            results = [(i, s) for i, s in results if i != exclude]
+        return results[:k]
+
+    def find_similar(self, item_id, k=10, allowed=None):
+        """与某件单品最相似的 k 件（不含自身）"""
+        with self._lock:
+            if item_id not in self._rows:
+                raise KeyError(f"Item {item_id} has no embedding")
+            query = self._vectors[self._rows[item_id]]
+        return self.search(query, k, allowed=allowed, exclude=item_id)
+
+    def save(self, index_dir):
+        """写入 embeddings.npy + index.json（先写临时文件再重命名，读取方不会看到写了一半的文件）"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            vectors = self._vectors
+            meta = {'dim': self.dim, 'model_version': self.model_version, 'ids': list(self._ids)}
+        tmp = index_dir / f'embeddings.{os.getpid()}.tmp.npy'
+        np.save(tmp, vectors)
+        os.replace(tmp, index_dir / 'embeddings.npy')
+        tmp = index_dir / f'index.{os.getpid()}.tmp.json'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, index_dir / 'index.json')
+
+    @classmethod
+    def load(cls, index_dir, **kwargs):
+        index_dir = Path(index_dir)
+        with open(index_dir / 'index.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(meta['dim'], model_version=meta.get('model_version'), **kwargs)
+        vectors = np.load(index_dir / 'embeddings.npy')
+        if len(meta['ids']):
+            index.add(meta['ids'], vectors)
+        return index
+
+
+class FeatureExtractor:
+    """
+    在模型前向时截取全局平均池化后的特征
+
+    优先挂在 global_pool 的输出上，否则挂在 classifier 的输入上；
+    同一次前向多次调用模型（如 TTA）时只保留第一次的特征。
+    """
+
+    def __init__(self, model):
+        self.features = None
+        if hasattr(model, 'global_pool'):
+            self._handle = model.global_pool.register_forward_hook(
+                lambda module, inputs, output: self._capture(output)
+            )
+        elif hasattr(model, 'classifier'):
+            self._handle = model.classifier.register_forward_pre_hook(
+                lambda module, inputs: self._capture(inputs[0])
+            )
+        else:
+            raise ValueError('Model has neither global_pool nor classifier to take features from')
+
+    def _capture(self, tensor):
+        if self.features is None:
+            self.features = tensor.detach().flatten(1)
+
+    def pop(self):
+        """取出并清空本次前向截取的特征"""
+        features, self.features = self.features, None
+        return features
+
+    def remove(self):
+        self._handle.remove()
+
+
+def embed_images(model, images, transform, device='cpu', batch_size=64):
+    """把 PIL 图片列表编码成 (N, D) 归一化向量"""
+    import torch
+
+    extractor = FeatureExtractor(model)
+    chunks = []
+    try:
+        with torch.no_grad():
+            for start in range(0, len(images), batch_size):
+                batch = torch.stack([
+                    transform(img.convert('RGB')) for img in images[start:start + batch_size]
+                ]).to(device)
+                extractor.pop()
+                model(batch)
+                chunks.append(extractor.pop().float().cpu().numpy())
+    finally:
+        extractor.remove()
+    return _normalize(np.concatenate(chunks)) if chunks else np.empty((0, 0), np.float32)
+
+
+def load_manifest(path, images_root=None):
+    """
+    读取 reembed 的单品清单，返回 [(单品 id, 图片路径), ...]
+
+    支持三种格式:
+    - JSON 对象: {"42": "wardrobe/a.jpg", ...}
+    - JSON 数组: [{"id": 42, "image": "wardrobe/a.jpg"}, ...]
+    - CSV: 含 id 和 image 两列
+
+    id 经 parse_item_id 转换（与上传时写入的数据库 id 一致）；相对路径以 images_root 为根。
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            pairs = [(row['id'], row['image']) for row in csv.DictReader(f)]
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            pairs = list(data.items())
+        else:
+            pairs = [(row['id'], row['image']) for row in data]
+    root = Path(images_root) if images_root else None
+    items = []
+    for item_id, image in pairs:
+        image = Path(image)
+        if root is not None and not image.is_absolute():
+            image = root / image
+        items.append((parse_item_id(item_id), image))
+    return items
+
+
+def reembed(items, index_dir, checkpoint, device='cpu', batch_size=64, images_root=None):
+    """
+    批量重算衣橱图片的向量并重建索引（模型更新后运行）
+
+    Args:
+        items: 清单文件路径（见 load_manifest），或 [(单品 id, 图片路径), ...]，
+               或返回这样的列表的函数（如从数据库查询）
+        images_root: 清单中相对路径的根目录（如 MEDIA_ROOT）
+    """
+    from PIL import Image
+
+    from inference_server import DEFAULT_TRANSFORM, load_classifier
+    from prediction_cache import model_version
+
+    if isinstance(items, (str, Path)):
+        items = load_manifest(items, images_root)
+    elif callable(items):
+        items = items()
+    items = [(parse_item_id(item_id), Path(path)) for item_id, path in items]
+
+    model, _ = load_classifier(checkpoint, device)
+    logger.info(f"Re-embedding {len(items)} items...")
+
+    index = None
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        ids, images = [], []
+        for item_id, path in chunk:
+            try:
+                images.append(Image.open(path))
+                ids.append(item_id)
+            except Exception as e:
+                logger.error(f"Error loading image {path} for item {item_id}: {e}")
+        if not images:
+            continue
+        vectors = embed_images(model, images, DEFAULT_TRANSFORM, device, batch_size)
+        if index is None:
+            index = EmbeddingIndex(vectors.shape[1], model_version=model_version(checkpoint))
+        index.add(ids, vectors)
+
+    if index is None:
+        logger.warning("No images embedded")
+        return None
+    index.save(index_dir)
+    logger.info(f"✅ Saved {len(index)} embeddings to {index_dir}")
+    return index
+
+
+_default_index = None
+_default_index_dir = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_index(index_dir=None):
+    """
+    进程内共享的单品向量索引
+
+    index_dir 默认取环境变量 FASHION_EMBEDDING_INDEX_DIR（默认 embeddings/）；
+    目录不存在时返回空索引，维度由第一次 add 的向量决定。
+    """
+    global _default_index, _default_index_dir
+    if _default_index is None:
+        with _default_lock:
+            if _default_index is None:
+                index_dir = Path(index_dir or os.environ.get('FASHION_EMBEDDING_INDEX_DIR', 'embeddings'))
+                if (index_dir / 'index.json').exists():
+                    _default_index = EmbeddingIndex.load(index_dir)
+                else:
+                    _default_index = EmbeddingIndex(0)
+                _default_index_dir = index_dir
+    return _default_index
+
+
+def add_item_embedding(item_id, embedding, save=True):
+    """
+    把新单品的向量加入共享索引（上传完成、单品入库后调用）
+
+    save=True 时立即写回索引目录，其他 worker 进程重启后也能检索到。
+    """
+    index = get_embedding_index()
+    index.add([parse_item_id(item_id)], [embedding])
+    if save:
+        index.save(_default_index_dir)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Wardrobe embedding index')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('reembed', help='Recompute embeddings for all wardrobe items')
+    p.add_argument('--manifest', required=True,
+                   help='JSON ({"<item id>": "<image path>"} or [{"id", "image"}]) or CSV (id,image)')
+    p.add_argument('--images-root', default=None, help='Root for relative image paths (e.g. MEDIA_ROOT)')
+    p.add_argument('--index-dir', default='embeddings')
+    p.add_argument('--checkpoint', default='fashion_classifier_best.pth')
+    p.add_argument('--batch-size', type=int, default=64)
+
+    p = sub.add_parser('similar', help='Find items similar to an item')
+    p.add_argument('--index-dir', default='embeddings')
+    p.add_argument('--item-id', required=True, type=parse_item_id)
+    p.add_argument('-k', type=int, default=10)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.command == 'reembed':
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        reembed(args.manifest, args.index_dir, args.checkpoint, device, args.batch_size,
+                images_root=args.images_root)
+    else:
+        index = EmbeddingIndex.load(args.index_dir)
+        for item_id, score in index.find_similar(args.item_id, args.k):
+            print(f"{item_id}\t{score:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""导出优化后的 FashionCNN 推理模型
+
+训练得到的 fashion_classifier_best.pth 需要 enhanced_classifier 中的类定义，
+并以 eager fp32 方式在 CPU 上运行。本脚本生成可直接部署的推理文件：
+
+- fashion_classifier_fp32.pt: 冻结的 TorchScript，BatchNorm 已折叠进卷积，去掉辅助分类头
+- fashion_classifier_int8.pt: int8 量化版本（静态量化用验证集的一部分校准，与评估样本不重叠）
+- fashion_classifier.onnx: 可选的 ONNX 图（需要安装 onnx）
+- export_report.json: 各版本的延迟、文件大小和相对 fp32 检查点的准确率变化
+
+使用方法:
+    python export_classifier.py --checkpoint fashion_classifier_best.pth --data-dir fashion_dataset
+    # 服务端加载（不需要 enhanced_classifier）
+    model = torch.jit.load('exported/fashion_classifier_int8.pt')
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from torch.utils.data import DataLoader, Subset
+
+from inference_server import DEFAULT_TRANSFORM, load_classifier
+
+logger = logging.getLogger(__name__)
+
+INPUT_SIZE = (1, 3, 224, 224)
+
+
+def strip_aux_head(model):
+    """去掉辅助分类头（只在训练时提供额外监督），推理图中不再计算它"""
+    if hasattr(model, 'aux_classifier'):
+        model.aux_classifier = nn.Identity()
+    return model
+
+
+def fold_batchnorm(module):
+    """
+    把 Sequential 中紧跟在 Conv2d 之后的 BatchNorm2d 折叠进卷积权重（原地修改，需 eval 模式）
+    """
+    for child in module.children():
+        fold_batchnorm(child)
+
+    if isinstance(module, nn.Sequential):
+        layers = list(module)
+        for i in range(len(layers) - 1):
+            conv, bn = layers[i], layers[i + 1]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                module[i] = fuse_conv_bn_eval(conv, bn)
+                module[i + 1] = nn.Identity()
+    return module
+
+
+def prepare_for_export(model):
+    """复制一份 eval 模式模型，去掉辅助头并折叠 BatchNorm"""
+    model = copy.deepcopy(model).cpu().eval()
+    return fold_batchnorm(strip_aux_head(model))
+
+
+def to_torchscript(model):
+    """trace 后冻结，常量折叠并删除未使用的分支"""
+    example = torch.randn(INPUT_SIZE)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced)
+
+
+def quantize_static(model, calibration_loader, num_batches):
+    """FX 图模式静态 int8 量化，用验证集的前 num_batches 个批次校准激活范围"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    torch.backends.quantized.engine = engine
+
+    example = (torch.randn(INPUT_SIZE),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example)
+    calibrated = 0
+    with torch.no_grad():
+        for i, (inputs, _) in enumerate(calibration_loader):
+            if i >= num_batches:
+                break
+            prepared(inputs)
+            calibrated += 1
+    if calibrated == 0:
+        # 未校准的观察器会给出无意义的量化参数
+        raise ValueError('Calibration loader produced no batches; cannot run static quantization')
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model):
+    """动态量化：只量化全连接层权重，不需要校准数据"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def export_onnx(model, path):
+    """导出 ONNX（批次维度可变）；缺少依赖时只记录日志"""
+    try:
+        torch.onnx.export(
+            model, (torch.randn(INPUT_SIZE),), path,
+            input_names=['input'], output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}}
+        )
+        logger.info(f"✅ ONNX model saved to {path}")
+        return True
+    except ImportError as e:
+        logger.error(f"ONNX export unavailable ({e}). Run: pip install onnx onnxscript")
+    except Exception as e:
+        logger.error(f"ONNX export failed: {e}")
+    return False
+
+
+def measure_latency(model, batch_size=1, warmup=10, runs=50):
+    """单批次前向延迟（毫秒），返回 (p50, 平均值)"""
+    inputs = torch.randn(batch_size, *INPUT_SIZE[1:])
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(inputs)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], sum(timings) / len(timings)
+
+
+def evaluate(model, loader):
+    """在验证子集上计算 top-1 准确率"""
+    correct = total = 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            correct += model(inputs).argmax(1).eq(labels).sum().item()
+            total += labels.size(0)
+    return 100. * correct / max(total, 1)
+
+
+def build_val_loaders(data_dir, class_names, eval_samples, calibration_samples, batch_size):
+    """
+    验证集中互不重叠的校准子集和评估子集（与训练时相同的预处理）
+
+    Returns:
+        (calibration_loader, eval_loader)；val/ 不存在或没有按类别目录存放的图片时均为 None
+    """
+    from train_fashion_classifier import FashionDataset
+
+    val_dir = Path(data_dir) / 'val'
+    if not val_dir.exists():
+        return None, None
+    class_to_idx = {name: i for i, name in enumerate(class_names)}
+    dataset = FashionDataset(val_dir, transform=DEFAULT_TRANSFORM, class_to_idx=class_to_idx)
+    if len(dataset) == 0:
+        logger.warning(f"No class folders with images in {val_dir} (shards format is not supported here)")
+        return None, None
+
+    # 固定种子打乱后切分，两个子集都覆盖所有类别且不重叠（数据太少时校准最多用一半）
+    order = list(range(len(dataset)))
+    random.Random(0).shuffle(order)
+    n_calibration = min(calibration_samples, len(order) // 2) if len(order) > 1 else 0
+    calibration = order[:n_calibration]
+    evaluation = order[n_calibration:]
+    if eval_samples:
+        evaluation = evaluation[:eval_samples]
+
+    def loader(indices):
+        if not indices:
+            return None
+        return DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False, num_workers=0)
+
+    return loader(calibration), loader(evaluation)
+
+
+def export_all(checkpoint, output_dir='exported', data_dir=None, quantization='static',
+               calibration_batches=10, eval_samples=1000, batch_size=32, onnx=False):
+    """
+    导出 fp32 TorchScript / int8 TorchScript（/ ONNX），并生成对比报告
+
+    Returns:
+        报告字典（同时写入 output_dir/export_report.json）
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    model, class_names = load_classifier(checkpoint, 'cpu')
+    calibration_loader, val_loader = (
+        build_val_loaders(data_dir, class_names, eval_samples, calibration_batches * batch_size, batch_size)
+        if data_dir else (None, None)
+    )
+    if quantization == 'static' and calibration_loader is None:
+        logger.warning("No validation data for calibration, falling back to dynamic quantization")
+        quantization = 'dynamic'
+
+    # 类别名随模型一起保存，加载时不需要 enhanced_classifier
+    extra_files = {'class_names.json': json.dumps(class_names)}
+
+    # fp32：去辅助头 + 折叠 BN 后冻结
+    fp32 = prepare_for_export(model)
+    fp32_path = output_dir / 'fashion_classifier_fp32.pt'
+    scripted_fp32 = to_torchscript(fp32)
+    scripted_fp32.save(str(fp32_path), _extra_files=extra_files)
+    logger.info(f"✅ TorchScript fp32 model saved to {fp32_path}")
+
+    # int8
+    if quantization == 'static':
+        quantized = quantize_static(prepare_for_export(model), calibration_loader, calibration_batches)
+    else:
+        quantized = quantize_dynamic(prepare_for_export(model))
+    int8_path = output_dir / 'fashion_classifier_int8.pt'
+    scripted_int8 = to_torchscript(quantized)
+    scripted_int8.save(str(int8_path), _extra_files=extra_files)
+    logger.info(f"✅ TorchScript int8 ({quantization}) model saved to {int8_path}")
+
+    if onnx:
+        export_onnx(fp32, str(output_dir / 'fashion_classifier.onnx'))
+
+    # 对比报告
+    variants = {
+        'checkpoint_fp32': (model.eval(), checkpoint),
+        'torchscript_fp32': (scripted_fp32, fp32_path),
+        f'torchscript_int8_{quantization}': (scripted_int8, int8_path),
+    }
+    report = {'checkpoint': str(checkpoint), 'quantization': quantization, 'variants': {}}
+    baseline_acc = None
+    for name, (variant, path) in variants.items():
+        p50, mean = measure_latency(variant)
+        entry = {
+            'size_mb': os.path.getsize(path) / 1024 / 1024,
+            'latency_ms_p50': p50,
+            'latency_ms_mean': mean,
+        }
+        if val_loader is not None:
+            acc = evaluate(variant, val_loader)
+            baseline_acc = acc if baseline_acc is None else baseline_acc
+            entry['accuracy'] = acc
+            entry['accuracy_delta'] = acc - baseline_acc
+        report['variants'][name] = entry
+
+        logger.info(
+            f"  {name:28s}: {entry['size_mb']:.1f} MB, p50 {p50:.2f} ms"
+            + (f", acc {entry['accuracy']:.2f}% ({entry['accuracy_delta']:+.2f})" if 'accuracy' in entry else '')
+        )
+
+    with open(output_dir / 'export_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Export optimized fashion classifier')
+    parser.add_argument('--checkpoint', default='fashion_classifier_best.pth', help='Trained checkpoint')
+    parser.add_argument('--output-dir', default='exported', help='Where to write exported models')
+    parser.add_argument('--data-dir', default='fashion_dataset', help='Dataset root (uses val/)')
+    parser.add_argument(
+        '--quantization',
+        choices=['static', 'dynamic'],
+        default='static',
+        help='static: int8 convs + linears calibrated on val; dynamic: int8 linears only'
+    )
+    parser.add_argument('--calibration-batches', type=int, default=10)
+    parser.add_argument('--eval-samples', type=int, default=1000,
+                        help='Validation images used for the accuracy comparison')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--onnx', action='store_true', help='Also export ONNX')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    export_all(
+        args.checkpoint, args.output_dir, data_dir=args.data_dir,
+        quantization=args.quantization, calibration_batches=args.calibration_batches,
+        eval_samples=args.eval_samples, batch_size=args.batch_size, onnx=args.onnx
+    )
+
+
+if __name__ == '__main__':
+    main()
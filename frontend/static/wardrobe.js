@@ -1,7 +1,15 @@
 // wardrobe.js - 我的衣橱页面
 let currentUser = null;
 let currentFilter = 'all';
-let uploadedFile = null;
+let uploadedFiles = [];
+
+// 分页状态：游标由 GET /api/wardrobe 返回，滚动到底部时加载下一页
+const PAGE_SIZE = 24;
+const LIST_FIELDS = 'id,name,category,category_group,colors,image_url,thumbnails';
+let nextCursor = null;
+let loadingPage = false;
+let pageRequestId = 0;
+let pageObserver = null;
 
 // ========== 工具函数 ==========
 function getCookie(name) {
@@ -76,11 +84,65 @@ async function loadWardrobe() {
     return;
   }
   
-  const data = await fetchJSON('/api/wardrobe');
-  if (data.success && data.data) {
-    renderWardrobe(data.data.items || []);
-    updateStats(data.data.items || []);
+  nextCursor = null;
+  document.getElementById('wardrobe-grid').innerHTML = '';
+  await loadNextPage(true);
+}
+
+async function loadNextPage(first = false) {
+  if (!first && (loadingPage || !nextCursor)) return;
+  loadingPage = true;
+  // 切换分类或重新登录后，丢弃还在路上的旧请求结果
+  const requestId = ++pageRequestId;
+
+  const params = new URLSearchParams({ limit: PAGE_SIZE, fields: LIST_FIELDS });
+  if (currentFilter !== 'all') params.set('group', currentFilter);
+  if (!first) params.set('cursor', nextCursor);
+
+  try {
+    const data = await fetchJSON(`/api/wardrobe?${params}`);
+    if (requestId !== pageRequestId || !(data.success && data.data)) return;
+    const items = data.data.items || [];
+    nextCursor = data.data.next_cursor || null;
+    renderWardrobe(items, !first);
+    if (first) {
+      const stats = data.data.stats;
+      if (stats) {
+        document.getElementById('total-items').textContent = stats.total;
+        document.getElementById('total-categories').textContent = stats.categories;
+        document.getElementById('total-colors').textContent = stats.colors;
+      } else {
+        updateStats(items);
+      }
+    }
+  } finally {
+    if (requestId === pageRequestId) loadingPage = false;
   }
+  observePageEnd();
+}
+
+function observePageEnd() {
+  const grid = document.getElementById('wardrobe-grid');
+  let sentinel = document.getElementById('wardrobe-sentinel');
+  if (!sentinel) {
+    sentinel = document.createElement('div');
+    sentinel.id = 'wardrobe-sentinel';
+    grid.after(sentinel);
+  }
+  if (!('IntersectionObserver' in window)) {
+    // 不支持时一次加载剩余页
+    if (nextCursor) loadNextPage();
+    return;
+  }
+  if (!pageObserver) {
+    pageObserver = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) loadNextPage();
+    }, { rootMargin: '600px' });
+    pageObserver.observe(sentinel);
+  }
+  // 第一页不足一屏时哨兵一直可见，不会再次触发回调，需要主动继续加载
+  const rect = sentinel.getBoundingClientRect();
+  if (nextCursor && rect.top < window.innerHeight + 600) loadNextPage();
 }
 
 // ========== 更新统计信息 ==========
@@ -107,13 +169,28 @@ function updateStats(items, categories, colors) {
   document.getElementById('total-colors').textContent = colors;
 }
 
-function renderWardrobe(items) {
+function thumbnailAttrs(item) {
+  // 缩略图尚未生成时回退到原图
+  const thumbs = item.thumbnails || {};
+  const sizes = Object.keys(thumbs).map(Number).sort((a, b) => a - b);
+  if (!sizes.length) return `src="${item.image_url}"`;
+  const src = thumbs['320'] || thumbs[String(sizes[sizes.length - 1])];
+  const srcset = sizes.map(size => `${thumbs[String(size)]} ${size}w`).join(', ');
+  return `src="${src}" srcset="${srcset}" sizes="(max-width: 600px) 50vw, 280px"`;
+}
+
+function renderWardrobe(items, append = false) {
   const grid = document.getElementById('wardrobe-grid');
   
-  // 筛选
+  // 分类筛选由服务端完成（group 参数），这里只保留兼容旧接口的过滤
   let filteredItems = items;
   if (currentFilter !== 'all') {
-    filteredItems = items.filter(item => item.category_group === currentFilter);
+    filteredItems = items.filter(item => !item.category_group || item.category_group === currentFilter);
+  }
+  
+  if (append) {
+    grid.insertAdjacentHTML('beforeend', filteredItems.map(renderItemCard).join(''));
+    return;
   }
   
   if (filteredItems.length === 0) {
@@ -127,10 +204,14 @@ function renderWardrobe(items) {
     return;
   }
   
-  grid.innerHTML = filteredItems.map(item => `
+  grid.innerHTML = filteredItems.map(renderItemCard).join('');
+}
+
+function renderItemCard(item) {
+  return `
     <div class="wardrobe-item">
       <div class="item-image">
-        <img src="${item.image_url}" alt="${item.name}" onerror="this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22300%22 height=%22400%22%3E%3Crect width=%22300%22 height=%22400%22 fill=%22%23f0f0f0%22/%3E%3Ctext x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 fill=%22%23999%22%3E${item.name}%3C/text%3E%3C/svg%3E'">
+        <img ${thumbnailAttrs(item)} alt="${item.name}" loading="lazy" decoding="async" onerror="this.removeAttribute('srcset');this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22300%22 height=%22400%22%3E%3Crect width=%22300%22 height=%22400%22 fill=%22%23f0f0f0%22/%3E%3Ctext x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 fill=%22%23999%22%3E${item.name}%3C/text%3E%3C/svg%3E'">
         <div class="item-category">${getCategoryLabel(item.category)}</div>
       </div>
       <div class="item-info">
@@ -143,7 +224,7 @@ function renderWardrobe(items) {
       </div>
       <button class="btn btn-ghost btn-sm" onclick="deleteItem(${item.id})">删除</button>
     </div>
-  `).join('');
+  `;
 }
 
 function getCategoryLabel(category) {
@@ -208,9 +289,9 @@ function setupUpload() {
   placeholder.addEventListener('drop', (e) => {
     e.preventDefault();
     placeholder.style.background = '';
-    const file = e.dataTransfer.files[0];
-    if (file && file.type.startsWith('image/')) {
-      handleFileSelect(file);
+    const files = Array.from(e.dataTransfer.files).filter(f => f.type.startsWith('image/'));
+    if (files.length) {
+      handleFileSelect(files);
     } else {
       alert('请上传图片文件');
     }
@@ -218,21 +299,26 @@ function setupUpload() {
   
   // 文件选择
   fileInput.addEventListener('change', (e) => {
-    const file = e.target.files[0];
-    if (file) {
-      handleFileSelect(file);
+    const files = Array.from(e.target.files);
+    if (files.length) {
+      handleFileSelect(files);
     }
   });
   
   // 处理文件选择
-  function handleFileSelect(file) {
+  function handleFileSelect(files) {
     // 检查文件大小（限制10MB）
-    if (file.size > 10 * 1024 * 1024) {
-      alert('图片大小不能超过10MB');
-      return;
+    const tooLarge = files.filter(f => f.size > 10 * 1024 * 1024);
+    if (tooLarge.length) {
+      alert(`图片大小不能超过10MB，已跳过：${tooLarge.map(f => f.name).join('、')}`);
     }
+    files = files.filter(f => f.size <= 10 * 1024 * 1024);
+    if (!files.length) return;
     
-    uploadedFile = file;
+    uploadedFiles = files;
+    document.getElementById('upload-summary').textContent =
+      files.length > 1 ? `已选择 ${files.length} 张图片（预览第一张）` : '';
+    const file = files[0];
     const reader = new FileReader();
     reader.onload = (e) => {
       previewImage.src = e.target.result;
@@ -247,17 +333,23 @@ function setupUpload() {
   
   // 确认上传
   confirmBtn.addEventListener('click', async () => {
-    if (!uploadedFile) return;
+    if (!uploadedFiles.length) return;
     
+    // 异步模式：服务端立即返回批次 ID，后台完成分类和颜色分析
     const formData = new FormData();
-    formData.append('image', uploadedFile);
-    formData.append('name', uploadedFile.name.split('.')[0]);
+    // 单张沿用 image 字段（兼容同步接口），多张用 images 字段
+    if (uploadedFiles.length === 1) {
+      formData.append('image', uploadedFiles[0]);
+      formData.append('name', uploadedFiles[0].name.split('.')[0]);
+    } else {
+      uploadedFiles.forEach(file => formData.append('images', file));
+    }
     
     confirmBtn.disabled = true;
     confirmBtn.textContent = '🔄 上传中...';
     
     try {
-      const resp = await fetch('/api/wardrobe/upload', {
+      const resp = await fetch('/api/wardrobe/upload?async=1', {
         method: 'POST',
         headers: { 'X-CSRFToken': getCookie('csrftoken') },
         body: formData,
@@ -270,7 +362,18 @@ function setupUpload() {
       
       const data = await resp.json();
       
-      if (data.success && data.data) {
+      if (data.success && data.data && data.data.batch_id) {
+        const batch = await pollUploadBatch(data.data.batch_id, confirmBtn);
+        let message = `✅ 已导入 ${batch.counts.done} 件`;
+        const failed = batch.jobs.filter(job => job.status === 'failed');
+        if (failed.length) {
+          message += `\n❌ ${failed.length} 张失败：${failed.map(job => job.filename).join('、')}`;
+        }
+        alert(message);
+        resetUpload();
+        await loadWardrobe();
+      } else if (data.success && data.data) {
+        // 服务端未启用异步模式时直接返回单品
         const item = data.data.item;
         const classification = data.data.classification;
         const confidence = classification.confidence || 0;
@@ -302,8 +405,24 @@ function setupUpload() {
   cancelBtn.addEventListener('click', resetUpload);
 }
 
+// 轮询批次进度，全部完成（成功或失败）后返回批次状态
+async function pollUploadBatch(batchId, button) {
+  for (;;) {
+    const data = await fetchJSON(`/api/wardrobe/batches/${batchId}`);
+    if (!(data.success && data.data)) {
+      throw new Error(data.message || '查询上传进度失败');
+    }
+    const batch = data.data;
+    const finished = batch.counts.done + batch.counts.failed;
+    button.textContent = `🔄 处理中 ${finished}/${batch.total}（${Math.round(batch.progress * 100)}%）`;
+    if (batch.finished) return batch;
+    await new Promise(resolve => setTimeout(resolve, 1000));
+  }
+}
+
 function resetUpload() {
-  uploadedFile = null;
+  uploadedFiles = [];
+  document.getElementById('upload-summary').textContent = '';
   document.getElementById('image-upload').value = '';
   document.getElementById('upload-area').classList.add('hidden');
   document.getElementById('preview-area').classList.add('hidden');
@@ -0,0 +1,379 @@
+"""服装分类批量推理服务
+
+上传接口（POST /api/wardrobe/upload）在并发时每个请求各自做一次单张图片的前向传播。
+BatchedClassifier 在进程内维护一个请求队列：请求线程完成预处理后把张量放入队列，
+后台线程把等待中的请求合并成微批次（不超过 max_batch_size，最多等待 max_wait_ms），
+一次前向传播后把结果分发回各自的 Future。
+
+用法:
+    from inference_server import get_classifier, classify_upload
+    result = get_classifier().classify(pil_image)
+    # {'category': 'shirt', 'confidence': 0.87, 'top5': [('shirt', 0.87), ...]}
+    result, cached = classify_upload(image_bytes)  # 重复上传直接命中缓存
+
+压测（模拟并发上传，对比逐张推理）:
+    python inference_server.py --checkpoint fashion_classifier_best.pth --concurrency 32
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from instrumentation import metrics
+from tta import tta_logits
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = 'fashion_classifier_best.pth'
+
+# 与 train_fashion_classifier.py 的验证集预处理保持一致
+DEFAULT_TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+
+def load_classifier(checkpoint=DEFAULT_CHECKPOINT, device='cpu'):
+    """
+    加载训练好的 FashionCNN
+
+    支持 fashion_classifier_best.pth（含 model_state_dict 的字典）
+    和 fashion_classifier_final.pth（整个模型对象）两种格式。
+
+    Returns:
+        (model, class_names)
+    """
+    from enhanced_classifier import FashionCNN, GARMENT_CLASSES
+
+    if not os.path.exists(checkpoint):
+        raise FileNotFoundError(f"Checkpoint not found: {checkpoint}")
+
+    state = torch.load(checkpoint, map_location='cpu', weights_only=False)
+    if isinstance(state, torch.nn.Module):
+        model = state
+        class_names = list(GARMENT_CLASSES)
+    else:
+        class_names = list(state.get('class_names', GARMENT_CLASSES))
+        model = FashionCNN(num_classes=len(class_names))
+        model.load_state_dict(state['model_state_dict'])
+
+    model.to(device).eval()
+    logger.info(f"Loaded classifier from {checkpoint} ({len(class_names)} classes)")
+    return model, class_names
+
+
+class _Request:
+    __slots__ = ('tensor', 'future', 'enqueued')
+
+    def __init__(self, tensor, future):
+        self.tensor = tensor
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class BatchedClassifier:
+    """
+    动态微批次分类器
+
+    Args:
+        model: eval 模式下返回 logits 的模型
+        class_names: 类别名列表，与模型输出一一对应
+        device: 推理设备
+        max_batch_size: 单个批次最多合并的请求数
+        max_wait_ms: 第一个请求到达后最多等待多久再开始前向传播
+        max_queue: 队列容量，超出时 submit() 直接报错，避免请求无限堆积
+        transform: PIL 图片预处理，在调用方线程中执行
+        top_k: 返回的候选类别数
+        tta: 测试时增强模式（'none' / 'flip' / 'flip_crop'），视图与批次一起前向
+        tta_margin: 只对 top-1/top-2 概率差小于该值的图片做 TTA
+        embeddings: 结果中附带全局平均池化特征（'embedding'，已 L2 归一化），供相似单品检索
+    """
+
+    def __init__(self, model, class_names, device='cpu', max_batch_size=32,
+                 max_wait_ms=10, max_queue=1024, transform=None, top_k=5,
+                 tta='none', tta_margin=None, embeddings=False):
+        self.model = model
+        self._extractor = None
+        if embeddings:
+            from embedding_index import FeatureExtractor
+            self._extractor = FeatureExtractor(model)
+        self.tta = tta
+        self.tta_margin = tta_margin
+        self.class_names = list(class_names)
+        self.device = torch.device(device)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.transform = transform or DEFAULT_TRANSFORM
+        self.top_k = min(top_k, len(self.class_names))
+
+        # 队列本身不设上限，由 submit 在锁内检查 max_queue，close 放入关闭信号时不会阻塞
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._max_queue_depth = 0
+        self._wait_time = 0.0
+        self._forward_time = 0.0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name='batched-classifier', daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """
+        提交一张图片（PIL 图片或已预处理的 (3, H, W) 张量）
+
+        Returns:
+            concurrent.futures.Future，结果为 {'category', 'confidence', 'top5'}
+        """
+        if self._closed:
+            raise RuntimeError('BatchedClassifier is closed')
+        if isinstance(image, Image.Image):
+            tensor = self.transform(image.convert('RGB'))
+        else:
+            tensor = image
+
+        future = Future()
+        # 检查与入队在同一把锁内：close() 之后不会再有请求排在关闭信号后面
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError('BatchedClassifier is closed')
+            if self._queue.qsize() >= self.max_queue:
+                raise RuntimeError('Inference queue is full')
+            self._queue.put_nowait(_Request(tensor, future))
+            depth = self._queue.qsize()
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return future
+
+    def classify(self, image, timeout=None):
+        """同步分类一张图片"""
+        return self.submit(image).result(timeout=timeout)
+
+    def _collect(self):
+        """阻塞等待第一个请求，再在 max_wait 内尽量凑满一个批次"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 关闭信号：先处理完当前批次
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # 调用方可能已取消
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                inputs = torch.stack([r.tensor for r in batch]).to(self.device)
+                with torch.no_grad():
+                    logits, _ = tta_logits(self.model, inputs, self.tta, self.tta_margin)
+                    probs = torch.softmax(logits.float(), dim=1)
+                top_probs, top_idx = probs.topk(self.top_k, dim=1)
+                top_probs, top_idx = top_probs.cpu().tolist(), top_idx.cpu().tolist()
+                embeddings = [None] * len(batch)
+                if self._extractor is not None:
+                    features = torch.nn.functional.normalize(self._extractor.pop().float(), dim=1)
+                    embeddings = features.cpu().tolist()
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                if self._extractor is not None:
+                    self._extractor.pop()
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            end = time.perf_counter()
+
+            for r, p, idx, embedding in zip(batch, top_probs, top_idx, embeddings):
+                top = [(self.class_names[i], prob) for i, prob in zip(idx, p)]
+                result = {
+                    'category': top[0][0],
+                    'confidence': top[0][1],
+                    'top5': top,
+                }
+                if embedding is not None:
+                    result['embedding'] = embedding
+                r.future.set_result(result)
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._requests += len(batch)
+                self._wait_time += sum(start - r.enqueued for r in batch)
+                self._forward_time += end - start
+            metrics.observe('fashion_classifier_batch_forward_seconds', end - start)
+            metrics.inc('fashion_classifier_batched_requests_total', len(batch))
+
+    def stats(self):
+        """队列深度和批次统计"""
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': batches,
+                'avg_batch_size': self._requests / batches if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'avg_queue_wait_ms': 1000 * self._wait_time / self._requests if self._requests else 0.0,
+                'avg_forward_ms': 1000 * self._forward_time / batches if batches else 0.0,
+            }
+
+    def close(self):
+        """处理完已排队的请求后停止后台线程；仍未完成的请求以 RuntimeError 结束"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put_nowait(None)
+        self._thread.join()
+
+        # 后台线程异常退出时队列中可能还有请求，不能让调用方无限等待
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item.future.set_running_or_notify_cancel():
+                item.future.set_exception(RuntimeError('BatchedClassifier is closed'))
+
+
+_default_classifier = None
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_classifier(checkpoint=None, device=None, **kwargs):
+    """
+    进程内共享的 BatchedClassifier（首次调用时加载模型）
+
+    checkpoint / device 默认取环境变量 FASHION_CLASSIFIER_CHECKPOINT / FASHION_CLASSIFIER_DEVICE；
+    FASHION_CLASSIFIER_TTA / FASHION_CLASSIFIER_TTA_MARGIN 开启测试时增强；
+    FASHION_CLASSIFIER_EMBEDDINGS=1 时结果附带单品向量。
+    """
+    global _default_classifier
+    if _default_classifier is None:
+        with _default_lock:
+            if _default_classifier is None:
+                checkpoint = checkpoint or os.environ.get('FASHION_CLASSIFIER_CHECKPOINT', DEFAULT_CHECKPOINT)
+                device = device or os.environ.get(
+                    'FASHION_CLASSIFIER_DEVICE', 'cuda' if torch.cuda.is_available() else 'cpu'
+                )
+                model, class_names = load_classifier(checkpoint, device)
+                kwargs.setdefault('tta', os.environ.get('FASHION_CLASSIFIER_TTA', 'none'))
+                kwargs.setdefault('embeddings', os.environ.get('FASHION_CLASSIFIER_EMBEDDINGS') == '1')
+                if os.environ.get('FASHION_CLASSIFIER_TTA_MARGIN'):
+                    kwargs.setdefault('tta_margin', float(os.environ['FASHION_CLASSIFIER_TTA_MARGIN']))
+                classifier = BatchedClassifier(model, class_names, device=device, **kwargs)
+                classifier.checkpoint = checkpoint
+                _default_classifier = classifier
+    return _default_classifier
+
+
+def get_prediction_cache():
+    """
+    与 get_classifier() 的模型版本绑定的分类结果缓存
+
+    环境变量 FASHION_PREDICTION_CACHE_DB 指定 SQLite 文件（不设置则只用内存），
+    FASHION_PREDICTION_CACHE_PHASH=1 启用感知哈希近似重复检测。
+    """
+    global _default_cache
+    classifier = get_classifier()
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                from prediction_cache import PredictionCache, model_version
+                _default_cache = PredictionCache(
+                    model_version(classifier.checkpoint),
+                    db_path=os.environ.get('FASHION_PREDICTION_CACHE_DB') or None,
+                    use_phash=os.environ.get('FASHION_PREDICTION_CACHE_PHASH') == '1'
+                )
+    return _default_cache
+
+
+def classify_upload(data):
+    """
+    分类上传的图片字节，重复图片直接返回缓存结果
+
+    Returns:
+        (结果, 是否命中缓存)
+    """
+    classifier = get_classifier()
+    return get_prediction_cache().get_or_compute(data, classifier.classify)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Benchmark batched fashion classifier inference')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Model checkpoint')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent request threads')
+    parser.add_argument('--requests', type=int, default=512, help='Total requests to send')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    model, class_names = load_classifier(args.checkpoint, args.device)
+    image = Image.new('RGB', (400, 600), (128, 96, 64))
+    tensor = DEFAULT_TRANSFORM(image)
+
+    def run(fn):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(fn, range(args.requests)))
+        return args.requests / (time.perf_counter() - start)
+
+    # 基线：每个请求单独做一次前向传播
+    def single(_):
+        with torch.no_grad():
+            model(tensor.unsqueeze(0).to(args.device))
+
+    baseline = run(single)
+    logger.info(f"Per-request inference: {baseline:.1f} images/sec")
+
+    classifier = BatchedClassifier(
+        model, class_names, device=args.device,
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms
+    )
+    batched = run(lambda _: classifier.classify(tensor))
+    classifier.close()
+
+    logger.info(f"Batched inference: {batched:.1f} images/sec ({batched / baseline:.2f}x)")
+    for key, value in classifier.stats().items():
+        logger.info(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""训练与推理热路径的计时、计数和性能剖析
+
+用法:
+    from instrumentation import metrics
+    with metrics.timer('fashion_train_forward_seconds'):
+        outputs = model(inputs)
+    metrics.inc('fashion_classifier_requests_total', backend='enhanced')
+
+- 默认关闭（FASHION_METRICS=1 或 metrics.enable() 开启）；关闭时 timer() 返回共享的空上下文，
+  inc() / observe() 直接返回，只多一次属性判断
+- 计时按 Prometheus 直方图保存（固定桶 + sum + count），render_prometheus() 生成 /metrics 文本，
+  write_jsonl() 把快照追加到 JSONL 供离线分析；训练进程可用 serve() 起一个 /metrics 端口
+- StepProfiler 在指定的 N 个 step 上开启 torch.profiler（Chrome trace）或 cProfile（.prof）
+
+注意 DataLoader worker 是独立进程，数据集读取 / 预处理的计时只在 num_workers=0 时汇总到主进程。
+"""
+import bisect
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 秒：覆盖单张解码（毫秒级）到整次检查点写入（秒级）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NullTimer:
+    """关闭时使用的空上下文（全局唯一实例，不分配对象）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, registry, name, labels, sync):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.sync = sync
+
+    def __enter__(self):
+        if self.sync is not None:
+            self.sync()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.sync is not None:
+            self.sync()
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    """Prometheus 标签值转义：反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return '{' + body + '}'
+
+
+class MetricsRegistry:
+    """
+    进程内的计时器和计数器
+
+    Args:
+        enabled: 是否记录
+        buckets: 直方图桶上界（秒）
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def timer(self, name, sync=None, **labels):
+        """
+        计时上下文
+
+        Args:
+            sync: 开始和结束时调用的同步函数（如 torch.cuda.synchronize），
+                  让 GPU 异步执行的耗时计入正确的阶段；只在开启时调用
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels, sync)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """当前所有指标：{'timers': {名称{标签}: {count, sum, mean, max}}, 'counters': {...}}"""
+        with self._lock:
+            timers = {
+                name + _format_labels(key): {
+                    'count': h.count,
+                    'sum': h.sum,
+                    'mean': h.sum / h.count if h.count else 0.0,
+                    'max': h.max,
+                }
+                for (name, key), h in sorted(self._histograms.items())
+            }
+            counters = {
+                name + _format_labels(key): value
+                for (name, key), value in sorted(self._counters.items())
+            }
+        return {'timers': timers, 'counters': counters}
+
+    def render_prometheus(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+            typed = set()
+            for (name, key), h in histograms:
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(key, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {h.sum}')
+                lines.append(f'{name}_count{_format_labels(key)} {h.count}')
+            for (name, key), value in counters:
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_jsonl(self, path, **extra):
+        """把当前快照追加一行到 JSONL（extra 为附加字段，如 epoch）"""
+        if not self.enabled:
+            return
+        record = {'time': time.time(), **extra, **self.snapshot()}
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        在后台线程提供 GET /metrics（训练等没有 web 框架的进程使用）
+
+        默认只监听本机；Prometheus 在其他机器上抓取时显式传入 host='0.0.0.0'。
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+metrics = MetricsRegistry(enabled=os.environ.get('FASHION_METRICS', '').lower() in ('1', 'true', 'yes'))
+
+
+def timed(name, **labels):
+    """函数计时装饰器；关闭时只多一次判断"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            with metrics.timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StepProfiler:
+    """
+    只在 N 个 step 上开启的性能剖析
+
+    跳过前 wait 个 step（数据加载预热、cudnn 选算法）后记录 steps 个 step：
+    kind='torch' 写 Chrome trace（chrome://tracing 或 Perfetto 打开），
+    kind='cprofile' 写 .prof（snakeviz / pstats 查看）并打印累计耗时前 20 的函数。
+
+    用法:
+        profiler = StepProfiler('torch', steps=20, output_dir='profiles')
+        for batch in loader:
+            ...
+            profiler.step()
+        profiler.stop()
+    """
+
+    def __init__(self, kind='torch', steps=20, output_dir='profiles', wait=5):
+        if kind not in ('torch', 'cprofile'):
+            raise ValueError(f"Unknown profiler '{kind}', expected 'torch' or 'cprofile'")
+        self.kind = kind
+        self.steps = steps
+        self.wait = wait
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.path = None
+        self._step = 0
+        self._done = False
+        self._torch_profiler = None
+        self._cprofile = None
+        self._captured = False
+
+        if kind == 'torch':
+            import torch
+
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.path = self.output_dir / f'trace_{time.strftime("%Y%m%d_%H%M%S")}.json'
+            self._torch_profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=wait, warmup=1, active=steps, repeat=1),
+                on_trace_ready=lambda p: p.export_chrome_trace(str(self.path)),
+                record_shapes=True,
+            )
+            self._torch_profiler.start()
+        else:
+            self.path = self.output_dir / f'profile_{time.strftime("%Y%m%d_%H%M%S")}.prof'
+            self._cprofile = cProfile.Profile()
+
+    @property
+    def done(self):
+        return self._done
+
+    def step(self):
+        if self._done:
+            return
+        self._step += 1
+        if self._torch_profiler is not None:
+            self._torch_profiler.step()
+            # 预热 1 步之后进入记录阶段
+            self._captured = self._step > self.wait + 1
+            if self._step >= self.wait + 1 + self.steps:
+                self.stop()
+        else:
+            if self._step == self.wait:
+                self._cprofile.enable()
+                self._captured = True
+            elif self._step == self.wait + self.steps:
+                self.stop()
+
+    def stop(self):
+        """结束剖析并写文件（step 数不足时写出已记录的部分，还没开始记录时不写文件）"""
+        if self._done:
+            return
+        self._done = True
+        if self._torch_profiler is not None:
+            self._torch_profiler.stop()
+        elif self._captured:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(str(self.path))
+            stats = pstats.Stats(self._cprofile).sort_stats('cumulative')
+            stats.print_stats(20)
+        if not self._captured:
+            logger.warning(
+                f"Profiler stopped after {self._step} steps, before the {self.wait} warm-up steps "
+                f"finished; no profile written"
+            )
+        elif self.path.exists():
+            logger.info(f"✅ Profile written to {self.path}")
@@ -0,0 +1,448 @@
+"""向量化的穿搭组合评分引擎
+
+/api/recommendations 返回的色彩、体型、年龄得分（main.js / recommendations.js 渲染为得分条）
+如果逐个枚举 上衣 × 下装 × 外套 × 鞋 的组合，计算量随衣橱大小呈组合爆炸。这里：
+
+1. 把单品属性（类别、主色、季节）整理成 NumPy 数组，单品自身的得分（体型、年龄、季节）一次算完
+2. 按类别约束分槽位，每个槽位只保留单品得分最高的 max_per_slot 件（剪枝）
+3. 色彩搭配得分用广播一次算出两两槽位之间的矩阵，组合总分按上衣分块广播求和
+4. 每块只取前 k 个放进小顶堆，超出延迟预算时提前停止（上衣按单品得分降序，先算最有希望的）
+
+用法:
+    from outfit_scoring import recommend_outfits
+    results = recommend_outfits(items, {'body_shape': 'A', 'age': 28, 'skin_season': 'autumn'}, k=10)
+
+基准测试（50 / 500 / 5000 件的合成衣橱）:
+    python outfit_scoring.py --bench
+"""
+import argparse
+import heapq
+import json
+import logging
+import time
+
+import numpy as np
+
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# 与 UPLOAD_FEATURE.md 中的分类保持一致
+CATEGORY_GROUPS = {
+    'tops': ['tshirt', 'shirt', 'blouse', 'sweater', 'hoodie'],
+    'outerwear': ['coat', 'jacket', 'blazer', 'cardigan', 'down_jacket'],
+    'bottoms': ['jeans', 'pants', 'shorts', 'skirt'],
+    'dresses': ['dress', 'jumpsuit'],
+    'shoes': ['shoes'],
+    'others': ['accessory'],
+}
+CATEGORY_TO_GROUP = {c: g for g, cats in CATEGORY_GROUPS.items() for c in cats}
+
+SEASONS = ['spring', 'summer', 'autumn', 'winter']
+
+# 体型 × 类别的适配度（未列出的为 0.7）
+BODY_SHAPE_SCORES = {
+    'A': {'blazer': 0.9, 'jacket': 0.85, 'shirt': 0.85, 'blouse': 0.85, 'skirt': 0.9,
+          'pants': 0.8, 'dress': 0.85, 'shorts': 0.5, 'jeans': 0.6},
+    'H': {'blazer': 0.8, 'cardigan': 0.8, 'dress': 0.85, 'skirt': 0.8, 'jumpsuit': 0.8,
+          'hoodie': 0.6},
+    'X': {'dress': 0.95, 'blouse': 0.85, 'skirt': 0.85, 'jeans': 0.85, 'jumpsuit': 0.85,
+          'hoodie': 0.55, 'down_jacket': 0.55},
+    'V': {'pants': 0.85, 'skirt': 0.85, 'shirt': 0.8, 'cardigan': 0.85, 'blazer': 0.6},
+    'T': {'pants': 0.85, 'skirt': 0.85, 'cardigan': 0.85, 'blazer': 0.6},
+    'O': {'coat': 0.85, 'cardigan': 0.85, 'shirt': 0.8, 'pants': 0.8, 'dress': 0.75,
+          'shorts': 0.45, 'tshirt': 0.6},
+}
+
+# 年龄段 × 类别的适配度（未列出的为 0.75）
+AGE_SCORES = {
+    'young': {'hoodie': 0.95, 'tshirt': 0.9, 'jeans': 0.9, 'shorts': 0.9, 'jacket': 0.85,
+              'blazer': 0.65, 'coat': 0.7},
+    'adult': {'shirt': 0.9, 'blazer': 0.9, 'coat': 0.85, 'pants': 0.85, 'dress': 0.85,
+              'hoodie': 0.65, 'shorts': 0.6},
+    'senior': {'coat': 0.9, 'cardigan': 0.9, 'shirt': 0.85, 'pants': 0.9, 'sweater': 0.85,
+               'hoodie': 0.5, 'shorts': 0.5, 'jeans': 0.65},
+}
+
+DEFAULT_WEIGHTS = {'color': 0.4, 'body': 0.3, 'age': 0.15, 'season': 0.15}
+
+
+def _age_group(age):
+    if not age:
+        return None
+    if age < 25:
+        return 'young'
+    return 'adult' if age < 45 else 'senior'
+
+
+def hex_to_hsv(hex_colors):
+    """'#RRGGBB' 列表 → (N, 3) HSV 数组，色相为角度 [0, 360)，饱和度/明度为 [0, 1]"""
+    rgb = np.array([
+        [int(h.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)] if h else [128, 128, 128]
+        for h in hex_colors
+    ], dtype=np.float32).reshape(-1, 3) / 255.0
+    maxc, minc = rgb.max(1), rgb.min(1)
+    delta = maxc - minc
+    safe = np.where(delta > 0, delta, 1)
+    r, g, b = rgb.T
+    hue = np.select(
+        [delta == 0, maxc == r, maxc == g],
+        [0, ((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4
+    ) * 60
+    sat = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1), 0)
+    return np.stack([hue, sat, maxc], axis=1)
+
+
+def color_harmony(a, b):
+    """
+    两组颜色的搭配得分矩阵 (len(a), len(b))，取值 [0, 1]
+
+    中性色（低饱和度或很暗）与任何颜色都搭；彩色之间同类色（色相差 < 30°）
+    和互补色（色相差接近 180°）得分高，其余随色相差距降低。
+    """
+    hue_diff = np.abs(a[:, None, 0] - b[None, :, 0])
+    hue_diff = np.minimum(hue_diff, 360 - hue_diff)
+    analogous = np.clip(1 - hue_diff / 60, 0, 1)
+    complementary = np.clip(1 - np.abs(hue_diff - 180) / 40, 0, 1)
+    chromatic = 0.4 + 0.6 * np.maximum(analogous, complementary)
+
+    neutral_a = (a[:, 1] < 0.2) | (a[:, 2] < 0.2)
+    neutral_b = (b[:, 1] < 0.2) | (b[:, 2] < 0.2)
+    neutral = neutral_a[:, None] | neutral_b[None, :]
+    return np.where(neutral, 0.9, chromatic).astype(np.float32)
+
+
+def skin_season_scores(hsv, skin_season):
+    """单品颜色与用户色彩季型的匹配度：春秋偏暖色，夏冬偏冷色；春夏偏浅，秋冬偏深"""
+    if skin_season not in SEASONS:
+        return np.full(len(hsv), 0.7, dtype=np.float32)
+    hue, sat, val = hsv.T
+    warmth = np.cos(np.radians(hue - 40))  # 1 = 暖（橙黄），-1 = 冷（蓝）
+    warm_season = skin_season in ('spring', 'autumn')
+    temperature = (warmth if warm_season else -warmth) * sat
+    light_season = skin_season in ('spring', 'summer')
+    lightness = val if light_season else 1 - val
+    score = 0.6 + 0.25 * temperature + 0.15 * (lightness - 0.5)
+    return np.where(sat < 0.2, 0.75, np.clip(score, 0, 1)).astype(np.float32)
+
+
+class Wardrobe:
+    """
+    衣橱单品的数组表示
+
+    Args:
+        items: [{'id', 'category', 'main_color_hex', 'season'(可选)}, ...]
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.ids = np.array([it['id'] for it in self.items], dtype=object)
+        self.categories = np.array([it['category'] for it in self.items], dtype=object)
+        self.groups = np.array([CATEGORY_TO_GROUP.get(c, 'others') for c in self.categories], dtype=object)
+        self.hsv = hex_to_hsv([it.get('main_color_hex') for it in self.items])
+        self.seasons = np.array([it.get('season') or 'all' for it in self.items], dtype=object)
+
+    def __len__(self):
+        return len(self.items)
+
+    def unary_scores(self, profile, season=None):
+        """每件单品的体型、年龄、季节得分，返回 {'body', 'age', 'season'}"""
+        shape_table = BODY_SHAPE_SCORES.get(profile.get('body_shape'), {})
+        age_table = AGE_SCORES.get(_age_group(profile.get('age')), {})
+        body = np.array([shape_table.get(c, 0.7) for c in self.categories], dtype=np.float32)
+        age = np.array([age_table.get(c, 0.75) for c in self.categories], dtype=np.float32)
+
+        color = skin_season_scores(self.hsv, profile.get('skin_season'))
+        if season:
+            # 当前季节与单品季节不符时降低得分
+            fits = (self.seasons == 'all') | (self.seasons == season)
+            color = color * np.where(fits, 1.0, 0.6).astype(np.float32)
+        return {'body': body, 'age': age, 'season': color}
+
+
+class _Slots:
+    """
+    剪枝后的各槽位（下标为 Wardrobe 中的行号）
+
+    required_row 不为 None 时，该单品所在的槽位只保留它自己（只枚举包含它的组合）。
+    """
+
+    def __init__(self, wardrobe, unary, max_per_slot, required_row=None):
+        self.rows = {}
+        self.required_group = None
+        for group in ('tops', 'bottoms', 'dresses', 'shoes', 'outerwear'):
+            rows = np.nonzero(wardrobe.groups == group)[0]
+            if len(rows) > max_per_slot:
+                rows = rows[np.argsort(-unary[rows], kind='stable')[:max_per_slot]]
+            else:
+                rows = rows[np.argsort(-unary[rows], kind='stable')]
+            self.rows[group] = rows
+        if required_row is not None:
+            self.required_group = wardrobe.groups[required_row]
+            if self.required_group in self.rows:
+                self.rows[self.required_group] = np.array([required_row])
+            else:
+                # 配饰等不参与组合的单品：没有包含它的组合
+                for group in self.rows:
+                    self.rows[group] = self.rows[group][:0]
+
+
+def _unary(scores, weights):
+    """单品自身得分（体型 + 年龄 + 季节），用于剪枝和组合总分"""
+    return (weights['body'] * scores['body'] + weights['age'] * scores['age']
+            + weights['season'] * scores['season'])
+
+
+def slot_members(items, profile=None, season=None, max_per_slot=40, weights=None):
+    """
+    剪枝后参与组合的单品 id 集合（与 recommend_outfits 不指定 required 时的槽位一致）
+
+    每个槽位超过 max_per_slot 件时只有得分最高的单品参与组合，不在集合中的单品
+    不会出现在全量计算的结果里。
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    wardrobe = items if isinstance(items, Wardrobe) else Wardrobe(items)
+    if not len(wardrobe):
+        return set()
+    unary = _unary(wardrobe.unary_scores(profile or {}, season), weights)
+    slots = _Slots(wardrobe, unary, max_per_slot)
+    return {wardrobe.ids[r] for rows in slots.rows.values() for r in rows}
+
+
+@timed('fashion_recommend_outfits_seconds')
+def recommend_outfits(items, profile=None, k=10, season=None, budget_ms=50,
+                      max_per_slot=40, weights=None, chunk_size=8, required=None):
+    """
+    给出得分最高的 k 套搭配
+
+    Args:
+        items: 单品列表，见 Wardrobe
+        profile: 用户资料 {'body_shape', 'age', 'skin_season'}
+        season: 当前季节（spring/summer/autumn/winter），用于过滤不合季的单品
+        budget_ms: 延迟预算，超出后返回已找到的最优结果
+        max_per_slot: 每个槽位最多参与组合的单品数
+        weights: 各项得分的权重，默认 DEFAULT_WEIGHTS
+        required: 单品 id，只返回包含该单品的组合（增量重算用）
+
+    Returns:
+        {'results': [{'items', 'total_score', 'color_score', 'body_score', 'age_score',
+                      'season_score'}, ...],
+         'stats': {'combinations', 'evaluated', 'elapsed_ms', 'truncated'}}
+    """
+    start = time.perf_counter()
+    deadline = start + budget_ms / 1000.0
+    profile = profile or {}
+    weights = weights or DEFAULT_WEIGHTS
+    wardrobe = items if isinstance(items, Wardrobe) else Wardrobe(items)
+    if not len(wardrobe):
+        return {'results': [], 'stats': {'combinations': 0, 'evaluated': 0,
+                                         'elapsed_ms': 0.0, 'truncated': False}}
+
+    scores = wardrobe.unary_scores(profile, season)
+    unary = _unary(scores, weights)
+    required_row = None
+    if required is not None:
+        matches = np.nonzero(wardrobe.ids == required)[0]
+        if not len(matches):
+            raise KeyError(f"Item {required} not in wardrobe")
+        required_row = int(matches[0])
+    slots = _Slots(wardrobe, unary, max_per_slot, required_row)
+    required_group = slots.required_group
+
+    full = {g: int((wardrobe.groups == g).sum()) for g in slots.rows}
+    combinations = (
+        full['tops'] * full['bottoms'] * full['shoes'] * (full['outerwear'] + 1)
+        + full['dresses'] * full['shoes'] * (full['outerwear'] + 1)
+    )
+
+    hsv = wardrobe.hsv
+    heap = []
+    counter = 0
+    evaluated = 0
+    truncated = False
+
+    def harmony(ga, gb):
+        return color_harmony(hsv[slots.rows[ga]], hsv[slots.rows[gb]])
+
+    def unary_of(group):
+        return unary[slots.rows[group]]
+
+    # 外套可选：在外套维度末尾追加一个"不穿外套"的位置，对应的色彩项为 0、计数为 0
+    # （指定了某件外套时不追加）
+    outer = slots.rows['outerwear']
+    no_outer = 0 if required_group == 'outerwear' else 1
+    outer_present = np.concatenate([np.ones(len(outer), np.float32), [0.0] * no_outer]).astype(np.float32)
+    outer_unary = np.concatenate([unary_of('outerwear'), [0.0] * no_outer]).astype(np.float32)
+
+    def pad_outer(matrix):
+        """(n, len(outer)) → (n, len(outer) + 1)，最后一列为不穿外套"""
+        if not no_outer:
+            return matrix
+        return np.concatenate([matrix, np.zeros((matrix.shape[0], 1), np.float32)], axis=1)
+
+    def push(totals, index_fn):
+        """取 totals 中前 k 个放入小顶堆"""
+        nonlocal counter
+        flat = totals.ravel()
+        take = min(k, flat.size)
+        if take == 0:
+            return
+        best = np.argpartition(-flat, take - 1)[:take]
+        for i in best:
+            score = float(flat[i])
+            if len(heap) < k:
+                heapq.heappush(heap, (score, counter, index_fn(np.unravel_index(i, totals.shape))))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, counter, index_fn(np.unravel_index(i, totals.shape))))
+            counter += 1
+
+    tops, bottoms, shoes = slots.rows['tops'], slots.rows['bottoms'], slots.rows['shoes']
+
+    # 连衣裙 + 鞋 (+ 外套)：只有一次向量化计算，放在分块的上衣循环之前，
+    # 预算在上衣组合中途用完时连衣裙组合也已参与排序
+    dresses = slots.rows['dresses']
+    if len(dresses) and len(shoes) and required_group not in ('tops', 'bottoms'):
+        ds = harmony('dresses', 'shoes')
+        od = pad_outer(harmony('dresses', 'outerwear'))
+        os_ = pad_outer(harmony('shoes', 'outerwear'))
+        color_sum = ds[:, :, None] + od[:, None, :] + os_[None, :, :]
+        unary_sum = (unary_of('dresses')[:, None, None] + unary_of('shoes')[None, :, None]
+                     + outer_unary[None, None, :])
+        color_pairs = 1 + 2 * outer_present
+        item_count = 2 + outer_present
+        totals = weights['color'] * color_sum / color_pairs + unary_sum / item_count
+        evaluated += totals.size
+        push(totals, lambda idx: (
+            'dresses', dresses[idx[0]], None, shoes[idx[1]],
+            outer[idx[2]] if idx[2] < len(outer) else None
+        ))
+
+    # 上衣 + 下装 + 鞋 (+ 外套)
+    if len(tops) and len(bottoms) and len(shoes) and required_group != 'dresses':
+        tb, ts, bs = harmony('tops', 'bottoms'), harmony('tops', 'shoes'), harmony('bottoms', 'shoes')
+        ot = pad_outer(harmony('tops', 'outerwear'))
+        ob = pad_outer(harmony('bottoms', 'outerwear'))
+        os_ = pad_outer(harmony('shoes', 'outerwear'))
+        u_t, u_b, u_s = unary_of('tops'), unary_of('bottoms'), unary_of('shoes')
+
+        # 与上衣无关的部分只算一次: (B, S, O+1)
+        rest_color = bs[:, :, None] + ob[:, None, :] + os_[None, :, :]
+        rest_unary = u_b[:, None, None] + u_s[None, :, None] + outer_unary[None, None, :]
+        color_pairs = 3 + 3 * outer_present  # 两两组合数：3 或 6
+        item_count = 3 + outer_present
+
+        for c0 in range(0, len(tops), chunk_size):
+            c1 = min(c0 + chunk_size, len(tops))
+            color_sum = (tb[c0:c1, :, None, None] + ts[c0:c1, None, :, None]
+                         + ot[c0:c1, None, None, :] + rest_color[None])
+            unary_sum = u_t[c0:c1, None, None, None] + rest_unary[None]
+            totals = weights['color'] * color_sum / color_pairs + unary_sum / item_count
+            evaluated += totals.size
+            push(totals, lambda idx, c0=c0: (
+                'tops', tops[c0 + idx[0]], bottoms[idx[1]], shoes[idx[2]],
+                outer[idx[3]] if idx[3] < len(outer) else None
+            ))
+            if time.perf_counter() > deadline:
+                truncated = c1 < len(tops)
+                break
+
+    results = []
+    for score, _, (kind, main, bottom, shoe, coat) in sorted(heap, reverse=True):
+        rows = [r for r in (main, bottom, shoe, coat) if r is not None]
+        pairs = [color_harmony(hsv[[a]], hsv[[b]])[0, 0]
+                 for i, a in enumerate(rows) for b in rows[i + 1:]]
+        results.append({
+            'items': [wardrobe.items[r]['id'] for r in rows],
+            'total_score': score,
+            'color_score': float(np.mean(pairs)),
+            'body_score': float(scores['body'][rows].mean()),
+            'age_score': float(scores['age'][rows].mean()),
+            'season_score': float(scores['season'][rows].mean()),
+        })
+
+    return {
+        'results': results,
+        'stats': {
+            'combinations': combinations,
+            'evaluated': evaluated,
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+            'truncated': truncated,
+        },
+    }
+
+
+def synthetic_wardrobe(n, seed=0):
+    """按类别比例随机生成 n 件单品"""
+    rng = np.random.default_rng(seed)
+    groups = ['tops', 'bottoms', 'outerwear', 'shoes', 'dresses', 'others']
+    probs = [0.35, 0.25, 0.15, 0.12, 0.08, 0.05]
+    items = []
+    for i in range(n):
+        group = rng.choice(groups, p=probs)
+        category = rng.choice(CATEGORY_GROUPS[group])
+        color = '#' + ''.join(f'{v:02x}' for v in rng.integers(0, 256, 3))
+        items.append({
+            'id': i,
+            'category': str(category),
+            'main_color_hex': color,
+            'season': str(rng.choice(SEASONS + ['all'])),
+        })
+    return items
+
+
+def benchmark(sizes=(50, 500, 5000), runs=5, budget_ms=50, max_per_slot=40):
+    """对不同规模的合成衣橱计时"""
+    profile = {'body_shape': 'A', 'age': 28, 'skin_season': 'autumn'}
+    report = []
+    for n in sizes:
+        wardrobe = Wardrobe(synthetic_wardrobe(n))
+        recommend_outfits(wardrobe, profile, budget_ms=budget_ms, max_per_slot=max_per_slot)
+        timings = []
+        for _ in range(runs):
+            out = recommend_outfits(wardrobe, profile, season='autumn',
+                                    budget_ms=budget_ms, max_per_slot=max_per_slot)
+            timings.append(out['stats']['elapsed_ms'])
+        stats = out['stats']
+        entry = {
+            'items': n,
+            'combinations': stats['combinations'],
+            'evaluated': stats['evaluated'],
+            'truncated': stats['truncated'],
+            'ms_p50': float(np.median(timings)),
+            'ms_max': float(np.max(timings)),
+            'top_score': out['results'][0]['total_score'] if out['results'] else None,
+        }
+        report.append(entry)
+        logger.info(
+            f"  {n:5d} items: {entry['ms_p50']:.2f} ms (max {entry['ms_max']:.2f}), "
+            f"evaluated {entry['evaluated']:,} of {entry['combinations']:,} combinations"
+            + (' [budget hit]' if entry['truncated'] else '')
+        )
+    return report
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Outfit scoring engine')
+    parser.add_argument('--bench', action='store_true', help='Benchmark on synthetic wardrobes')
+    parser.add_argument('--sizes', default='50,500,5000')
+    parser.add_argument('--budget-ms', type=float, default=50)
+    parser.add_argument('--max-per-slot', type=int, default=40)
+    parser.add_argument('--output', default=None, help='Write benchmark report JSON here')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.bench:
+        sizes = [int(s) for s in args.sizes.split(',')]
+        report = benchmark(sizes, budget_ms=args.budget_ms, max_per_slot=args.max_per_slot)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
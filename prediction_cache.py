@@ -0,0 +1,202 @@
+"""上传图片的分类结果缓存
+
+用户经常重复上传同一张照片（或同一张电商商品图）。缓存以图片字节的 SHA-256 为键，
+可选再用感知哈希（dHash）识别重新编码/缩放过的近似重复图片，命中时跳过解码、预处理和前向传播。
+
+- 内存中按 LRU 淘汰，可选 SQLite 持久化（进程重启后仍可命中）
+- 内存和 SQLite 都保存 JSON 文本，两级命中返回的结构一致（元组变为列表），
+  每次返回新的对象，调用方修改结果不会影响缓存
+- 每条记录带模型版本（检查点文件内容的哈希），重新训练后旧结果自动失效
+- stats() 导出命中率等指标
+"""
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    """图片原始字节的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    差值哈希（dHash）：缩成 (hash_size+1) x hash_size 灰度图，比较相邻像素明暗
+
+    对重新压缩、缩放和轻微调色不敏感，返回 16 位十六进制字符串（64 bit）。
+    """
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = int(np.packbits(bits).tobytes().hex(), 16)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def model_version(checkpoint_path, chunk_size=1 << 20):
+    """检查点文件内容的哈希（前 16 位），作为缓存版本"""
+    h = hashlib.sha1()
+    with open(checkpoint_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    分类结果缓存
+
+    Args:
+        version: 模型版本，只命中同一版本写入的记录
+        capacity: 内存 LRU 容量（条）
+        db_path: SQLite 文件路径，为 None 时只用内存
+        use_phash: 是否额外按感知哈希查找近似重复图片（默认关闭）。只做 64 bit dHash 的
+                   精确匹配，不做汉明距离检索；构图相近的不同单品（如白底商品图）可能得到
+                   相同的 dHash 而返回另一件单品的结果，只在重复上传远多于误判代价时开启
+    """
+
+    def __init__(self, version, capacity=10000, db_path=None, use_phash=False):
+        self.version = version
+        self.capacity = capacity
+        self.use_phash = use_phash
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'phash_hits': 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'key TEXT NOT NULL, version TEXT NOT NULL, result TEXT NOT NULL, '
+                'created REAL NOT NULL, PRIMARY KEY (key, version))'
+            )
+            self._db.commit()
+
+    def _get(self, key):
+        """先查内存再查 SQLite，返回 (结果, 来源) 或 (None, None)；结果是新解码的对象"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return json.loads(self._memory[key]), 'memory'
+            if self._db is None:
+                return None, None
+            row = self._db.execute(
+                'SELECT result FROM predictions WHERE key = ? AND version = ?',
+                (key, self.version)
+            ).fetchone()
+        if row is None:
+            return None, None
+        self._remember(key, row[0])
+        return json.loads(row[0]), 'disk'
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._memory[key] = payload
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def _put(self, keys, result):
+        """写入缓存，返回 JSON 规范化后的结果（与之后命中时返回的结构一致）"""
+        payload = json.dumps(result)
+        for key in keys:
+            self._remember(key, payload)
+        if self._db is not None:
+            now = time.time()
+            with self._lock:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO predictions (key, version, result, created) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(key, self.version, payload, now) for key in keys]
+                )
+                self._db.commit()
+        return json.loads(payload)
+
+    def _record(self, source, phash=False):
+        with self._lock:
+            if source is None:
+                self._counts['misses'] += 1
+                return
+            self._counts['hits'] += 1
+            self._counts[f'{source}_hits'] += 1
+            if phash:
+                self._counts['phash_hits'] += 1
+
+    def get_or_compute(self, data, compute):
+        """
+        按图片字节查缓存，未命中时解码并调用 compute(PIL 图片) 得到结果再写入缓存
+
+        Args:
+            data: 上传的图片字节
+            compute: 分类函数，返回可 JSON 序列化的结果（如 top-k 类别概率）
+
+        Returns:
+            (结果, 是否命中缓存)
+        """
+        sha_key = f'sha256:{content_hash(data)}'
+        result, source = self._get(sha_key)
+        if result is not None:
+            self._record(source)
+            return result, True
+
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        keys = [sha_key]
+        if self.use_phash:
+            phash_key = f'phash:{perceptual_hash(image)}'
+            result, source = self._get(phash_key)
+            if result is not None:
+                self._record(source, phash=True)
+                # 记住这份字节，下次直接按内容哈希命中
+                self._put([sha_key], result)
+                return result, True
+            keys.append(phash_key)
+
+        self._record(None)
+        result = self._put(keys, compute(image))
+        return result, False
+
+    def get(self, data):
+        """只按内容哈希查缓存（批量处理时先查再把未命中的一起计算），未命中返回 None"""
+        result, source = self._get(f'sha256:{content_hash(data)}')
+        self._record(source)
+        return result
+
+    def put(self, data, result):
+        """按内容哈希写入结果，返回 JSON 规范化后的结果"""
+        return self._put([f'sha256:{content_hash(data)}'], result)
+
+    def purge_stale(self):
+        """删除 SQLite 中其他模型版本的记录，返回删除条数"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute('DELETE FROM predictions WHERE version != ?', (self.version,))
+            self._db.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        """命中率等指标"""
+        with self._lock:
+            counts = dict(self._counts)
+            size = len(self._memory)
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = counts['hits'] / lookups if lookups else 0.0
+        counts['memory_entries'] = size
+        counts['version'] = self.version
+        return counts
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,8 +1,15 @@
 """准备服装分类数据集"""
 import os
+import io
+import json
+import random
 import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import pandas as pd
+from PIL import Image
 from sklearn.model_selection import train_test_split
 import logging
 
@@ -58,11 +65,242 @@ KAGGLE_TO_OUR_MAPPING = {
 }
 
 
+MANIFEST_FILE = '.prepare_manifest.jsonl'
+
+
+def collect_class_samples(df, images_dir, available=None):
+    """
+    把 styles.csv 映射到我们的类别，并过滤掉不存在的图片
+    
+    整个过程基于 DataFrame 列运算完成，图片是否存在通过一次目录列举判断，
+    而不是逐行调用 os.path.exists。
+    
+    Args:
+        df: styles.csv 数据
+        images_dir: 图片目录（从 ZIP 读取时为空字符串）
+        available: 已存在的图片文件名集合，None 表示列举 images_dir
+    
+    Returns:
+        {类别名: [图片路径, ...]}，类别内保持 styles.csv 中的顺序
+    """
+    class_samples = {cls: [] for cls in GARMENT_CLASSES}
+    
+    if 'id' not in df.columns or 'articleType' not in df.columns:
+        logger.error("styles.csv is missing 'id' or 'articleType' column")
+        return class_samples
+    
+    if available is None:
+        available = set(os.listdir(images_dir)) if os.path.isdir(images_dir) else set()
+    
+    ids = pd.to_numeric(df['id'], errors='coerce').astype('Int64')
+    classes = df['articleType'].map(KAGGLE_TO_OUR_MAPPING)
+    filenames = ids.astype(str) + '.jpg'
+    mask = ids.notna() & classes.notna() & filenames.isin(available)
+    
+    selected = pd.DataFrame({'cls': classes[mask], 'filename': filenames[mask]})
+    for cls, group in selected.groupby('cls', sort=False):
+        class_samples[cls] = [os.path.join(images_dir, f) for f in group['filename']]
+    
+    logger.info(f"Matched {int(mask.sum())} of {len(df)} products to our classes")
+    return class_samples
+
+
+def _resize_image(src, size):
+    """把图片缩放到 size x size（与训练时 transforms.Resize 相同的双线性插值）"""
+    image = Image.open(src).convert('RGB')
+    return image.resize((size, size), Image.BILINEAR)
+
+
+def _read_sample(src_path, resize=None, archive=None):
+    """
+    读取样本字节；指定 resize 时返回缩放后重新编码的 JPEG
+    
+    archive 不为空时 src_path 是压缩包内的图片文件名，直接按偏移读取。
+    """
+    if archive is not None:
+        data = archive.read(src_path)
+    else:
+        with open(src_path, 'rb') as f:
+            data = f.read()
+    if resize is None:
+        return data
+    buf = io.BytesIO()
+    _resize_image(io.BytesIO(data), resize).save(buf, 'JPEG', quality=95)
+    return buf.getvalue()
+
+
+def _try_read_sample(src_path, resize=None, archive=None):
+    """打包分片用的 _read_sample：损坏或无法读取的图片记录警告后返回 None（与逐张复制一致）"""
+    try:
+        return _read_sample(src_path, resize, archive)
+    except Exception as e:
+        logger.warning(f"Error reading {src_path}: {e}")
+        return None
+
+
+def _copy_sample(src_path, dst_path, resize=None, archive=None):
+    """复制（或缩放后保存）单张图片，先写临时文件再原子重命名"""
+    tmp_path = f"{dst_path}.part"
+    if archive is not None:
+        with open(tmp_path, 'wb') as f:
+            f.write(_read_sample(src_path, resize, archive))
+    elif resize is None:
+        shutil.copy2(src_path, tmp_path)
+    else:
+        _resize_image(src_path, resize).save(tmp_path, 'JPEG', quality=95)
+    os.replace(tmp_path, dst_path)
+
+
+def copy_samples(tasks, output_dir, resize=None, num_workers=8, archive=None):
+    """
+    并行复制样本，并在进度清单中记录已完成的文件
+    
+    清单为 output_dir/.prepare_manifest.jsonl，每完成一个文件追加一行。
+    重新运行时，源路径与缩放参数都一致且目标文件存在的任务会被跳过，
+    因此中断后可以直接续跑。
+    
+    Args:
+        tasks: [(源路径, 目标路径), ...]
+        output_dir: 输出目录（存放进度清单）
+        resize: 缩放边长，None 表示原样复制
+        num_workers: 线程数
+        archive: ZipImageArchive，不为空时从压缩包读取源图片
+    
+    Returns:
+        (新复制数, 跳过数)
+    """
+    manifest_path = Path(output_dir) / MANIFEST_FILE
+    done = {}
+    if manifest_path.exists():
+        with open(manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时可能残留半行
+                    continue
+                done[record['dst']] = (record['src'], record.get('resize'))
+    
+    pending = [
+        (src, str(dst)) for src, dst in tasks
+        if done.get(str(dst)) != (src, resize) or not os.path.exists(dst)
+    ]
+    skipped = len(tasks) - len(pending)
+    if skipped:
+        logger.info(f"Resuming: {skipped} files already done, {len(pending)} remaining")
+    
+    copied = 0
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            ThreadPoolExecutor(max_workers=num_workers) as pool:
+        futures = {
+            pool.submit(_copy_sample, src, dst, resize, archive): (src, dst)
+            for src, dst in pending
+        }
+        for future in as_completed(futures):
+            src, dst = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Error copying {src}: {e}")
+                continue
+            manifest.write(json.dumps({'src': src, 'dst': dst, 'resize': resize}) + '\n')
+            manifest.flush()
+            copied += 1
+            if copied % 1000 == 0:
+                logger.info(f"Copied {copied}/{len(pending)} files...")
+    
+    return copied, skipped
+
+
+def write_shards(samples, split_dir, prefix, shard_size=1000, seed=42,
+                 resize=None, num_workers=8, archive=None):
+    """
+    把样本打包成若干 tar 分片，每个分片附带一个偏移索引
+    
+    输出结构::
+    
+        split_dir/
+        ├── shards.json            # 分片清单与样本数
+        ├── train-00000.tar        # 图片原始字节（未压缩 tar）
+        ├── train-00000.json       # [[offset, size, class_name], ...]
+        └── ...
+    
+    训练端按索引直接 seek 读取，不需要解析 tar 头。
+    
+    Args:
+        samples: [(源图片路径, 类别名), ...]
+        split_dir: 输出目录
+        prefix: 分片文件名前缀（train / val）
+        shard_size: 每个分片的样本数
+        seed: 打乱样本顺序的随机种子
+        resize: 缩放边长，None 表示保存原始字节
+        num_workers: 并行读取/缩放的线程数
+        archive: ZipImageArchive，不为空时从压缩包读取源图片
+    
+    Returns:
+        写入的样本数（跳过无法读取的图片）
+    """
+    split_dir = Path(split_dir)
+    split_dir.mkdir(parents=True, exist_ok=True)
+    
+    # 打乱后写入，使每个分片内类别混合，训练时只需分片级打乱 + 缓冲区打乱
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    
+    shards = []
+    written = 0
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for shard_idx, start in enumerate(range(0, len(samples), shard_size)):
+            chunk = samples[start:start + shard_size]
+            shard_name = f"{prefix}-{shard_idx:05d}.tar"
+            index = []
+            
+            # 读取/缩放并行执行，tar 写入保持顺序
+            payloads = pool.map(lambda sample: _try_read_sample(sample[0], resize, archive), chunk)
+            
+            with tarfile.open(split_dir / shard_name, 'w') as tar:
+                for i, ((src_path, cls), data) in enumerate(zip(chunk, payloads)):
+                    if data is None:
+                        continue
+                    suffix = '.jpg' if resize else Path(src_path).suffix.lower()
+                    info = tarfile.TarInfo(f"{cls}_{start + i:06d}{suffix}")
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+                    # addfile 之后 tar.offset 指向数据块（按 512 字节对齐）末尾
+                    padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                    index.append([tar.offset - padded, len(data), cls])
+            
+            index_name = f"{prefix}-{shard_idx:05d}.json"
+            with open(split_dir / index_name, 'w', encoding='utf-8') as f:
+                json.dump({'shard': shard_name, 'samples': index}, f)
+            
+            shards.append({'shard': shard_name, 'index': index_name, 'count': len(index)})
+            written += len(index)
+            skipped = len(chunk) - len(index)
+            logger.info(
+                f"  Wrote {shard_name} ({len(index)} samples"
+                + (f", {skipped} unreadable skipped)" if skipped else ")")
+            )
+    
+    with open(split_dir / 'shards.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'classes': GARMENT_CLASSES,
+            'num_samples': written,
+            'shards': shards
+        }, f, indent=2)
+    
+    return written
+
+
 def prepare_kaggle_dataset(
     kaggle_dir: str,
     output_dir: str,
     val_split: float = 0.2,
-    max_samples_per_class: int = 1000
+    max_samples_per_class: int = 1000,
+    output_format: str = 'files',
+    shard_size: int = 1000,
+    resize: int = None,
+    num_workers: int = 8
 ):
     """
     准备 Kaggle Fashion Product Images 数据集
@@ -70,47 +308,46 @@ def prepare_kaggle_dataset(
     下载地址: https://www.kaggle.com/datasets/paramaggarwal/fashion-product-images-dataset
     
     Args:
-        kaggle_dir: Kaggle 数据集解压目录
+        kaggle_dir: Kaggle 数据集解压目录，也可以直接传入未解压的 .zip 文件
         output_dir: 输出目录
         val_split: 验证集比例
-        max_samples_per_class: 每类最大样本数
+        max_samples_per_class: 每类最大样本数，None 或 0 表示不截断（训练时用 --sampler balanced 均衡类别）
+        output_format: 'files' 按类别目录逐张复制；'shards' 打包为 tar 分片
+        shard_size: 分片模式下每个分片的样本数
+        resize: 把图片缩放到 resize x resize 后保存，None 表示原样复制
+        num_workers: 复制/缩放的并行线程数
+    
+    files 模式可中断续跑：已完成的文件记录在输出目录的 .prepare_manifest.jsonl 中。
     """
     logger.info("Processing Kaggle Fashion Product Images dataset...")
     
-    # 读取样式CSV
-    styles_file = os.path.join(kaggle_dir, 'styles.csv')
-    if not os.path.exists(styles_file):
-        logger.error(f"styles.csv not found in {kaggle_dir}")
-        return
-    
-    df = pd.read_csv(styles_file, on_bad_lines='skip')
+    archive = None
+    if str(kaggle_dir).lower().endswith('.zip'):
+        # 不解压：通过 ZIP 中央目录索引按偏移读取
+        from download_dataset import ZipImageArchive
+        try:
+            archive = ZipImageArchive(kaggle_dir)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.error(f"Cannot open {kaggle_dir}: {e}")
+            return
+        df = pd.read_csv(io.BytesIO(archive.read_styles()), on_bad_lines='skip')
+        archive.close()
+    else:
+        # 读取样式CSV
+        styles_file = os.path.join(kaggle_dir, 'styles.csv')
+        if not os.path.exists(styles_file):
+            logger.error(f"styles.csv not found in {kaggle_dir}")
+            return
+        
+        df = pd.read_csv(styles_file, on_bad_lines='skip')
     logger.info(f"Loaded {len(df)} products from styles.csv")
     
     # 统计每个类别的样本
-    class_samples = {cls: [] for cls in GARMENT_CLASSES}
-    
-    images_dir = os.path.join(kaggle_dir, 'images')
-    
-    for idx, row in df.iterrows():
-        try:
-            article_type = row.get('articleType', '')
-            product_id = row.get('id', '')
-            
-            # 映射到我们的类别
-            our_class = KAGGLE_TO_OUR_MAPPING.get(article_type)
-            
-            if our_class and our_class in class_samples:
-                # 检查图片是否存在
-                img_path = os.path.join(images_dir, f"{product_id}.jpg")
-                if os.path.exists(img_path):
-                    class_samples[our_class].append(img_path)
-            
-            if idx % 1000 == 0:
-                logger.info(f"Processed {idx} products...")
-        
-        except Exception as e:
-            logger.warning(f"Error processing row {idx}: {e}")
-            continue
+    if archive is not None:
+        class_samples = collect_class_samples(df, '', available=set(archive.images))
+    else:
+        images_dir = os.path.join(kaggle_dir, 'images')
+        class_samples = collect_class_samples(df, images_dir)
     
     # 打印统计
     logger.info("\nDataset statistics:")
@@ -129,6 +366,8 @@ def prepare_kaggle_dataset(
     # 划分训练集和验证集
     total_train = 0
     total_val = 0
+    shard_samples = {'train': [], 'val': []}
+    copy_tasks = []
     
     for cls in GARMENT_CLASSES:
         samples = class_samples[cls]
@@ -137,10 +376,9 @@ def prepare_kaggle_dataset(
             logger.warning(f"No samples for class {cls}")
             continue
         
-        # 限制每类样本数
-        if len(samples) > max_samples_per_class:
-            import random
-            random.shuffle(samples)
+        # 限制每类样本数（固定种子，保证中断续跑时选中的样本一致）
+        if max_samples_per_class and len(samples) > max_samples_per_class:
+            random.Random(42).shuffle(samples)
             samples = samples[:max_samples_per_class]
         
         # 划分训练和验证
@@ -148,19 +386,22 @@ def prepare_kaggle_dataset(
             samples, test_size=val_split, random_state=42
         )
         
-        # 创建类别目录
-        (train_dir / cls).mkdir(exist_ok=True)
-        (val_dir / cls).mkdir(exist_ok=True)
-        
-        # 复制训练集
-        for i, src_path in enumerate(train_samples):
-            dst_path = train_dir / cls / f"{cls}_{i:04d}.jpg"
-            shutil.copy2(src_path, dst_path)
-        
-        # 复制验证集
-        for i, src_path in enumerate(val_samples):
-            dst_path = val_dir / cls / f"{cls}_val_{i:04d}.jpg"
-            shutil.copy2(src_path, dst_path)
+        if output_format == 'shards':
+            # 分片模式：先收集，所有类别划分完后统一打包
+            shard_samples['train'].extend((p, cls) for p in train_samples)
+            shard_samples['val'].extend((p, cls) for p in val_samples)
+        else:
+            # 创建类别目录
+            (train_dir / cls).mkdir(exist_ok=True)
+            (val_dir / cls).mkdir(exist_ok=True)
+            
+            # 训练集
+            for i, src_path in enumerate(train_samples):
+                copy_tasks.append((src_path, train_dir / cls / f"{cls}_{i:04d}.jpg"))
+            
+            # 验证集
+            for i, src_path in enumerate(val_samples):
+                copy_tasks.append((src_path, val_dir / cls / f"{cls}_val_{i:04d}.jpg"))
         
         total_train += len(train_samples)
         total_val += len(val_samples)
@@ -169,6 +410,25 @@ def prepare_kaggle_dataset(
             f"  {cls:15s}: {len(train_samples)} train, {len(val_samples)} val"
         )
     
+    try:
+        if output_format == 'shards':
+            logger.info("\nWriting shards...")
+            write_shards(shard_samples['train'], train_dir, 'train', shard_size=shard_size,
+                         resize=resize, num_workers=num_workers, archive=archive)
+            write_shards(shard_samples['val'], val_dir, 'val', shard_size=shard_size,
+                         resize=resize, num_workers=num_workers, archive=archive)
+        else:
+            logger.info(f"\nCopying {len(copy_tasks)} files with {num_workers} workers...")
+            copied, skipped = copy_samples(
+                copy_tasks, output_path, resize=resize, num_workers=num_workers,
+                archive=archive
+            )
+            logger.info(f"Copied {copied} files, skipped {skipped} already done")
+    finally:
+        if archive is not None:
+            # 关闭各复制线程打开的压缩包句柄
+            archive.close()
+    
     logger.info(f"\n✅ Dataset prepared successfully!")
     logger.info(f"   Train: {total_train} images")
     logger.info(f"   Val: {total_val} images")
@@ -263,7 +523,7 @@ if __name__ == '__main__':
     parser.add_argument(
         '--kaggle-dir',
         default='./kaggle_fashion',
-        help='Kaggle dataset directory'
+        help='Kaggle dataset directory (or the downloaded .zip, read without extracting)'
     )
     parser.add_argument(
         '--output-dir',
@@ -274,7 +534,31 @@ if __name__ == '__main__':
         '--max-samples',
         type=int,
         default=1000,
-        help='Max samples per class'
+        help='Max samples per class (0 = keep all; balance classes with train --sampler instead)'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['files', 'shards'],
+        default='files',
+        help='Output format: per-image files or tar shards with offset index'
+    )
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=1000,
+        help='Samples per shard (shards format only)'
+    )
+    parser.add_argument(
+        '--resize',
+        type=int,
+        default=None,
+        help='Resize images to NxN during preparation (e.g. 256 for training)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Parallel copy/resize workers'
     )
     
     args = parser.parse_args()
@@ -286,7 +570,11 @@ if __name__ == '__main__':
             prepare_kaggle_dataset(
                 kaggle_dir,
                 args.output_dir,
-                max_samples_per_class=args.max_samples
+                max_samples_per_class=args.max_samples,
+                output_format=args.format,
+                shard_size=args.shard_size,
+                resize=args.resize,
+                num_workers=args.workers
             )
     
     elif args.mode == 'prepare':
@@ -294,7 +582,11 @@ if __name__ == '__main__':
         prepare_kaggle_dataset(
             args.kaggle_dir,
             args.output_dir,
-            max_samples_per_class=args.max_samples
+            max_samples_per_class=args.max_samples,
+            output_format=args.format,
+            shard_size=args.shard_size,
+            resize=args.resize,
+            num_workers=args.workers
         )
     
     else:  # structure
@@ -0,0 +1,309 @@
+"""预计算的推荐结果与增量更新
+
+每次点击"生成推荐"都会调用 POST /api/recommendations 从头计算。这里把每个用户的推荐结果
+按"衣橱 + 用户资料 + 季节"的版本号物化保存：
+
+- 版本未变时直接返回已保存的结果
+- 通过 /api/wardrobe/<id> 增删改一件单品时，只重算包含这件单品的组合，
+  与已保存结果中不含它的组合合并（保存比返回更多的结果，删除后仍有余量）
+- 用户资料或季节变化时全量重算
+- PrecomputeWorker 在后台为活跃用户提前算好
+
+用法（视图中）:
+    store = get_store()
+    results = store.get_or_compute(user.id, items, profile, season='autumn')
+    store.on_item_changed(user.id, items_after_change, profile, item_id, season='autumn')
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from instrumentation import metrics
+from outfit_scoring import recommend_outfits, slot_members
+
+logger = logging.getLogger(__name__)
+
+# 保存的结果条数（大于返回条数，单品删除后仍能直接给出前 k 个）
+STORE_DEPTH = 50
+DEFAULT_K = 10
+
+
+def item_fingerprint(item):
+    """影响评分的单品属性"""
+    return f"{item.get('category')}|{item.get('main_color_hex')}|{item.get('season') or 'all'}"
+
+
+def profile_fingerprint(profile, season=None):
+    profile = profile or {}
+    return json.dumps({
+        'body_shape': profile.get('body_shape'),
+        'age': profile.get('age'),
+        'skin_season': profile.get('skin_season'),
+        'season': season,
+    }, sort_keys=True)
+
+
+def _item_from_fingerprint(item_id, fingerprint):
+    """由 item_fingerprint 还原评分用到的单品属性（增量更新时重建变更前的衣橱）"""
+    category, color, season = fingerprint.split('|')
+    return {
+        'id': item_id,
+        'category': None if category == 'None' else category,
+        'main_color_hex': None if color == 'None' else color,
+        'season': season,
+    }
+
+
+def wardrobe_version(items, profile, season=None):
+    """衣橱 + 用户资料 + 季节的版本号"""
+    h = hashlib.sha1(profile_fingerprint(profile, season).encode())
+    for item in sorted(items, key=lambda it: str(it['id'])):
+        h.update(f"{item['id']}={item_fingerprint(item)}\n".encode())
+    return h.hexdigest()[:16]
+
+
+class RecommendationStore:
+    """
+    按用户保存的推荐结果
+
+    Args:
+        db_path: SQLite 文件路径，为 None 时只保存在内存
+        depth: 每个用户保存的结果条数
+        budget_ms / max_per_slot: 传给 recommend_outfits
+    """
+
+    def __init__(self, db_path=None, depth=STORE_DEPTH, budget_ms=200, max_per_slot=40):
+        self.depth = depth
+        self.budget_ms = budget_ms
+        self.max_per_slot = max_per_slot
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'full': 0, 'incremental': 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS recommendations ('
+                'user_id TEXT PRIMARY KEY, version TEXT NOT NULL, payload TEXT NOT NULL, '
+                'updated REAL NOT NULL)'
+            )
+            self._db.commit()
+
+    def _load(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None or self._db is None:
+                return entry
+            row = self._db.execute(
+                'SELECT payload FROM recommendations WHERE user_id = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(row[0])
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _save(self, user_id, entry):
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = entry
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO recommendations (user_id, version, payload, updated) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, entry['version'], json.dumps(entry), time.time())
+                )
+                self._db.commit()
+
+    def _entry(self, items, profile, season, results, complete):
+        return {
+            'version': wardrobe_version(items, profile, season),
+            'profile': profile_fingerprint(profile, season),
+            'items': {str(it['id']): item_fingerprint(it) for it in items},
+            'results': results,
+            # complete=True 表示 results 包含了全部组合（组合数不足 depth）
+            'complete': complete,
+            'computed_at': time.time(),
+        }
+
+    def _score(self, items, profile, season, required=None):
+        """返回 (前 depth 个结果, 是否为全部组合)"""
+        out = recommend_outfits(
+            items, profile, k=self.depth, season=season, budget_ms=self.budget_ms,
+            max_per_slot=self.max_per_slot, required=required
+        )
+        results = out['results']
+        return results, len(results) < self.depth and not out['stats']['truncated']
+
+    def compute(self, user_id, items, profile, season=None):
+        """全量重算并保存"""
+        results, complete = self._score(items, profile, season)
+        self._save(user_id, self._entry(items, profile, season, results, complete))
+        with self._lock:
+            self._counts['full'] += 1
+        metrics.inc('fashion_recommendation_requests_total', source='full')
+        return results
+
+    def get(self, user_id, items, profile, season=None, k=DEFAULT_K):
+        """版本一致时返回已保存的前 k 个结果，否则返回 None"""
+        entry = self._load(user_id)
+        if entry is None or entry['version'] != wardrobe_version(items, profile, season):
+            return None
+        with self._lock:
+            self._counts['hits'] += 1
+        metrics.inc('fashion_recommendation_requests_total', source='hit')
+        return entry['results'][:k]
+
+    def get_or_compute(self, user_id, items, profile, season=None, k=DEFAULT_K):
+        """推荐接口的入口：优先返回已保存结果"""
+        results = self.get(user_id, items, profile, season, k)
+        if results is None:
+            results = self.compute(user_id, items, profile, season)[:k]
+        return results
+
+    def on_item_changed(self, user_id, items, profile, item_id, season=None, k=DEFAULT_K):
+        """
+        单品新增/修改/删除后更新保存的结果
+
+        items 为变更之后的完整衣橱（删除时不含该单品）。只有保存的结果恰好对应
+        "除这件单品外完全相同"的衣橱时才做增量更新，否则全量重算。
+
+        不含该单品的组合得分不受影响，保存结果中的这部分仍是它们当中分数最高的；
+        再只枚举包含该单品的组合，两者按分数合并。
+
+        结果与全量重算一致：变更使其他单品进出剪枝后的槽位（max_per_slot）时全量重算；
+        该单品本身不在剪枝后的槽位中时，不加入包含它的组合。
+        """
+        key = str(item_id)
+        entry = self._load(user_id)
+        current = {str(it['id']): item_fingerprint(it) for it in items}
+        current.pop(key, None)
+        previous = dict(entry['items']) if entry is not None else None
+        if previous is not None:
+            previous.pop(key, None)
+
+        if (entry is None or entry['profile'] != profile_fingerprint(profile, season)
+                or previous != current):
+            return self.compute(user_id, items, profile, season)[:k]
+
+        # 剪枝后的槽位：其他单品的成员变化时，保存结果中不含该单品的部分已不是全量结果的子集
+        others = [it for it in items if str(it['id']) != key]
+        before = others + ([_item_from_fingerprint(key, entry['items'][key])] if key in entry['items'] else [])
+        members_before = {str(i) for i in slot_members(before, profile, season, self.max_per_slot)}
+        members_after = {str(i) for i in slot_members(items, profile, season, self.max_per_slot)}
+        if members_before - {key} != members_after - {key}:
+            return self.compute(user_id, items, profile, season)[:k]
+
+        # item_id 可能来自 URL（字符串），按字符串匹配后使用衣橱中该单品自己的 id；
+        # 被剪枝掉的单品在全量计算中不参与组合，这里同样不加入
+        matched = next((it['id'] for it in items if str(it['id']) == key), None)
+        kept = [r for r in entry['results'] if key not in map(str, r['items'])]
+        added, added_complete = (
+            self._score(items, profile, season, required=matched)
+            if matched is not None and key in members_after else ([], True)
+        )
+
+        # 两个列表各自被截断时，低于截断分数的部分可能漏掉组合，只保留确定的部分
+        cutoff = float('-inf')
+        if not entry['complete'] and entry['results']:
+            cutoff = max(cutoff, entry['results'][-1]['total_score'])
+        if not added_complete and added:
+            cutoff = max(cutoff, added[-1]['total_score'])
+        merged = sorted(kept + added, key=lambda r: r['total_score'], reverse=True)
+        merged = [r for r in merged if r['total_score'] >= cutoff][:self.depth]
+        complete = entry['complete'] and added_complete
+
+        if len(merged) < k and not complete:
+            return self.compute(user_id, items, profile, season)[:k]
+
+        self._save(user_id, self._entry(items, profile, season, merged, complete))
+        with self._lock:
+            self._counts['incremental'] += 1
+        metrics.inc('fashion_recommendation_requests_total', source='incremental')
+        return merged[:k]
+
+    def invalidate(self, user_id):
+        """删除用户的保存结果（如资料批量导入后）"""
+        key = str(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM recommendations WHERE user_id = ?', (key,))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, users=len(self._entries))
+
+
+class PrecomputeWorker:
+    """
+    后台预计算线程
+
+    loader(user_id) 返回 (items, profile, season)；submit() 把用户放入队列，
+    版本未变的用户会被跳过。同一用户排队多次只计算一次。
+    """
+
+    def __init__(self, store, loader):
+        self.store = store
+        self.loader = loader
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='recommendation-precompute', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._queue.put(user_id)
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            try:
+                if user_id is None:
+                    return
+                with self._lock:
+                    self._pending.discard(user_id)
+                items, profile, season = self.loader(user_id)
+                if self.store.get(user_id, items, profile, season) is None:
+                    self.store.compute(user_id, items, profile, season)
+            except Exception as e:
+                logger.error(f"Precompute failed for user {user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """等待队列中的用户全部算完"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """进程内共享的推荐结果存储（FASHION_RECOMMENDATION_DB 指定 SQLite 文件）"""
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                _default_store = RecommendationStore(
+                    db_path=os.environ.get('FASHION_RECOMMENDATION_DB') or None
+                )
+    return _default_store
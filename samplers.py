@@ -0,0 +1,220 @@
+"""训练集采样器：类别均衡采样与难例采样
+
+prepare_dataset.py 用 --max-samples 截断每类样本数来缓解类别不均衡（鞋子很多、连体裤很少），
+代价是丢掉大部分数据。这里改为在采样时重新加权，不复制、不截断数据集：
+
+- ClassBalancedSampler: 先按类别概率抽类别，再在该类的下标数组中均匀抽样本（有放回）。
+  类别概率 ∝ 样本数 ** power，power=0 时各类等概率，power=1 时等同均匀采样
+- HardExampleSampler: 在类别权重的基础上，按上一个 epoch 记录的逐样本损失加权，
+  损失大的样本被更频繁地抽到；mix 为混入的均匀部分，保证易样本不会完全抽不到
+
+两者都按 epoch 和种子确定性地生成顺序，分布式训练时所有 rank 生成相同的全局序列并按
+rank 间隔切分（替代 DistributedSampler）。
+
+用法:
+    labels = [label for _, label in train_dataset.samples]
+    sampler = HardExampleSampler(labels, len(GARMENT_CLASSES), power=0.5)
+    loader = DataLoader(train_dataset, batch_size=64, sampler=sampler)
+    for epoch in range(epochs):
+        sampler.set_epoch(epoch)
+        for inputs, labels in loader:
+            ...
+            sampler.record(per_sample_loss)   # reduction='none' 的损失，按批次顺序
+        sampler.end_epoch()
+"""
+import logging
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+logger = logging.getLogger(__name__)
+
+SAMPLER_MODES = ('uniform', 'balanced', 'hard')
+
+
+def class_indices(labels, num_classes):
+    """每个类别的样本下标数组（int64，按下标升序）"""
+    labels = np.asarray(labels, dtype=np.int64)
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels, minlength=num_classes)
+    return np.split(order, np.cumsum(counts)[:-1])
+
+
+def class_probabilities(counts, power=0.5):
+    """类别被抽中的概率 ∝ 样本数 ** power（没有样本的类别为 0）"""
+    counts = np.asarray(counts, dtype=np.float64)
+    weights = np.where(counts > 0, counts ** power, 0.0)
+    return weights / weights.sum()
+
+
+class ClassBalancedSampler(Sampler):
+    """
+    类别均衡的有放回采样
+
+    Args:
+        labels: 每个样本的类别下标
+        num_classes: 类别数
+        power: 类别概率 ∝ 样本数 ** power
+        num_samples: 每个 epoch 的全局样本数，默认为数据集大小
+        seed: 随机种子（与 epoch 组合，所有 rank 一致）
+        rank / world_size: 分布式训练时本进程的位置
+    """
+
+    def __init__(self, labels, num_classes, power=0.5, num_samples=None, seed=0,
+                 rank=0, world_size=1):
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.indices = class_indices(self.labels, num_classes)
+        self.counts = np.array([len(idx) for idx in self.indices])
+        self.power = power
+        self.class_probs = class_probabilities(self.counts, power)
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        total = num_samples or len(self.labels)
+        # 补齐到 world_size 的整数倍，每个 rank 的步数一致
+        self.num_samples = -(-total // world_size)
+        self.total_size = self.num_samples * world_size
+        self._epoch_indices = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _rng(self):
+        return np.random.default_rng((self.seed, self.epoch))
+
+    def _draw(self, rng):
+        """全局样本序列"""
+        per_class = rng.multinomial(self.total_size, self.class_probs)
+        drawn = np.concatenate([
+            idx[rng.integers(0, len(idx), n)]
+            for idx, n in zip(self.indices, per_class) if n > 0
+        ])
+        rng.shuffle(drawn)
+        return drawn
+
+    def __iter__(self):
+        drawn = self._draw(self._rng())
+        self._epoch_indices = drawn[self.rank::self.world_size]
+        return iter(self._epoch_indices.tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+    def expected_class_share(self):
+        """每个 epoch 中各类别的期望占比"""
+        return self.class_probs
+
+
+class HardExampleSampler(ClassBalancedSampler):
+    """
+    按上一个 epoch 的逐样本损失加权的有放回采样
+
+    样本 i 的概率 ∝ 类别权重 × ((1 - mix) × loss_i / 平均损失 + mix)。
+    从未被抽到过的样本使用平均损失；一个 epoch 中被抽到多次的样本取平均。
+    没有抽到的样本保留更早的损失，不会因为一轮没抽到就失去权重。
+
+    Args:
+        mix: 均匀部分的比例（0~1），1 时退化为 ClassBalancedSampler
+        max_ratio: 单个样本相对平均权重的上限，防止个别标注错误的样本被反复抽到
+    """
+
+    def __init__(self, labels, num_classes, power=0.5, mix=0.5, max_ratio=10.0, **kwargs):
+        super().__init__(labels, num_classes, power=power, **kwargs)
+        if not 0.0 <= mix <= 1.0:
+            raise ValueError(f"mix must be in [0, 1], got {mix}")
+        self.mix = mix
+        self.max_ratio = max_ratio
+        # 每个样本的类别权重：类别概率平均分给该类的样本
+        per_sample = np.zeros(len(self.counts))
+        np.divide(self.class_probs, self.counts, out=per_sample, where=self.counts > 0)
+        self.base_weights = per_sample[self.labels]
+        self.losses = np.full(len(self.labels), np.nan, dtype=np.float32)
+        self._recorded = []
+
+    def sample_weights(self):
+        """当前 epoch 的逐样本抽样概率"""
+        losses = self.losses
+        seen = ~np.isnan(losses)
+        if not seen.any():
+            return self.base_weights / self.base_weights.sum()
+        mean = float(losses[seen].mean()) or 1.0
+        relative = np.where(seen, losses / mean, 1.0)
+        factor = np.minimum((1.0 - self.mix) * relative + self.mix, self.max_ratio)
+        weights = self.base_weights * factor
+        return weights / weights.sum()
+
+    def _draw(self, rng):
+        return rng.choice(len(self.labels), size=self.total_size, p=self.sample_weights())
+
+    def __iter__(self):
+        self._recorded = []
+        return super().__iter__()
+
+    def record(self, losses):
+        """
+        记录一个批次的逐样本损失（按 DataLoader 输出顺序）
+
+        张量留在原设备上，end_epoch() 时一次性拷回，训练循环中不触发同步。
+        """
+        self._recorded.append(losses.detach().float().reshape(-1))
+
+    def end_epoch(self, reduce=None):
+        """
+        把本 epoch 记录的损失写回 losses
+
+        Args:
+            reduce: 分布式训练时汇总各 rank 的 reduce(sums, counts) -> (sums, counts)，
+                    所有 rank 得到相同的损失，下一个 epoch 生成相同的全局序列
+        """
+        n = len(self.labels)
+        if self._recorded:
+            losses = torch.cat(self._recorded).cpu().numpy().astype(np.float64)
+            # 最后一个 epoch 可能被提前中断，只取已记录的部分
+            indices = self._epoch_indices[:len(losses)]
+            sums = np.bincount(indices, weights=losses[:len(indices)], minlength=n)
+            counts = np.bincount(indices, minlength=n).astype(np.float64)
+        else:
+            sums = np.zeros(n)
+            counts = np.zeros(n)
+        if reduce is not None:
+            sums, counts = reduce(sums, counts)
+        seen = counts > 0
+        self.losses[seen] = sums[seen] / counts[seen]
+        self._recorded = []
+
+    def state_dict(self):
+        return {'losses': self.losses.copy()}
+
+    def load_state_dict(self, state):
+        """恢复逐样本损失（检查点由 checkpointing.snapshot_training_state 保存）"""
+        losses = np.asarray(state['losses'], dtype=np.float32)
+        if losses.shape != self.losses.shape:
+            raise ValueError(
+                f"Sampler state has {len(losses)} samples but the dataset has {len(self.losses)}"
+            )
+        self.losses[:] = losses
+
+
+def build_sampler(mode, labels, num_classes, power=0.5, mix=0.5, num_samples=None, seed=0,
+                  rank=0, world_size=1):
+    """按 --sampler 参数创建采样器，mode='uniform' 时返回 None（使用默认的打乱）"""
+    if mode == 'uniform':
+        return None
+    kwargs = dict(power=power, num_samples=num_samples, seed=seed, rank=rank, world_size=world_size)
+    if mode == 'balanced':
+        sampler = ClassBalancedSampler(labels, num_classes, **kwargs)
+    elif mode == 'hard':
+        sampler = HardExampleSampler(labels, num_classes, mix=mix, **kwargs)
+    else:
+        raise ValueError(f"Unknown sampler '{mode}', expected one of {SAMPLER_MODES}")
+    share = sampler.expected_class_share()
+    present = sampler.counts > 0
+    logger.info(
+        f"Sampler: {mode} (power {power}), class share per epoch "
+        f"{share[present].min():.1%} ~ {share[present].max():.1%} "
+        f"(dataset {sampler.counts[present].min() / len(labels):.1%} ~ "
+        f"{sampler.counts[present].max() / len(labels):.1%})"
+    )
+    return sampler
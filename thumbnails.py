@@ -0,0 +1,204 @@
+"""上传图片的缩略图生成
+
+衣橱卡片原先直接加载 frontend/static/uploads 中的原图。上传时在后台线程池中生成几种尺寸的
+WebP（Pillow 不支持 WebP 时用 JPEG）缩略图，不占用请求时间：
+
+- 文件名由原图内容哈希和尺寸组成（<sha256 前 16 位>_<尺寸>.webp），内容不变 URL 就不变，
+  可以设置一年的 Cache-Control: immutable；同一张图重复上传不会重复生成
+- 单品只需保存原图的内容哈希，thumbnail_urls() 返回已生成的各尺寸 URL，
+  尚未生成时前端回退到原图
+
+用法:
+    pipeline = get_pipeline()
+    future = pipeline.submit(image_bytes)          # 上传视图中，立即返回
+    item['thumbnails'] = pipeline.thumbnail_urls(item['image_hash'])   # 列表接口中
+
+为已有的上传图片补生成缩略图:
+    python thumbnails.py --images-dir frontend/static/uploads
+"""
+import argparse
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+from prediction_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+# 长边像素：卡片网格、高分屏卡片、详情
+THUMBNAIL_SIZES = (160, 320, 640)
+
+# 内容哈希命名的文件永不改变，可以被浏览器和 CDN 长期缓存
+CACHE_HEADERS = {'Cache-Control': 'public, max-age=31536000, immutable'}
+
+
+def default_format():
+    return 'webp' if features.check('webp') else 'jpeg'
+
+
+def thumbnail_name(image_hash, size, fmt):
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f'{image_hash[:16]}_{size}.{ext}'
+
+
+def make_thumbnails(data, output_dir, sizes=THUMBNAIL_SIZES, fmt=None, quality=80):
+    """
+    生成各尺寸缩略图（已存在的跳过），返回 {尺寸: 文件名}
+
+    JPEG 原图用 draft() 在解码时直接按 1/2、1/4、1/8 缩小，大图解码更快。
+    按 EXIF Orientation 旋转（手机照片的像素通常按传感器方向存储）。
+    文件先写入临时文件再 os.replace，并发生成同一张图也不会读到半个文件。
+    """
+    fmt = fmt or default_format()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    image_hash = content_hash(data)
+
+    names = {size: thumbnail_name(image_hash, size, fmt) for size in sizes}
+    missing = [size for size in sizes if not (output_dir / names[size]).exists()]
+    if not missing:
+        return names
+
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', (max(missing), max(missing)))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    # 从大到小依次缩放，每一级以上一级为输入
+    for size in sorted(missing, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        path = output_dir / names[size]
+        tmp = path.with_name(f'.{path.name}.{threading.get_ident()}.tmp')
+        if fmt == 'webp':
+            image.save(tmp, format='WEBP', quality=quality, method=4)
+        else:
+            image.save(tmp, format='JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, path)
+    return names
+
+
+class ThumbnailPipeline:
+    """
+    后台缩略图生成
+
+    Args:
+        output_dir: 缩略图目录（由静态文件服务或 nginx 提供，并加上 CACHE_HEADERS）
+        url_prefix: 该目录对应的 URL 前缀
+        workers: 线程数（Pillow 缩放和编码时释放 GIL）
+    """
+
+    def __init__(self, output_dir, url_prefix, sizes=THUMBNAIL_SIZES, fmt=None, quality=80, workers=2):
+        self.output_dir = Path(output_dir)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self.sizes = tuple(sizes)
+        self.fmt = fmt or default_format()
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._counts = {'submitted': 0, 'generated': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def _run(self, data):
+        try:
+            if isinstance(data, Path):
+                data = data.read_bytes()
+            names = make_thumbnails(data, self.output_dir, self.sizes, self.fmt, self.quality)
+        except Exception as e:
+            with self._lock:
+                self._counts['failed'] += 1
+            logger.error(f"Thumbnail generation failed: {e}")
+            raise
+        with self._lock:
+            self._counts['generated'] += 1
+        return {size: self.url_prefix + name for size, name in names.items()}
+
+    def submit(self, data):
+        """提交一张原图，返回 Future（结果为 {尺寸: URL}）"""
+        with self._lock:
+            self._counts['submitted'] += 1
+        return self._executor.submit(self._run, data)
+
+    def submit_file(self, path):
+        """提交一个原图文件，在工作线程中读取（批量补生成时不必把所有图片读进内存）"""
+        with self._lock:
+            self._counts['submitted'] += 1
+        return self._executor.submit(self._run, Path(path))
+
+    def thumbnail_urls(self, image_hash):
+        """已生成的各尺寸 URL（键为尺寸字符串，便于 JSON 序列化）；都没有时返回 {}"""
+        if not image_hash:
+            return {}
+        urls = {}
+        for size in self.sizes:
+            name = thumbnail_name(image_hash, size, self.fmt)
+            if (self.output_dir / name).exists():
+                urls[str(size)] = self.url_prefix + name
+        return urls
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    进程内共享的缩略图流水线
+
+    FASHION_THUMBNAIL_DIR / FASHION_THUMBNAIL_URL 指定目录和 URL 前缀，
+    FASHION_THUMBNAIL_WORKERS 指定线程数。
+    """
+    global _default_pipeline
+    if _default_pipeline is None:
+        with _default_lock:
+            if _default_pipeline is None:
+                _default_pipeline = ThumbnailPipeline(
+                    os.environ.get('FASHION_THUMBNAIL_DIR', 'frontend/static/uploads/thumbs'),
+                    os.environ.get('FASHION_THUMBNAIL_URL', '/static/uploads/thumbs/'),
+                    workers=int(os.environ.get('FASHION_THUMBNAIL_WORKERS', 2)),
+                )
+    return _default_pipeline
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Generate thumbnails for existing uploads')
+    parser.add_argument('--images-dir', default='frontend/static/uploads')
+    parser.add_argument('--output-dir', default=None, help='Defaults to <images-dir>/thumbs')
+    parser.add_argument('--sizes', default=','.join(map(str, THUMBNAIL_SIZES)))
+    parser.add_argument('--format', choices=['webp', 'jpeg'], default=None)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    images_dir = Path(args.images_dir)
+    output_dir = Path(args.output_dir) if args.output_dir else images_dir / 'thumbs'
+    sizes = [int(s) for s in args.sizes.split(',')]
+    paths = [p for p in images_dir.rglob('*')
+             if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp') and output_dir not in p.parents]
+
+    pipeline = ThumbnailPipeline(output_dir, '/', sizes, args.format, workers=args.workers)
+    futures = [pipeline.submit_file(p) for p in paths]
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    pipeline.close()
+    stats = pipeline.stats()
+    logger.info(f"✅ {stats['generated']} images → {output_dir} ({stats['failed']} failed)")
+
+
+if __name__ == '__main__':
+    main()
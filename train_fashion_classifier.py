@@ -2,14 +2,25 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import (
+    DataLoader, Dataset, IterableDataset, Subset, get_worker_info
+)
+from torch.utils.data.distributed import DistributedSampler
 from torchvision import transforms
 from PIL import Image
+import io
 import os
+import random
+import time
 from pathlib import Path
 import logging
+import argparse
+import contextlib
 from tqdm import tqdm
 import json
+import numpy as np
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,15 +29,73 @@ logger = logging.getLogger(__name__)
 import sys
 sys.path.append(os.path.dirname(__file__))
 from enhanced_classifier import FashionCNN, GARMENT_CLASSES
+from dataset_cache import load_or_build_cache
+from batch_augment import BatchAugment
+from tta import TTA_MODES, tta_logits
+from instrumentation import metrics, StepProfiler
+from samplers import SAMPLER_MODES, build_sampler
+from checkpointing import (
+    AsyncCheckpointWriter, restore_training_state, snapshot_training_state, to_cpu
+)
+
+
+def is_distributed():
+    """当前是否处于多进程分布式训练中"""
+    return dist.is_available() and dist.is_initialized()
+
+
+def is_main_process():
+    """只有 rank 0 负责日志、保存检查点等副作用"""
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def all_reduce_sum(values, device):
+    """跨进程对一组数值求和；单进程时原样返回"""
+    if not is_distributed():
+        return list(values)
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+def all_reduce_arrays(arrays, device):
+    """跨进程对一组等长 NumPy 数组逐元素求和；单进程时原样返回"""
+    if not is_distributed():
+        return arrays
+    tensor = torch.from_numpy(np.stack(arrays)).to(device=device, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tuple(tensor.cpu().numpy())
+
+
+def setup_distributed(backend='gloo'):
+    """
+    根据 torchrun 设置的环境变量（RANK / WORLD_SIZE / MASTER_ADDR ...）初始化进程组
+
+    Returns:
+        (rank, world_size, local_rank)
+    """
+    dist.init_process_group(backend=backend)
+    return dist.get_rank(), dist.get_world_size(), int(os.environ.get('LOCAL_RANK', 0))
 
 
 class FashionDataset(Dataset):
-    """服装数据集加载器"""
+    """
+    服装数据集加载器
+
+    传入 cache_dir 时启用预解码缓存：图片在首次加载时被解码并缩放到 cache_size，
+    写入内存映射数组；__getitem__ 返回 uint8 (C, H, W) 张量交给 transform，
+    因此 transform 中不应再包含 Resize / ToTensor。
+
+    blank_image 是图片读取失败时返回的占位张量，需与 transform 的输出形状和类型一致。
+    """
     
-    def __init__(self, root_dir, transform=None, class_to_idx=None):
+    def __init__(self, root_dir, transform=None, class_to_idx=None,
+                 cache_dir=None, cache_size=(224, 224), blank_image=None):
         self.root_dir = Path(root_dir)
         self.transform = transform
         self.samples = []
+        self.cache = None
+        self.blank_image = blank_image if blank_image is not None else torch.zeros(3, 224, 224)
         
         # 如果没有提供类别映射，自动生成
         if class_to_idx is None:
@@ -45,6 +114,9 @@ class FashionDataset(Dataset):
                     self.samples.append((str(img_path), self.class_to_idx[class_name]))
         
         logger.info(f"Loaded {len(self.samples)} images from {root_dir}")
+        
+        if cache_dir is not None:
+            self.cache = load_or_build_cache(self.samples, cache_dir, cache_size)
     
     def __len__(self):
         return len(self.samples)
@@ -53,158 +125,724 @@ class FashionDataset(Dataset):
         img_path, label = self.samples[idx]
         
         try:
-            image = Image.open(img_path).convert('RGB')
+            if self.cache is not None:
+                # 零拷贝读取缓存切片: (H, W, 3) -> (3, H, W)
+                image = torch.from_numpy(self.cache[idx]).permute(2, 0, 1)
+            else:
+                with metrics.timer('fashion_dataset_decode_seconds'):
+                    image = Image.open(img_path).convert('RGB')
             if self.transform:
-                image = self.transform(image)
+                with metrics.timer('fashion_dataset_transform_seconds'):
+                    image = self.transform(image)
             return image, label
         except Exception as e:
             logger.error(f"Error loading image {img_path}: {e}")
             # 返回一个黑色图片
-            return torch.zeros(3, 224, 224), label
+            return self.blank_image.clone(), label
 
 
-def train_epoch(model, train_loader, criterion, optimizer, device, use_aux=True):
-    """训练一个 epoch"""
-    model.train()
-    running_loss = 0.0
-    correct = 0
-    total = 0
+class ShardedFashionDataset(IterableDataset):
+    """
+    流式读取 prepare_dataset.py --format shards 生成的 tar 分片
+
+    每个 epoch 先打乱分片顺序，分布式训练时各 rank、多个 DataLoader worker 依次按分片划分；
+    分片内按偏移索引顺序读取，再经过一个固定大小的打乱缓冲区输出。
+    缓冲区保存的是未解码的图片字节，内存占用很小。
+    """
     
-    pbar = tqdm(train_loader, desc='Training')
-    for inputs, labels in pbar:
-        inputs, labels = inputs.to(device), labels.to(device)
+    def __init__(self, root_dir, transform=None, class_to_idx=None,
+                 shuffle=True, shuffle_buffer=1000, seed=42, blank_image=None):
+        self.root_dir = Path(root_dir)
+        self.transform = transform
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        self.blank_image = blank_image if blank_image is not None else torch.zeros(3, 224, 224)
         
-        optimizer.zero_grad()
+        if class_to_idx is None:
+            class_to_idx = {cls: idx for idx, cls in enumerate(GARMENT_CLASSES)}
+        self.class_to_idx = class_to_idx
         
-        # 前向传播
-        if use_aux:
-            outputs, aux_outputs = model(inputs)
-            # 主损失 + 辅助损失
-            loss1 = criterion(outputs, labels)
-            loss2 = criterion(aux_outputs, labels)
-            loss = loss1 + 0.4 * loss2
-        else:
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
+        with open(self.root_dir / 'shards.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.shards = manifest['shards']
+        self.num_samples = manifest['num_samples']
         
-        # 反向传播
-        loss.backward()
-        optimizer.step()
+        # DataLoader worker 中进程组不一定可用，因此在构造时记录 rank
+        self.rank, self.world_size = (
+            (dist.get_rank(), dist.get_world_size()) if is_distributed() else (0, 1)
+        )
         
-        # 统计
-        running_loss += loss.item()
-        _, predicted = outputs.max(1)
-        total += labels.size(0)
-        correct += predicted.eq(labels).sum().item()
+        logger.info(f"Loaded {self.num_samples} images in {len(self.shards)} shards from {root_dir}")
+    
+    def set_epoch(self, epoch):
+        """设置 epoch，用于改变每轮的打乱顺序"""
+        self.epoch = epoch
+    
+    def __len__(self):
+        if self.world_size == 1:
+            return self.num_samples
+        # 分布式时各 rank 的分片随 epoch 变化，按平均值估计
+        return -(-self.num_samples // self.world_size)
+    
+    def _iter_shard(self, shard):
+        with open(self.root_dir / shard['index'], encoding='utf-8') as f:
+            index = json.load(f)['samples']
         
-        # 更新进度条
-        pbar.set_postfix({
-            'loss': f'{running_loss/len(pbar):.3f}',
-            'acc': f'{100.*correct/total:.2f}%'
-        })
+        with open(self.root_dir / shard['shard'], 'rb') as f:
+            for offset, size, class_name in index:
+                f.seek(offset)
+                yield f.read(size), self.class_to_idx[class_name]
+    
+    def _decode(self, data, label):
+        try:
+            with metrics.timer('fashion_dataset_decode_seconds'):
+                image = Image.open(io.BytesIO(data)).convert('RGB')
+            if self.transform:
+                with metrics.timer('fashion_dataset_transform_seconds'):
+                    image = self.transform(image)
+            return image, label
+        except Exception as e:
+            logger.error(f"Error decoding sample from shards in {self.root_dir}: {e}")
+            return self.blank_image.clone(), label
     
-    return running_loss / len(train_loader), 100. * correct / total
+    def __iter__(self):
+        shards = list(self.shards)
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        
+        # 先按 rank、再按 worker 划分分片，保证每个样本每个 epoch 只读取一次
+        shards = shards[self.rank::self.world_size]
+        worker = get_worker_info()
+        worker_id = 0
+        if worker is not None:
+            worker_id = worker.id
+            shards = shards[worker.id::worker.num_workers]
+        
+        samples = (item for shard in shards for item in self._iter_shard(shard))
+        
+        if not self.shuffle:
+            for data, label in samples:
+                yield self._decode(data, label)
+            return
+        
+        rng = random.Random(f"{self.seed}-{self.epoch}-{worker_id}")
+        buffer = []
+        for item in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(item)
+                continue
+            # 缓冲区已满：随机换出一个样本
+            j = rng.randrange(len(buffer))
+            buffer[j], item = item, buffer[j]
+            yield self._decode(*item)
+        
+        rng.shuffle(buffer)
+        for item in buffer:
+            yield self._decode(*item)
 
 
-def validate(model, val_loader, criterion, device):
-    """验证模型"""
-    model.eval()
-    running_loss = 0.0
-    correct = 0
+def default_transforms():
+    """默认的训练 / 验证预处理（PIL 图片输入），返回 (train_transform, val_transform)"""
+    train_transform = transforms.Compose([
+        transforms.Resize((256, 256)),
+        transforms.RandomCrop(224),
+        transforms.RandomHorizontalFlip(),
+        transforms.RandomRotation(15),
+        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+    val_transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+    return train_transform, val_transform
+
+
+def autocast(device, enabled):
+    """混合精度上下文：CUDA 使用 fp16，CPU 使用 bf16"""
+    device_type = torch.device(device).type
+    dtype = torch.float16 if device_type == 'cuda' else torch.bfloat16
+    return torch.autocast(device_type=device_type, dtype=dtype, enabled=enabled)
+
+
+def prepare_inputs(inputs, batch_transform=None, channels_last=False):
+    """对已在设备上的批次执行批量增强，并按需转换为 channels_last 内存布局"""
+    if batch_transform is not None:
+        inputs = batch_transform(inputs)
+    if channels_last:
+        inputs = inputs.contiguous(memory_format=torch.channels_last)
+    return inputs
+
+
+class StepMetricsWriter:
+    """
+    把每个训练 step 的耗时写成 JSONL（每行一个 step）
+
+    data_wait 为阻塞在 DataLoader 上的时间，compute 为其余时间（搬运、前向、反向、更新）。
+    GPU 异步执行时单步 compute 只在稳定后才准确，但 data_wait 占比足以判断
+    训练是受输入限制还是受计算限制。loss / acc 只在同步的 step 上出现。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def train_epoch(model, train_loader, criterion, optimizer, device, use_aux=True,
+                batch_transform=None, amp=False, scaler=None, channels_last=False,
+                log_interval=50, metrics_writer=None, epoch=None, profiler=None,
+                loss_recorder=None):
+    """
+    训练一个 epoch
+
+    batch_transform 不为空时，DataLoader 输出 uint8 批次，
+    在训练设备上由它完成批量增强和归一化。
+    amp=True 时前向和损失在 autocast 下计算；fp16 需要传入 GradScaler 做梯度缩放。
+    损失和正确数在设备上累加，只每 log_interval 个 step 同步一次更新进度条；
+    metrics_writer 不为空时逐 step 写入耗时统计。
+    开启 instrumentation 时分别记录前向、反向和优化器更新的耗时（CUDA 上每段前后同步，
+    会略微降低吞吐量）；profiler 不为空时每个 step 结束调用 profiler.step()。
+    loss_recorder 不为空时（难例采样器）按批次顺序记录主输出的逐样本损失。
+    分布式训练时返回值为所有 rank 汇总后的结果（吞吐量为各 rank 之和）。
+
+    Returns:
+        (平均损失, 准确率, 吞吐量 images/sec)
+    """
+    model.train()
+    running_loss = torch.zeros((), dtype=torch.float64, device=device)
+    correct = torch.zeros((), dtype=torch.int64, device=device)
     total = 0
+    num_batches = 0
+    start = time.perf_counter()
     
-    # 每个类别的准确率
-    class_correct = [0] * len(GARMENT_CLASSES)
-    class_total = [0] * len(GARMENT_CLASSES)
+    # DDP 下用 join 处理各 rank 批次数不一致的情况（如分片数据集）
+    join = model.join() if isinstance(model, DistributedDataParallel) else contextlib.nullcontext()
     
-    with torch.no_grad():
-        pbar = tqdm(val_loader, desc='Validation')
+    # 只有开启 instrumentation 时才同步，否则各阶段耗时只是 kernel 的排队时间
+    sync = torch.cuda.synchronize if device.type == 'cuda' and metrics.enabled else None
+    
+    pbar = tqdm(train_loader, desc='Training', disable=not is_main_process())
+    with join:
+        step_start = time.perf_counter()
         for inputs, labels in pbar:
+            data_ready = time.perf_counter()
             inputs, labels = inputs.to(device), labels.to(device)
+            inputs = prepare_inputs(inputs, batch_transform, channels_last)
+            
+            optimizer.zero_grad()
             
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
+            # 前向传播
+            with metrics.timer('fashion_train_forward_seconds', sync), autocast(device, amp):
+                if use_aux:
+                    outputs, aux_outputs = model(inputs)
+                    # 主损失 + 辅助损失
+                    loss1 = criterion(outputs, labels)
+                    loss2 = criterion(aux_outputs, labels)
+                    loss = loss1 + 0.4 * loss2
+                else:
+                    outputs = model(inputs)
+                    loss = criterion(outputs, labels)
             
-            running_loss += loss.item()
-            _, predicted = outputs.max(1)
+            # 反向传播
+            with metrics.timer('fashion_train_backward_seconds', sync):
+                if scaler is not None:
+                    scaler.scale(loss).backward()
+                else:
+                    loss.backward()
+            with metrics.timer('fashion_train_optimizer_seconds', sync):
+                if scaler is not None:
+                    scaler.step(optimizer)
+                    scaler.update()
+                else:
+                    optimizer.step()
+            
+            if loss_recorder is not None:
+                with torch.no_grad():
+                    loss_recorder.record(nn.functional.cross_entropy(
+                        outputs.detach().float(), labels, reduction='none'
+                    ))
+            
+            # 统计（留在设备上，不触发同步）
+            running_loss += loss.detach().double()
+            correct += outputs.argmax(1).eq(labels).sum()
             total += labels.size(0)
-            correct += predicted.eq(labels).sum().item()
+            num_batches += 1
             
-            # 统计每个类别
-            c = predicted.eq(labels)
-            for i in range(labels.size(0)):
-                label = labels[i].item()
-                class_correct[label] += c[i].item()
-                class_total[label] += 1
+            # 每 log_interval 个 step 同步一次，更新进度条
+            synced = {}
+            if log_interval > 0 and num_batches % log_interval == 0:
+                synced = {
+                    'loss': running_loss.item() / num_batches,
+                    'acc': 100. * correct.item() / total,
+                }
+                pbar.set_postfix({
+                    'loss': f"{synced['loss']:.3f}",
+                    'acc': f"{synced['acc']:.2f}%"
+                })
             
-            pbar.set_postfix({
-                'loss': f'{running_loss/len(pbar):.3f}',
-                'acc': f'{100.*correct/total:.2f}%'
-            })
+            step_end = time.perf_counter()
+            if metrics_writer is not None:
+                step_time = step_end - step_start
+                metrics_writer.write({
+                    'epoch': epoch,
+                    'step': num_batches,
+                    'batch_size': labels.size(0),
+                    'step_time': step_time,
+                    'data_wait': data_ready - step_start,
+                    'compute': step_end - data_ready,
+                    'images_per_sec': labels.size(0) / step_time if step_time > 0 else 0.0,
+                    **synced,
+                })
+            step_start = step_end
+            metrics.inc('fashion_train_images_total', labels.size(0))
+            if profiler is not None:
+                profiler.step()
     
-    # 打印每个类别的准确率
-    logger.info("\nPer-class accuracy:")
-    for i, class_name in enumerate(GARMENT_CLASSES):
-        if class_total[i] > 0:
-            acc = 100. * class_correct[i] / class_total[i]
-            logger.info(f"  {class_name:15s}: {acc:.2f}% ({class_correct[i]}/{class_total[i]})")
+    # 各 rank 汇总（必须在 join 之外，否则与 DDP 的集合通信交错）
+    throughput = total / (time.perf_counter() - start)
+    running_loss, num_batches, correct, total, throughput = all_reduce_sum(
+        [running_loss.item(), num_batches, correct.item(), total, throughput], device
+    )
+    return running_loss / max(num_batches, 1), 100. * correct / max(total, 1), throughput
+
+
+def compute_class_metrics(confusion):
+    """
+    由混淆矩阵计算每类准确率、精确率、召回率和 F1
+
+    Args:
+        confusion: (C, C) 数组，行为真实类别，列为预测类别
+
+    Returns:
+        {类别名: {'support', 'accuracy', 'precision', 'recall', 'f1'}}
+        每类准确率即召回率；没有样本或预测的类别对应指标为 0
+    """
+    confusion = np.asarray(confusion, dtype=np.float64)
+    tp = np.diag(confusion)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = np.where(support > 0, tp / support, 0.0)
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        f1 = np.where(precision + recall > 0,
+                      2 * precision * recall / (precision + recall), 0.0)
+
+    return {
+        name: {
+            'support': int(support[i]),
+            'accuracy': float(recall[i]),
+            'precision': float(precision[i]),
+            'recall': float(recall[i]),
+            'f1': float(f1[i]),
+        }
+        for i, name in enumerate(GARMENT_CLASSES)
+    }
+
+
+def save_confusion_matrix(confusion, epoch, prefix='confusion_matrix'):
+    """
+    把混淆矩阵和每类指标写到 {prefix}.json / {prefix}.npy
+
+    JSON 同时记录最常见的类别混淆，便于调整后处理规则（如 shirt / cardigan）。
+    """
+    confusion = np.asarray(confusion, dtype=np.int64)
+    np.save(f'{prefix}.npy', confusion)
+
+    off_diagonal = confusion.copy()
+    np.fill_diagonal(off_diagonal, 0)
+    order = np.argsort(off_diagonal, axis=None)[::-1][:10]
+    top_confusions = [
+        {
+            'true': GARMENT_CLASSES[i],
+            'predicted': GARMENT_CLASSES[j],
+            'count': int(off_diagonal[i, j]),
+        }
+        for i, j in zip(*np.unravel_index(order, off_diagonal.shape))
+        if off_diagonal[i, j] > 0
+    ]
+
+    with open(f'{prefix}.json', 'w') as f:
+        json.dump({
+            'epoch': epoch,
+            'class_names': GARMENT_CLASSES,
+            'matrix': confusion.tolist(),
+            'per_class': compute_class_metrics(confusion),
+            'top_confusions': top_confusions,
+        }, f, indent=2)
+
+
+def validate(model, val_loader, criterion, device, batch_transform=None,
+             amp=False, channels_last=False, tta='none', tta_margin=None):
+    """
+    验证模型
+
+    损失和混淆矩阵都在设备上累加（bincount 统计 label * C + pred），
+    循环中不做逐样本的 .item() 同步。分布式训练时每个 rank 只验证自己的一部分数据，
+    统计在所有 rank 间求和后再计算。
+    tta 不为 'none' 时预测取 TTA 平均后的 logits（损失仍按原图计算，便于与不开 TTA 时比较）。
+
+    Returns:
+        (平均损失, 准确率 %, 混淆矩阵 (C, C) numpy 数组)
+    """
+    model.eval()
+    num_classes = len(GARMENT_CLASSES)
+    running_loss = torch.zeros((), dtype=torch.float64, device=device)
+    confusion = torch.zeros(num_classes * num_classes, dtype=torch.int64, device=device)
+    num_batches = 0
     
-    return running_loss / len(val_loader), 100. * correct / total
+    with torch.no_grad():
+        pbar = tqdm(val_loader, desc='Validation', disable=not is_main_process())
+        for inputs, labels in pbar:
+            inputs, labels = inputs.to(device), labels.to(device)
+            inputs = prepare_inputs(inputs, batch_transform, channels_last)
+            
+            with autocast(device, amp):
+                outputs = model(inputs)
+                loss = criterion(outputs, labels)
+                if tta != 'none':
+                    outputs, _ = tta_logits(model, inputs, tta, tta_margin, logits=outputs)
+            
+            running_loss += loss.detach().double()
+            predicted = outputs.argmax(1)
+            confusion += torch.bincount(
+                labels * num_classes + predicted, minlength=num_classes * num_classes
+            )
+            num_batches += 1
+    
+    # 循环结束后同步一次，并汇总所有 rank 的统计
+    stats = all_reduce_sum([running_loss.item(), num_batches] + confusion.tolist(), device)
+    running_loss, num_batches = stats[0], stats[1]
+    confusion = np.array(stats[2:], dtype=np.int64).reshape(num_classes, num_classes)
+    correct = int(np.trace(confusion))
+    total = int(confusion.sum())
+    
+    # 打印每个类别的准确率、精确率、召回率和 F1
+    class_metrics = compute_class_metrics(confusion)
+    logger.info("\nPer-class metrics:")
+    for i, (class_name, m) in enumerate(class_metrics.items()):
+        if m['support'] > 0:
+            logger.info(
+                f"  {class_name:15s}: acc {100. * m['accuracy']:.2f}% ({confusion[i, i]}/{m['support']}), "
+                f"P {m['precision']:.3f}, R {m['recall']:.3f}, F1 {m['f1']:.3f}"
+            )
+    
+    return running_loss / max(num_batches, 1), 100. * correct / max(total, 1), confusion
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Train fashion classifier')
+    parser.add_argument(
+        '--data-dir',
+        default='fashion_dataset',
+        help='Dataset root directory'
+    )
+    parser.add_argument(
+        '--data-format',
+        choices=['folders', 'shards'],
+        default='folders',
+        help='Dataset layout: class folders or tar shards from prepare_dataset.py --format shards'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help='Enable pre-decoded memory-mapped image cache in this directory'
+    )
+    parser.add_argument(
+        '--batch-augment',
+        action='store_true',
+        help='Run augmentation as batched tensor ops on the training device'
+    )
+    parser.add_argument(
+        '--amp',
+        action='store_true',
+        help='Mixed precision: fp16 + GradScaler on CUDA, bf16 autocast on CPU'
+    )
+    parser.add_argument(
+        '--channels-last',
+        action='store_true',
+        help='Use channels_last memory format for model and inputs'
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=30,
+        help='Number of training epochs'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=32,
+        help='Batch size per process'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='DataLoader workers per process'
+    )
+    parser.add_argument(
+        '--distributed',
+        action='store_true',
+        help='Data-parallel training across processes launched by torchrun'
+    )
+    parser.add_argument(
+        '--dist-backend',
+        default='gloo',
+        help='torch.distributed backend (gloo works on CPU-only nodes)'
+    )
+    parser.add_argument(
+        '--resume',
+        default=None,
+        help='Resume from a full-state checkpoint (fashion_classifier_epochN.pth)'
+    )
+    parser.add_argument(
+        '--checkpoint-every',
+        type=int,
+        default=1,
+        help='Write a full-state checkpoint every N epochs'
+    )
+    parser.add_argument(
+        '--keep-checkpoints',
+        type=int,
+        default=3,
+        help='Number of rotating epoch checkpoints to keep'
+    )
+    parser.add_argument(
+        '--log-interval',
+        type=int,
+        default=50,
+        help='Sync loss/accuracy to the host every N steps (0 = only at epoch end)'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='Append per-step timing metrics (JSONL) to this file'
+    )
+    parser.add_argument(
+        '--sampler',
+        choices=SAMPLER_MODES,
+        default='uniform',
+        help='Training sampler: uniform shuffle, class-balanced, or hard-example (previous-epoch losses)'
+    )
+    parser.add_argument(
+        '--balance-power',
+        type=float,
+        default=0.5,
+        help='Class sampling probability ~ count ** power (0 = equal per class, 1 = by sample count)'
+    )
+    parser.add_argument(
+        '--hard-mix',
+        type=float,
+        default=0.5,
+        help='Uniform share mixed into hard-example weights (1 = no loss weighting)'
+    )
+    parser.add_argument(
+        '--epoch-samples',
+        type=int,
+        default=None,
+        help='Samples drawn per epoch with --sampler balanced/hard (default: dataset size)'
+    )
+    parser.add_argument(
+        '--instrument',
+        action='store_true',
+        help='Record decode/transform/forward/backward/optimizer/checkpoint timers '
+             '(summary appended to --instrument-file every epoch)'
+    )
+    parser.add_argument(
+        '--instrument-file',
+        default='instrumentation.jsonl',
+        help='JSONL file for --instrument epoch snapshots'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Serve Prometheus metrics on this port during training (implies --instrument)'
+    )
+    parser.add_argument(
+        '--metrics-host',
+        default='127.0.0.1',
+        help='Interface for --metrics-port (use 0.0.0.0 to allow remote scraping)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['torch', 'cprofile'],
+        default=None,
+        help='Capture a torch.profiler trace or cProfile stats for --profile-steps training steps'
+    )
+    parser.add_argument(
+        '--profile-steps',
+        type=int,
+        default=20,
+        help='Number of training steps to profile (after 5 warm-up steps)'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        default='profiles',
+        help='Directory for profiler output'
+    )
+    parser.add_argument(
+        '--tta',
+        choices=TTA_MODES,
+        default='none',
+        help='Test-time augmentation for validation (flip / flip + five crops)'
+    )
+    parser.add_argument(
+        '--tta-margin',
+        type=float,
+        default=None,
+        help='Only apply TTA when the top-1/top-2 probability margin is below this'
+    )
+    parser.add_argument(
+        '--export',
+        action='store_true',
+        help='After training, export TorchScript fp32/int8 models of the best checkpoint to exported/'
+    )
+    args = parser.parse_args()
+    if args.cache_dir and args.data_format == 'shards':
+        parser.error('--cache-dir cannot be combined with --data-format shards')
+    if args.sampler != 'uniform' and args.data_format == 'shards':
+        parser.error('--sampler balanced/hard requires --data-format folders (shards are read sequentially)')
+    return args
 
 
 def main():
     """主训练函数"""
+    args = parse_args()
     
     # 配置
-    DATA_DIR = "fashion_dataset"  # 数据集根目录
-    BATCH_SIZE = 32
-    NUM_EPOCHS = 30
+    DATA_DIR = args.data_dir  # 数据集根目录
+    BATCH_SIZE = args.batch_size
+    NUM_EPOCHS = args.epochs
     LEARNING_RATE = 0.001
     WEIGHT_DECAY = 1e-4
     DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
+    # 分布式: 每个进程一个 rank，rank 0 之外只输出警告
+    rank, world_size = 0, 1
+    if args.distributed:
+        rank, world_size, local_rank = setup_distributed(args.dist_backend)
+        if DEVICE.type == 'cuda':
+            DEVICE = torch.device('cuda', local_rank)
+            torch.cuda.set_device(DEVICE)
+        if not is_main_process():
+            logging.getLogger().setLevel(logging.WARNING)
+            logger.setLevel(logging.WARNING)
+        logger.info(f"Distributed training: world size {world_size}, backend {args.dist_backend}")
+    
     logger.info(f"Using device: {DEVICE}")
     logger.info(f"Number of classes: {len(GARMENT_CLASSES)}")
     
     # 数据增强
-    train_transform = transforms.Compose([
-        transforms.Resize((256, 256)),
-        transforms.RandomCrop(224),
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(15),
-        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-    ])
+    train_transform, val_transform = default_transforms()
     
-    val_transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-    ])
+    # 缓存模式: Resize 已在建缓存时完成，这里只做随机增强（作用于 uint8 张量）
+    if args.cache_dir:
+        train_transform = transforms.Compose([
+            transforms.RandomCrop(224),
+            transforms.RandomHorizontalFlip(),
+            transforms.RandomRotation(15),
+            transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
+            transforms.ConvertImageDtype(torch.float32),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+        val_transform = transforms.Compose([
+            transforms.ConvertImageDtype(torch.float32),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+    
+    # 批量增强模式: worker 只输出 uint8 张量，增强和归一化在训练设备上按批次完成
+    train_batch_transform = None
+    val_batch_transform = None
+    train_blank = val_blank = None
+    if args.batch_augment:
+        if args.cache_dir:
+            train_transform = val_transform = None
+        else:
+            train_transform = transforms.Compose([
+                transforms.Resize((256, 256)),
+                transforms.PILToTensor()
+            ])
+            val_transform = transforms.Compose([
+                transforms.Resize((224, 224)),
+                transforms.PILToTensor()
+            ])
+        train_batch_transform = BatchAugment(crop_size=224).to(DEVICE)
+        val_batch_transform = BatchAugment(augment=False).to(DEVICE)
+        train_blank = torch.zeros(3, 256, 256, dtype=torch.uint8)
+        val_blank = torch.zeros(3, 224, 224, dtype=torch.uint8)
     
     # 加载数据集
-    train_dataset = FashionDataset(
-        os.path.join(DATA_DIR, 'train'),
-        transform=train_transform
-    )
-    val_dataset = FashionDataset(
-        os.path.join(DATA_DIR, 'val'),
-        transform=val_transform
-    )
+    if args.data_format == 'shards':
+        train_dataset = ShardedFashionDataset(
+            os.path.join(DATA_DIR, 'train'),
+            transform=train_transform,
+            shuffle=True,
+            blank_image=train_blank
+        )
+        val_dataset = ShardedFashionDataset(
+            os.path.join(DATA_DIR, 'val'),
+            transform=val_transform,
+            shuffle=False,
+            blank_image=val_blank
+        )
+    else:
+        train_dataset = FashionDataset(
+            os.path.join(DATA_DIR, 'train'),
+            transform=train_transform,
+            cache_dir=os.path.join(args.cache_dir, 'train') if args.cache_dir else None,
+            cache_size=(256, 256),
+            blank_image=train_blank
+        )
+        val_dataset = FashionDataset(
+            os.path.join(DATA_DIR, 'val'),
+            transform=val_transform,
+            cache_dir=os.path.join(args.cache_dir, 'val') if args.cache_dir else None,
+            cache_size=(224, 224),
+            blank_image=val_blank
+        )
+    
+    # 分布式: 验证集按 rank 等距切分，不补齐重复样本，以保证汇总后的每类准确率准确
+    # （分片数据集已在内部按 rank 划分）
+    if args.distributed and args.data_format != 'shards':
+        val_dataset = Subset(val_dataset, range(rank, len(val_dataset), world_size))
+    
+    # 训练集: 类别均衡 / 难例采样器按 rank 切分同一个全局序列；均匀采样时分布式用 DistributedSampler
+    train_sampler = None
+    if args.data_format != 'shards':
+        train_sampler = build_sampler(
+            args.sampler, [label for _, label in train_dataset.samples], len(GARMENT_CLASSES),
+            power=args.balance_power, mix=args.hard_mix, num_samples=args.epoch_samples,
+            rank=rank, world_size=world_size
+        )
+        if train_sampler is None and args.distributed:
+            train_sampler = DistributedSampler(train_dataset, shuffle=True)
     
     train_loader = DataLoader(
         train_dataset,
         batch_size=BATCH_SIZE,
-        shuffle=True,
-        num_workers=4,
+        # 分片数据集自行完成打乱
+        shuffle=train_sampler is None and args.data_format != 'shards',
+        sampler=train_sampler,
+        num_workers=args.workers,
         pin_memory=True
     )
     val_loader = DataLoader(
         val_dataset,
         batch_size=BATCH_SIZE,
         shuffle=False,
-        num_workers=4,
+        num_workers=args.workers,
         pin_memory=True
     )
     
@@ -214,29 +852,92 @@ def main():
     # 创建模型
     model = FashionCNN(num_classes=len(GARMENT_CLASSES))
     model = model.to(DEVICE)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    # raw_model 用于验证和保存；验证不经过 DDP，避免各 rank 批次数不同时集合通信挂起
+    raw_model = model
+    if args.distributed:
+        model = DistributedDataParallel(
+            model, device_ids=[DEVICE.index] if DEVICE.type == 'cuda' else None
+        )
+    
+    # bf16 动态范围与 fp32 相同，只有 CUDA fp16 需要梯度缩放
+    scaler = torch.amp.GradScaler('cuda') if args.amp and DEVICE.type == 'cuda' else None
     
     # 损失函数和优化器
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE, weight_decay=WEIGHT_DECAY)
     scheduler = optim.lr_scheduler.ReduceLROnPlateau(
-        optimizer, mode='max', factor=0.5, patience=3, verbose=True
+        optimizer, mode='max', factor=0.5, patience=3
     )
     
     # 训练循环
+    start_epoch = 0
     best_acc = 0.0
-    history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': []}
+    history = {
+        'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': [],
+        'train_throughput': []
+    }
+    
+    # 断点续训：恢复模型、优化器、调度器、缩放器、难例采样器、历史和随机数状态（所有 rank 读同一个文件）
+    if args.resume:
+        start_epoch, best_acc, saved_history = restore_training_state(
+            args.resume, raw_model, optimizer, scheduler, scaler, sampler=train_sampler
+        )
+        if saved_history is not None:
+            history = saved_history
+    
+    # 检查点在后台线程写盘，只有 rank 0 负责
+    writer = AsyncCheckpointWriter(keep=args.keep_checkpoints) if is_main_process() else None
+    
+    # 逐 step 耗时统计，只有 rank 0 写
+    metrics_writer = (
+        StepMetricsWriter(args.metrics_file) if args.metrics_file and is_main_process() else None
+    )
+    
+    # 热路径计时（数据集读取 / 预处理的计时只在 --workers 0 时汇总到主进程）
+    if (args.instrument or args.metrics_port) and is_main_process():
+        metrics.enable()
+        if args.workers > 0:
+            logger.info("Dataset decode/transform timers are only collected with --workers 0")
+        if args.metrics_port:
+            metrics.serve(args.metrics_port, host=args.metrics_host)
+    profiler = (
+        StepProfiler(args.profile, steps=args.profile_steps, output_dir=args.profile_dir)
+        if args.profile and is_main_process() else None
+    )
     
-    for epoch in range(NUM_EPOCHS):
+    val_confusion = None
+    for epoch in range(start_epoch, NUM_EPOCHS):
         logger.info(f"\nEpoch {epoch+1}/{NUM_EPOCHS}")
         logger.info("-" * 50)
         
+        if hasattr(train_dataset, 'set_epoch'):
+            train_dataset.set_epoch(epoch)
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        
         # 训练
-        train_loss, train_acc = train_epoch(
-            model, train_loader, criterion, optimizer, DEVICE, use_aux=True
+        train_loss, train_acc, train_throughput = train_epoch(
+            model, train_loader, criterion, optimizer, DEVICE, use_aux=True,
+            batch_transform=train_batch_transform,
+            amp=args.amp, scaler=scaler, channels_last=args.channels_last,
+            log_interval=args.log_interval, metrics_writer=metrics_writer, epoch=epoch + 1,
+            profiler=profiler if profiler is not None and not profiler.done else None,
+            loss_recorder=train_sampler if hasattr(train_sampler, 'record') else None
         )
+        if hasattr(train_sampler, 'end_epoch'):
+            # 各 rank 汇总逐样本损失，下一个 epoch 所有 rank 按相同的权重生成序列
+            train_sampler.end_epoch(reduce=lambda *arrays: all_reduce_arrays(arrays, DEVICE))
+        if profiler is not None and profiler.done:
+            profiler = None
         
         # 验证
-        val_loss, val_acc = validate(model, val_loader, criterion, DEVICE)
+        val_loss, val_acc, val_confusion = validate(
+            raw_model, val_loader, criterion, DEVICE, batch_transform=val_batch_transform,
+            amp=args.amp, channels_last=args.channels_last,
+            tta=args.tta, tta_margin=args.tta_margin
+        )
         
         # 更新学习率
         scheduler.step(val_acc)
@@ -246,37 +947,78 @@ def main():
         history['train_acc'].append(train_acc)
         history['val_loss'].append(val_loss)
         history['val_acc'].append(val_acc)
+        history['train_throughput'].append(train_throughput)
         
-        logger.info(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+        logger.info(
+            f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%, "
+            f"Throughput: {train_throughput:.1f} images/sec"
+        )
         logger.info(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+        if metrics.enabled:
+            metrics.write_jsonl(
+                args.instrument_file, epoch=epoch + 1,
+                train_throughput=train_throughput, val_acc=val_acc
+            )
         
-        # 保存最佳模型
+        # 保存最佳模型（val_acc 已在各 rank 间汇总，所有 rank 判断一致，只有 rank 0 写盘）
         if val_acc > best_acc:
             best_acc = val_acc
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'val_acc': val_acc,
-                'class_names': GARMENT_CLASSES
-            }, 'fashion_classifier_best.pth')
+            if is_main_process():
+                # 与 fashion_classifier_best.pth 对应的混淆矩阵
+                save_confusion_matrix(val_confusion, epoch)
+            if writer is not None:
+                writer.save(to_cpu({
+                    'epoch': epoch,
+                    'model_state_dict': raw_model.state_dict(),
+                    'optimizer_state_dict': optimizer.state_dict(),
+                    'val_acc': val_acc,
+                    'class_names': GARMENT_CLASSES
+                }), 'fashion_classifier_best.pth')
             logger.info(f"✅ Best model saved! Accuracy: {best_acc:.2f}%")
         
-        # 定期保存检查点
-        if (epoch + 1) % 5 == 0:
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'val_acc': val_acc,
-            }, f'fashion_classifier_epoch{epoch+1}.pth')
-    
-    # 保存最终模型
-    torch.save(model, 'fashion_classifier_final.pth')
-    
-    # 保存训练历史
-    with open('training_history.json', 'w') as f:
-        json.dump(history, f, indent=2)
+        # 定期保存完整状态检查点（可用 --resume 续训），只保留最近几个
+        if (epoch + 1) % args.checkpoint_every == 0 and writer is not None:
+            writer.save(
+                snapshot_training_state(
+                    raw_model, optimizer, scheduler, epoch, best_acc, history,
+                    scaler=scaler, sampler=train_sampler, val_acc=val_acc, class_names=GARMENT_CLASSES
+                ),
+                f'fashion_classifier_epoch{epoch+1}.pth',
+                rotate_pattern='fashion_classifier_epoch*.pth'
+            )
+    
+    if writer is not None:
+        writer.close()
+    if metrics_writer is not None:
+        metrics_writer.close()
+    if metrics.enabled:
+        # 包含最后一次检查点写入的耗时
+        metrics.write_jsonl(args.instrument_file, epoch='final')
+    
+    if is_main_process():
+        # 保存最终模型
+        torch.save(raw_model, 'fashion_classifier_final.pth')
+        
+        # 保存训练历史
+        with open('training_history.json', 'w') as f:
+            json.dump(history, f, indent=2)
+        
+        # 最后一个 epoch 的混淆矩阵（最佳模型对应的是 confusion_matrix.json）
+        if val_confusion is not None:
+            save_confusion_matrix(val_confusion, NUM_EPOCHS - 1, prefix='confusion_matrix_final')
+        
+        # 训练 step 数不足 wait + profile_steps 时写出已记录的部分（放在最终模型保存之后，
+        # 剖析失败不会丢失训练结果）
+        if profiler is not None:
+            profiler.stop()
+        
+        # 导出部署用的推理模型（折叠 BN、去辅助头、int8 量化）
+        if args.export and os.path.exists('fashion_classifier_best.pth'):
+            from export_classifier import export_all
+            export_all('fashion_classifier_best.pth', 'exported', data_dir=args.data_dir)
+    
+    if args.distributed:
+        dist.destroy_process_group()
     
     logger.info(f"\n训练完成!")
     logger.info(f"最佳验证准确率: {best_acc:.2f}%")
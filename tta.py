@@ -0,0 +1,175 @@
+"""测试时增强（TTA）
+
+把每张图片的翻转 / 多裁剪视图放进同一个批次做一次前向传播，再对 logits 取平均。
+衬衫 / 开衫这类易混淆样本的错误，TTA 往往比后处理规则（top-5 置信度差、纵横比、文件名）
+更便宜地纠正。设置 margin 后只对 top-1 与 top-2 概率差小于 margin 的样本做 TTA，
+大多数置信度高的图片不增加开销。
+
+在验证集上对比准确率和延迟:
+    python tta.py --checkpoint fashion_classifier_best.pth --data-dir fashion_dataset
+"""
+import argparse
+import json
+import logging
+import time
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+TTA_MODES = ('none', 'flip', 'flip_crop')
+
+# 多裁剪：四角 + 中心，边长为输入的 87.5%（224 → 196），再缩放回输入尺寸
+CROP_RATIO = 0.875
+
+
+def make_views(images, mode='flip'):
+    """
+    生成 TTA 视图（不含原图），按视图拼接成 (N * V, C, H, W)
+
+    Args:
+        images: 已归一化的批次 (N, C, H, W)
+        mode: 'flip' 只有水平翻转；'flip_crop' 另加五个裁剪及其翻转
+    """
+    views = [images.flip(-1)]
+    if mode == 'flip_crop':
+        h, w = images.shape[-2:]
+        ch, cw = int(h * CROP_RATIO), int(w * CROP_RATIO)
+        offsets = [(0, 0), (0, w - cw), (h - ch, 0), (h - ch, w - cw), ((h - ch) // 2, (w - cw) // 2)]
+        for y, x in offsets:
+            crop = images[..., y:y + ch, x:x + cw]
+            crop = F.interpolate(crop, size=(h, w), mode='bilinear', align_corners=False)
+            views.extend([crop, crop.flip(-1)])
+    return torch.cat(views)
+
+
+def top2_margin(logits):
+    """top-1 与 top-2 的 softmax 概率差"""
+    top2 = torch.softmax(logits.float(), dim=1).topk(2, dim=1).values
+    return top2[:, 0] - top2[:, 1]
+
+
+def tta_logits(model, images, mode='flip', margin=None, logits=None):
+    """
+    TTA 推理，返回平均后的 logits（与 model(images) 形状相同）
+
+    Args:
+        model: eval 模式的模型
+        images: 已归一化的批次
+        mode: TTA_MODES 之一，'none' 时直接前向
+        margin: 不为 None 时只对 top-1/top-2 概率差小于 margin 的样本做 TTA
+        logits: 已算好的原图 logits（可省去一次前向）
+
+    Returns:
+        (logits, 做了 TTA 的样本数)
+    """
+    if logits is None:
+        logits = model(images)
+    if mode == 'none':
+        return logits, 0
+
+    if margin is None:
+        selected = None
+        subset = images
+    else:
+        selected = (top2_margin(logits) < margin).nonzero(as_tuple=True)[0]
+        if selected.numel() == 0:
+            return logits, 0
+        subset = images[selected]
+
+    n = subset.size(0)
+    views = make_views(subset, mode)
+    view_logits = model(views).view(-1, n, logits.size(1))
+    base = logits if selected is None else logits[selected]
+    averaged = (base.float() + view_logits.float().sum(0)) / (view_logits.size(0) + 1)
+
+    if selected is None:
+        return averaged.to(logits.dtype), n
+    logits = logits.clone()
+    logits[selected] = averaged.to(logits.dtype)
+    return logits, n
+
+
+def evaluate_tta(model, loader, device, mode='none', margin=None):
+    """
+    在数据集上评估某种 TTA 设置
+
+    Returns:
+        {'accuracy', 'ms_per_image', 'tta_fraction'}
+    """
+    correct = total = augmented = 0
+    elapsed = 0.0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            logits, n = tta_logits(model, inputs, mode, margin)
+            predicted = logits.argmax(1)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            elapsed += time.perf_counter() - start
+            correct += predicted.eq(labels).sum().item()
+            total += labels.size(0)
+            augmented += n
+    return {
+        'accuracy': 100. * correct / max(total, 1),
+        'ms_per_image': 1000 * elapsed / max(total, 1),
+        'tta_fraction': augmented / max(total, 1),
+    }
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Report TTA accuracy vs latency on the val split')
+    parser.add_argument('--checkpoint', default='fashion_classifier_best.pth')
+    parser.add_argument('--data-dir', default='fashion_dataset')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--margins', default='0.1,0.2,0.3',
+                        help='Comma-separated top-1/top-2 margin thresholds to evaluate')
+    parser.add_argument('--output', default='tta_report.json')
+    return parser.parse_args()
+
+
+def main():
+    from pathlib import Path
+    from torch.utils.data import DataLoader
+
+    from inference_server import DEFAULT_TRANSFORM, load_classifier
+    from train_fashion_classifier import FashionDataset
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    model, class_names = load_classifier(args.checkpoint, device)
+    dataset = FashionDataset(
+        Path(args.data_dir) / 'val', transform=DEFAULT_TRANSFORM,
+        class_to_idx={name: i for i, name in enumerate(class_names)}
+    )
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=4)
+
+    settings = [('none', None)]
+    for mode in TTA_MODES[1:]:
+        settings.append((mode, None))
+        settings.extend((mode, float(m)) for m in args.margins.split(','))
+
+    results = []
+    for mode, margin in settings:
+        result = evaluate_tta(model, loader, device, mode, margin)
+        result.update(mode=mode, margin=margin)
+        results.append(result)
+        logger.info(
+            f"  {mode:10s} margin={str(margin):5s}: acc {result['accuracy']:.2f}%, "
+            f"{result['ms_per_image']:.2f} ms/image, TTA on {100 * result['tta_fraction']:.1f}%"
+        )
+
+    with open(args.output, 'w') as f:
+        json.dump({'checkpoint': args.checkpoint, 'results': results}, f, indent=2)
+    logger.info(f"✅ TTA report saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""异步上传处理流水线
+
+POST /api/wardrobe/upload 原先在请求内完成保存、分类和颜色分析，慢的模型推理会一直占着 web worker。
+异步模式下请求只把文件写入磁盘并登记任务，立即返回任务 ID；本进程内的线程池按阶段处理：
+
+    decode → classify → colors → thumbnails
+
+- 任务状态保存在内存或 SQLite 中（不需要 Redis 等外部 broker），进程重启后未完成的任务会重新排队
+- 一次请求可以上传多张图片（批量导入整个衣橱），按批次 ID 查询整体进度
+- 颜色分析、缩略图是可选阶段，失败时记录在 warnings 中，不影响单品入库
+
+用法（视图中）:
+    jobs = get_job_queue()
+    files = request.FILES.getlist('images') or request.FILES.getlist('image')
+    batch = jobs.submit_batch(request.user.id, [(f.name, f.read()) for f in files])
+    return success(batch, status=202)          # {'batch_id', 'jobs': [{'id', 'filename'}]}
+
+    jobs.get(job_id)                           # GET /api/wardrobe/jobs/<job_id>
+    jobs.batch_status(batch_id)                # GET /api/wardrobe/batches/<batch_id>
+
+任务完成后 on_complete(job, result) 回调负责创建 WardrobeItem，返回单品 id 或含 'id' 的序列化字典。
+进程在回调执行期间退出时，重启后该任务标记为失败而不是重新执行，避免重复创建单品（回调可用 job['id'] 自行去重）。
+分类结果带有向量时（FASHION_CLASSIFIER_EMBEDDINGS=1），回调返回后以单品 id 加入相似单品索引。
+"""
+import io
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# 所有处理阶段完成、正在执行 on_complete 回调
+COMPLETING = 'on_complete'
+
+
+def decode_stage(context):
+    """解码并校验图片（损坏的文件在这里失败）"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(context['data']))
+    image.load()
+    context['image'] = image.convert('RGB')
+    context['result']['size'] = list(image.size)
+
+
+def classify_stage(context):
+    """按 FASHION_CLASSIFIER_CHAIN 配置的后端链分类"""
+    from classifier_backends import get_chain
+    from outfit_scoring import CATEGORY_TO_GROUP
+
+    result = get_chain().classify(context['image'], filename=context['filename'])
+    if result is None:
+        raise RuntimeError('No classifier backend produced a result')
+    context['result']['classification'] = {
+        'category': result['category'],
+        'category_group': CATEGORY_TO_GROUP.get(result['category'], 'others'),
+        'confidence': result['confidence'],
+        'backend': result['backend'],
+    }
+    if result.get('embedding') is not None:
+        # 单品入库后按其 id 加入向量索引（见 UploadJobQueue._index_embedding）
+        context['result']['embedding'] = result['embedding']
+
+
+def colors_stage(context):
+    """SegFormer 主色分析（按内容哈希缓存）"""
+    from color_analysis import get_analyzer
+
+    analysis = get_analyzer().analyze([context['data']])[0]
+    context['result']['main_color_hex'] = analysis['garment']['main_color_hex']
+    context['result']['palette'] = analysis['garment']['palette']
+
+
+def thumbnails_stage(context):
+    from prediction_cache import content_hash
+    from thumbnails import get_pipeline
+
+    context['result']['image_hash'] = content_hash(context['data'])
+    context['result']['thumbnails'] = {
+        str(size): url for size, url in get_pipeline().submit(context['data']).result().items()
+    }
+
+
+# (阶段名, 函数, 是否必需)
+DEFAULT_STAGES = [
+    ('decode', decode_stage, True),
+    ('classify', classify_stage, True),
+    ('colors', colors_stage, False),
+    ('thumbnails', thumbnails_stage, False),
+]
+
+
+class UploadJobQueue:
+    """
+    上传任务队列与工作线程
+
+    Args:
+        upload_dir: 上传文件的保存目录（任务只记录路径，不把图片放进数据库）
+        db_path: SQLite 文件路径，为 None 时任务状态只保存在内存
+        workers: 工作线程数（分类、颜色分析的前向传播会释放 GIL）
+        stages: 处理阶段，默认 DEFAULT_STAGES
+        on_complete: 任务成功后的回调 on_complete(job, result)，返回值写入 job['item']
+        max_finished: 内存中保留的已结束任务数；使用 SQLite 时已结束的任务只保存在数据库中
+    """
+
+    def __init__(self, upload_dir, db_path=None, workers=2, stages=None, on_complete=None,
+                 max_finished=10000):
+        self.upload_dir = Path(upload_dir)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.stages = list(stages or DEFAULT_STAGES)
+        self.on_complete = on_complete
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.max_finished = 0 if db_path else max_finished
+        self._finished = deque()
+        self._finished_counts = {DONE: 0, FAILED: 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS upload_jobs ('
+                'id TEXT PRIMARY KEY, batch_id TEXT NOT NULL, payload TEXT NOT NULL, '
+                'status TEXT NOT NULL, updated REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS upload_jobs_batch ON upload_jobs (batch_id)')
+            self._db.commit()
+            self._recover()
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f'upload-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _recover(self):
+        """重新排队上次进程退出时未完成的任务（on_complete 执行中断的任务标记为失败）"""
+        rows = self._db.execute(
+            'SELECT payload FROM upload_jobs WHERE status IN (?, ?) ORDER BY updated',
+            (QUEUED, RUNNING)
+        ).fetchall()
+        requeued = 0
+        for (payload,) in rows:
+            job = json.loads(payload)
+            if job['stage'] == COMPLETING:
+                # 回调可能已经创建了单品，重新执行会重复创建
+                job.update(status=FAILED, stage=None,
+                           error='Interrupted during on_complete; the item may already exist')
+                self._save(job)
+                continue
+            job.update(status=QUEUED, stage=None, completed_stages=[], warnings=[])
+            self._jobs[job['id']] = job
+            self._queue.put(job['id'])
+            requeued += 1
+        if requeued:
+            logger.info(f"Re-queued {requeued} unfinished upload jobs")
+        if len(rows) > requeued:
+            logger.warning(f"{len(rows) - requeued} upload jobs were interrupted during on_complete")
+
+    def _save(self, job):
+        job['updated'] = time.time()
+        with self._lock:
+            self._jobs[job['id']] = job
+            if job['status'] in (DONE, FAILED):
+                self._finished_counts[job['status']] += 1
+                self._finished.append(job['id'])
+                while len(self._finished) > self.max_finished:
+                    self._jobs.pop(self._finished.popleft(), None)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO upload_jobs (id, batch_id, payload, status, updated) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (job['id'], job['batch_id'], json.dumps(job, ensure_ascii=False),
+                     job['status'], job['updated'])
+                )
+                self._db.commit()
+
+    def submit_batch(self, user_id, files):
+        """
+        登记一批上传
+
+        Args:
+            files: [(文件名, 图片字节), ...]
+
+        Returns:
+            {'batch_id', 'jobs': [{'id', 'filename'}]}
+        """
+        batch_id = uuid.uuid4().hex
+        jobs = []
+        for filename, data in files:
+            job_id = uuid.uuid4().hex
+            suffix = Path(filename or '').suffix.lower() or '.jpg'
+            path = self.upload_dir / f'{job_id}{suffix}'
+            path.write_bytes(data)
+            job = {
+                'id': job_id,
+                'batch_id': batch_id,
+                'user_id': user_id,
+                'filename': filename,
+                'path': str(path),
+                'status': QUEUED,
+                'stage': None,
+                'completed_stages': [],
+                'stages': [name for name, _, _ in self.stages],
+                'warnings': [],
+                'result': None,
+                'item': None,
+                'error': None,
+                'created': time.time(),
+            }
+            self._save(job)
+            jobs.append({'id': job_id, 'filename': filename})
+        for job in jobs:
+            self._queue.put(job['id'])
+        return {'batch_id': batch_id, 'jobs': jobs}
+
+    def submit(self, user_id, filename, data):
+        """登记单张上传，返回任务 ID"""
+        return self.submit_batch(user_id, [(filename, data)])['jobs'][0]['id']
+
+    def _process(self, job):
+        context = {'data': Path(job['path']).read_bytes(), 'filename': job['filename'], 'result': {}}
+        for name, stage, required in self.stages:
+            job['stage'] = name
+            self._save(job)
+            start = time.perf_counter()
+            try:
+                stage(context)
+            except Exception as e:
+                if required:
+                    raise
+                logger.warning(f"Upload job {job['id']}: optional stage '{name}' failed: {e}")
+                job['warnings'].append(f'{name}: {e}')
+            elapsed = time.perf_counter() - start
+            context['result'].setdefault('timings_ms', {})[name] = elapsed * 1000
+            metrics.observe('fashion_upload_stage_seconds', elapsed, stage=name)
+            job['completed_stages'].append(name)
+        return context['result']
+
+    def _index_embedding(self, job, embedding):
+        """把分类时得到的向量以新单品的 id 加入相似单品索引；失败只记录警告（单品已创建）"""
+        item = job['item']
+        item_id = item.get('id') if isinstance(item, dict) else item
+        if item_id is None:
+            logger.warning(f"Upload job {job['id']}: on_complete returned no item id; embedding not indexed")
+            return
+        try:
+            from embedding_index import add_item_embedding
+            add_item_embedding(item_id, embedding)
+        except Exception as e:
+            logger.warning(f"Upload job {job['id']}: could not index embedding for item {item_id}: {e}")
+            job['warnings'].append(f'embedding: {e}')
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                if job_id is None:
+                    return
+                with self._lock:
+                    job = dict(self._jobs[job_id])
+                job['status'] = RUNNING
+                try:
+                    result = self._process(job)
+                    # 向量只交给回调和索引，不随任务状态保存 / 返回
+                    embedding = result.pop('embedding', None)
+                    job['result'] = result
+                    if self.on_complete is not None:
+                        # 先记录再回调：回调期间进程退出时 _recover 不会重新执行该任务
+                        job['stage'] = COMPLETING
+                        self._save(job)
+                        job['item'] = self.on_complete(
+                            job, result if embedding is None else dict(result, embedding=embedding)
+                        )
+                        if embedding is not None:
+                            self._index_embedding(job, embedding)
+                    job['status'] = DONE
+                    metrics.inc('fashion_upload_jobs_total', status=DONE)
+                except Exception as e:
+                    logger.error(f"Upload job {job_id} failed at stage '{job['stage']}': {e}")
+                    job['status'] = FAILED
+                    job['error'] = f"{job['stage']}: {e}"
+                    metrics.inc('fashion_upload_jobs_total', status=FAILED)
+                job['stage'] = None
+                self._save(job)
+            finally:
+                self._queue.task_done()
+
+    def get(self, job_id):
+        """任务状态（含 progress，0~1），不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None and self._db is not None:
+                row = self._db.execute('SELECT payload FROM upload_jobs WHERE id = ?', (job_id,)).fetchone()
+                job = json.loads(row[0]) if row else None
+        if job is None:
+            return None
+        job = dict(job)
+        if job['status'] in (DONE, FAILED):
+            job['progress'] = 1.0
+        else:
+            job['progress'] = len(job['completed_stages']) / max(len(job['stages']), 1)
+        job.pop('path', None)
+        return job
+
+    def batch_status(self, batch_id):
+        """批次的整体进度：各状态任务数、总进度和每个任务的状态"""
+        with self._lock:
+            if self._db is not None:
+                # 数据库中有批次的全部任务（重启后内存中只有重新排队的部分），状态由 get() 优先取内存
+                ids = [row[0] for row in self._db.execute(
+                    'SELECT id FROM upload_jobs WHERE batch_id = ?', (batch_id,)
+                )]
+            else:
+                ids = [j['id'] for j in self._jobs.values() if j['batch_id'] == batch_id]
+        if not ids:
+            return None
+        jobs = sorted((self.get(i) for i in ids), key=lambda j: j['created'])
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for job in jobs:
+            counts[job['status']] += 1
+        return {
+            'batch_id': batch_id,
+            'total': len(jobs),
+            'counts': counts,
+            'progress': sum(j['progress'] for j in jobs) / len(jobs),
+            'finished': counts[QUEUED] + counts[RUNNING] == 0,
+            'jobs': jobs,
+        }
+
+    def wait(self):
+        """等待队列中的任务全部处理完"""
+        self._queue.join()
+
+    def stats(self):
+        """排队 / 处理中的任务数，以及本进程累计完成 / 失败的任务数"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, **self._finished_counts}
+            for job in self._jobs.values():
+                if job['status'] in (QUEUED, RUNNING):
+                    counts[job['status']] += 1
+        counts['queue_depth'] = self._queue.qsize()
+        return counts
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_job_queue(on_complete=None):
+    """
+    进程内共享的上传任务队列
+
+    FASHION_UPLOAD_DIR 指定上传目录，FASHION_UPLOAD_JOB_DB 指定 SQLite 文件，
+    FASHION_UPLOAD_WORKERS 指定工作线程数。on_complete 只在第一次调用时生效。
+    """
+    global _default_queue
+    if _default_queue is None:
+        with _default_lock:
+            if _default_queue is None:
+                _default_queue = UploadJobQueue(
+                    os.environ.get('FASHION_UPLOAD_DIR', 'frontend/static/uploads'),
+                    db_path=os.environ.get('FASHION_UPLOAD_JOB_DB') or None,
+                    workers=int(os.environ.get('FASHION_UPLOAD_WORKERS', 2)),
+                    on_complete=on_complete,
+                )
+    return _default_queue
@@ -0,0 +1,166 @@
+"""GET /api/wardrobe 的分页与字段投影
+
+衣橱很大时一次返回全部单品，JSON 体积和前端渲染都随衣橱线性增长。这里提供：
+
+- 游标分页：按 id 降序（最新上传在前），游标是上一页最后一个 id 的不透明编码，
+  新增 / 删除单品不会造成翻页时重复或遗漏（偏移量分页会）
+- fields= 投影：只返回前端需要的字段，如卡片列表不需要 palette 明细
+- 第一页附带整个衣橱的统计（件数、分类数、颜色数），前端不必拿到全部单品再统计
+
+用法（视图中）:
+    from wardrobe_listing import list_wardrobe
+    try:
+        data = list_wardrobe(WardrobeItem.objects.filter(user=request.user), request.GET, serialize)
+    except ValueError as e:
+        return error(str(e), status=400)
+    return success(data)
+
+GET /api/wardrobe?limit=24&cursor=<next_cursor>&fields=id,name,category,thumbnails&group=tops
+"""
+import base64
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# 可投影的字段（与 UPLOAD_FEATURE.md 中单品的返回格式一致）
+ALLOWED_FIELDS = (
+    'id', 'name', 'category', 'category_group', 'brand', 'season', 'main_color_hex',
+    'colors', 'palette', 'image_url', 'thumbnails', 'created_at',
+)
+
+
+def encode_cursor(last_id):
+    payload = json.dumps({'id': last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """游标 → 上一页最后一个 id；格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))['id']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # 格式正确但 id 不是整数（bool 也是 int 的子类）时同样视为非法，否则比较时抛出 TypeError
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return last_id
+
+
+def parse_fields(param):
+    """fields 参数 → 字段元组；为空时返回 None（不投影），包含未知字段时抛出 ValueError"""
+    if not param:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in param.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in ALLOWED_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(ALLOWED_FIELDS)}")
+    # 前端用 id 作为删除等操作的键，始终返回
+    return fields if 'id' in fields else ('id',) + fields
+
+
+def parse_limit(param):
+    if param in (None, ''):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(param)
+    except ValueError as e:
+        raise ValueError(f"Invalid limit: {param}") from e
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {f: item[f] for f in fields if f in item}
+
+
+def paginate(source, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    游标分页
+
+    Args:
+        source: Django QuerySet（有 filter 方法）或单品字典列表
+        cursor: 上一页返回的 next_cursor
+
+    Returns:
+        (本页单品, next_cursor 或 None)
+    """
+    last_id = decode_cursor(cursor) if cursor else None
+    if hasattr(source, 'filter'):
+        queryset = source.order_by('-id')
+        if last_id is not None:
+            queryset = queryset.filter(id__lt=last_id)
+        # 多取一条判断是否还有下一页
+        page = list(queryset[:limit + 1])
+        get_id = lambda obj: obj.id  # noqa: E731
+    else:
+        page = sorted(
+            (it for it in source if last_id is None or it['id'] < last_id),
+            key=lambda it: it['id'], reverse=True
+        )[:limit + 1]
+        get_id = lambda it: it['id']  # noqa: E731
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_cursor = encode_cursor(get_id(page[-1])) if has_more and page else None
+    return page, next_cursor
+
+
+def wardrobe_stats(items):
+    """件数、分类数、颜色数（与 wardrobe.js 的 updateStats 口径一致）"""
+    categories, colors = set(), set()
+    total = 0
+    for item in items:
+        total += 1
+        categories.add(item.get('category_group') or item.get('category'))
+        colors.update(item.get('colors') or [])
+    return {'total': total, 'categories': len(categories), 'colors': len(colors)}
+
+
+def list_wardrobe(source, params, serialize=None):
+    """
+    衣橱列表接口的完整处理
+
+    Args:
+        source: 当前用户的单品（QuerySet 或字典列表）
+        params: 查询参数（request.GET 或字典）：limit / cursor / fields / group
+        serialize: 把 QuerySet 中的对象转换成字典的函数；source 为字典列表时可省略
+
+    Returns:
+        {'items', 'next_cursor', 'has_more', 'stats'(仅第一页)}
+
+    Raises:
+        ValueError: 参数不合法（视图返回 400）
+    """
+    limit = parse_limit(params.get('limit'))
+    fields = parse_fields(params.get('fields'))
+    cursor = params.get('cursor') or None
+    group = params.get('group')
+    serialize = serialize or (lambda item: item)
+
+    filtered = source
+    if group and group != 'all':
+        if hasattr(source, 'filter'):
+            filtered = source.filter(category_group=group)
+        else:
+            filtered = [it for it in source if it.get('category_group') == group]
+
+    page, next_cursor = paginate(filtered, cursor, limit)
+    data = {
+        'items': [project(serialize(obj), fields) for obj in page],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }
+    if cursor is None:
+        # 统计针对整个衣橱（不受分类筛选影响），只在第一页计算
+        if hasattr(source, 'values'):
+            everything = source.values('category', 'category_group', 'colors').iterator()
+        else:
+            everything = source
+        data['stats'] = wardrobe_stats(everything)
+    return data